@@ -0,0 +1,289 @@
+import os
+import re
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Usage: python adapters.py fit --user USER_ID --data DIR [--model cnn_motion_model.keras] [--reg 10]
+#        python adapters.py remove --user USER_ID
+# Example: python adapters.py fit --user 3f6c...e2 --data data/users/3f6c...e2
+#
+# Per-user personalization of the shared CNN. Only the last layer (the softmax Dense head, classes x 129
+# weights) is fine-tuned per user; everything below it is the shared backbone, identical for all users.
+# A user's adapter is that head refitted on the user's labeled windows: softmax regression on the backbone
+# embeddings (L-BFGS), class-balanced, with an L2 pull towards the global head that fades as the user adds
+# windows, so classes the user never labeled keep the global behaviour. Adapters are stored as one small
+# .npz per user in ADAPTER_DIR, tagged with a fingerprint of the backbone weights they were fitted on, so an
+# adapter left over from a retrained model is ignored instead of misapplied.
+# app.py keeps recently used adapters in an AdapterCache (LRU, bounded by ADAPTER_CACHE_MB of weights) and
+# serves an authenticated user's request as backbone forward pass + that user's head, a matrix-vector
+# product on top of the cost of the shared model.
+# Adapters are fitted here from a folder of labeled 1-second window CSVs (--data DIR/<class>/*.csv, the
+# data/train layout), or by app.py (POST /adapters) from labeled windows the user sends.
+
+ADAPTER_DIR = 'data/adapters'
+MODEL_PATH = 'cnn_motion_model.keras'
+CACHE_BUDGET_MB = 64
+REGULARIZATION = 10.0  # strength of the pull towards the global head, in windows' worth of evidence
+MIN_WINDOWS = 10
+HOLDOUT = 0.2
+SEED = 42
+USER_ID_PATTERN = re.compile(r'[A-Za-z0-9_-]{1,128}')
+
+def softmax(z):
+    e = np.exp(z - z.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+def adapter_path(user_id, directory=ADAPTER_DIR):
+    # Supabase user ids are UUIDs; anything that is not a plain file name is refused
+    if not USER_ID_PATTERN.fullmatch(str(user_id)):
+        raise ValueError(f'Invalid user id {user_id!r}')
+    return os.path.join(directory, f'{user_id}.npz')
+
+class SharedBackbone:
+    # A trained build_cnn_model CNN split into the shared part (input -> embedding that feeds the last
+    # Dense layer) and the global head (kernel, bias) that users without an adapter are served with
+    def __init__(self, model):
+        from tensorflow.keras import Model
+        from tensorflow.keras.layers import Dense
+        head = model.layers[-1]
+        if not isinstance(head, Dense) or head.get_config()['activation'] != 'softmax':
+            raise ValueError(f'The last layer of {model.name} is not a softmax Dense head')
+        self.model = Model(model.inputs[0], head.input)
+        self.kernel, self.bias = head.get_weights()
+        self.input_shape = model.input_shape
+        digest = hashlib.sha256()
+        for w in self.model.get_weights():
+            digest.update(np.ascontiguousarray(w).tobytes())
+        self.fingerprint = digest.hexdigest()[:16]
+
+    def embed(self, x, batch_size=256):
+        # (N, T, 6) gravity-filtered windows -> (N, embedding) float32; a direct call for request-sized
+        # batches, which skips the per-call setup of model.predict
+        x = np.asarray(x, dtype=np.float32)
+        if len(x) <= batch_size:
+            return np.asarray(self.model(x, training=False))
+        return self.model.predict(x, batch_size=batch_size, verbose=0)
+
+class PersonalModel:
+    # The shared backbone with one user's head; has the predict()/input_shape interface of a Keras model,
+    # so inference.predict_window serves it in place of the global CNN
+    def __init__(self, backbone, kernel, bias):
+        self.backbone = backbone
+        self.kernel = kernel
+        self.bias = bias
+        self.input_shape = backbone.input_shape
+
+    def predict(self, x, batch_size=256, verbose=0):
+        return softmax(self.backbone.embed(x, batch_size) @ self.kernel + self.bias)
+
+    def __call__(self, x, training=False):
+        return self.predict(x)
+
+    def nbytes(self):
+        return self.kernel.nbytes + self.bias.nbytes
+
+def fit_head(E, y, kernel, bias, reg=REGULARIZATION):
+    # Class-balanced softmax regression on embeddings E, started from and pulled towards (kernel, bias)
+    from scipy.optimize import minimize
+    E, y = np.asarray(E, dtype=np.float64), np.asarray(y)
+    n, (dim, n_classes) = len(E), kernel.shape
+    counts = np.bincount(y, minlength=n_classes)
+    weights = n / (np.count_nonzero(counts) * counts[y])
+    onehot = np.eye(n_classes)[y]
+    prior = np.concatenate([kernel.ravel(), bias]).astype(np.float64)
+
+    def objective(params):
+        W, b = params[:dim * n_classes].reshape(dim, n_classes), params[dim * n_classes:]
+        p = softmax(E @ W + b)
+        delta = params - prior
+        loss = -np.sum(weights * np.log(p[np.arange(n), y] + 1e-12)) / n + 0.5 * reg / n * delta @ delta
+        g = weights[:, None] * (p - onehot) / n
+        grad = np.concatenate([(E.T @ g).ravel(), g.sum(axis=0)]) + reg / n * delta
+        return loss, grad
+
+    params = minimize(objective, prior, jac=True, method='L-BFGS-B', options={'maxiter': 500}).x
+    return (params[:dim * n_classes].reshape(dim, n_classes).astype(np.float32),
+            params[dim * n_classes:].astype(np.float32))
+
+def head_accuracy(E, y, kernel, bias):
+    return float(np.mean(np.argmax(E @ kernel + bias, axis=1) == y))
+
+def fit_adapter(backbone, X, y, classes, reg=REGULARIZATION, holdout=HOLDOUT, seed=SEED):
+    # X: (N, T, 6) gravity-filtered windows of one user, y: class indices. The head is first fitted without a
+    # holdout part to compare it with the global head on windows it has not seen, then refitted on all of them.
+    # Returns (adapter, report); the adapter is what save_adapter() writes
+    y = np.asarray(y, dtype=np.int64)
+    if len(y) < MIN_WINDOWS:
+        raise ValueError(f'At least {MIN_WINDOWS} labeled windows are needed, got {len(y)}')
+    if len(classes) != backbone.kernel.shape[1]:
+        raise ValueError(f'The model has {backbone.kernel.shape[1]} classes, got labels for {len(classes)}')
+    E = backbone.embed(X)
+    order = np.random.default_rng(seed).permutation(len(y))
+    n_holdout = int(len(y) * holdout)
+    report = {'windows': int(len(y)), 'holdout_windows': n_holdout,
+              'windows_per_class': {c: int(n) for c, n in zip(classes, np.bincount(y, minlength=len(classes)))}}
+    if n_holdout:
+        held, fit = order[:n_holdout], order[n_holdout:]
+        kernel, bias = fit_head(E[fit], y[fit], backbone.kernel, backbone.bias, reg)
+        report['global_accuracy'] = head_accuracy(E[held], y[held], backbone.kernel, backbone.bias)
+        report['adapter_accuracy'] = head_accuracy(E[held], y[held], kernel, bias)
+    start = time.perf_counter()
+    kernel, bias = fit_head(E, y, backbone.kernel, backbone.bias, reg)
+    report['fit_s'] = time.perf_counter() - start
+    meta = {'classes': list(classes), 'fingerprint': backbone.fingerprint, 'reg': reg, 'created': time.time(),
+            **{k: v for k, v in report.items() if k != 'fit_s'}}
+    return {'kernel': kernel, 'bias': bias, 'meta': meta}, report
+
+def save_adapter(adapter, path):
+    # Written to a temporary file and renamed, so a server reading it never sees half a file
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f'{path}.tmp{os.getpid()}_{threading.get_ident()}'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, kernel=adapter['kernel'], bias=adapter['bias'], meta=np.array(json.dumps(adapter['meta'])))
+    os.replace(tmp_path, path)
+    return path
+
+def load_adapter(path):
+    with np.load(path) as data:
+        return {'kernel': data['kernel'], 'bias': data['bias'], 'meta': json.loads(str(data['meta']))}
+
+class AdapterCache:
+    # Per-user PersonalModels for app.py, loaded from directory on first use and kept in LRU order.
+    # Only adapter weights count against budget_bytes (the backbone is shared); the least recently used
+    # adapters are dropped once they exceed it and reloaded from disk when their user comes back.
+    def __init__(self, backbone, classes, directory=ADAPTER_DIR, budget_bytes=CACHE_BUDGET_MB * 2 ** 20):
+        self.backbone = backbone
+        self.classes = list(classes)
+        self.directory = directory
+        self.budget_bytes = budget_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = self.misses = self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        # The user's PersonalModel, or None when the user has no usable adapter
+        with self.lock:
+            model = self.entries.get(user_id)
+            if model is not None:
+                self.entries.move_to_end(user_id)
+                self.hits += 1
+                return model
+            self.misses += 1
+        path = adapter_path(user_id, self.directory)
+        if not os.path.exists(path):
+            return None
+        adapter = load_adapter(path)
+        meta = adapter['meta']
+        if meta['fingerprint'] != self.backbone.fingerprint or meta['classes'] != self.classes:
+            print(f'Adapter {path} was fitted on another model; serving user {user_id} the global model')
+            return None
+        return self._insert(user_id, PersonalModel(self.backbone, adapter['kernel'], adapter['bias']))
+
+    def put(self, user_id, adapter):
+        # Save a freshly fitted adapter and serve it from now on
+        save_adapter(adapter, adapter_path(user_id, self.directory))
+        return self._insert(user_id, PersonalModel(self.backbone, adapter['kernel'], adapter['bias']))
+
+    def remove(self, user_id):
+        path = adapter_path(user_id, self.directory)
+        with self.lock:
+            model = self.entries.pop(user_id, None)
+            if model is not None:
+                self.nbytes -= model.nbytes()
+        if os.path.exists(path):
+            os.remove(path)
+            return True
+        return False
+
+    def _insert(self, user_id, model):
+        with self.lock:
+            old = self.entries.pop(user_id, None)
+            if old is not None:
+                self.nbytes -= old.nbytes()
+            self.entries[user_id] = model
+            self.nbytes += model.nbytes()
+            while self.nbytes > self.budget_bytes and len(self.entries) > 1:
+                _, evicted = self.entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes()
+                self.evictions += 1
+        return model
+
+    def stats(self):
+        with self.lock:
+            return {'adapters': len(self.entries), 'bytes': self.nbytes, 'budget_bytes': self.budget_bytes,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+def labeled_windows(root, classes, backbone, alpha):
+    # The backbone's inputs for the windows in root/<class>/*.csv, prepared as it is served them
+    # (inference.model_inputs: resampled to its rate, gravity-filtered with the alpha of its preprocessing.json),
+    # like a /predict window or a POST /adapters window; a user folder may hold only some of the classes
+    from inference import model_inputs
+    from tensor_cache import csv_window_arrays
+    present = [c for c in classes if os.path.isdir(os.path.join(root, c))]
+    if not present:
+        raise ValueError(f'{root} has no folder for any of {", ".join(classes)}')
+    X, y = csv_window_arrays(root, present, alpha=None)
+    return model_inputs(backbone, X, alpha), np.array([classes.index(present[i]) for i in y], dtype=np.int64)
+
+def request_cost_us(model, personal, window, repeats=200):
+    # Median microseconds per single-window call: the global CNN, and backbone + the user's head
+    x = window[None]
+    calls = {'global': lambda: model(x, training=False), 'personal': lambda: personal.predict(x)}
+    times = {name: [] for name in calls}
+    for name, call in calls.items():
+        call()
+    for _ in range(repeats):
+        for name, call in calls.items():
+            start = time.perf_counter()
+            call()
+            times[name].append(time.perf_counter() - start)
+    return {name: float(np.median(t) * 1e6) for name, t in times.items()}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fit or remove per-user last-layer adapters of the CNN.')
+    parser.add_argument('command', choices=['fit', 'remove'])
+    parser.add_argument('--user', required=True, help='User id (the Supabase auth user id)')
+    parser.add_argument('--data', help='Folder of the user\'s labeled windows, DIR/<class>/*.csv')
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--reg', type=float, default=REGULARIZATION, help='Pull towards the global head')
+    parser.add_argument('--holdout', type=float, default=HOLDOUT, help='Share of windows held out for the report')
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--adapter-dir', default=ADAPTER_DIR)
+    args = parser.parse_args(argv)
+
+    path = adapter_path(args.user, args.adapter_dir)
+    if args.command == 'remove':
+        if os.path.exists(path):
+            os.remove(path)
+            print(f'Removed {path}')
+        else:
+            print(f'No adapter for {args.user}')
+        return 0
+    if not args.data:
+        parser.error('fit needs --data')
+    from inference import load_classes, load_inference_model, load_preprocessing
+    classes = load_classes()
+    cnn = load_inference_model(args.model)
+    backbone = SharedBackbone(cnn)
+    X, y = labeled_windows(args.data, classes, backbone, load_preprocessing()['alpha'])
+    adapter, report = fit_adapter(backbone, X, y, classes, args.reg, args.holdout, args.seed)
+    save_adapter(adapter, path)
+    print(f"{report['windows']} windows " + ', '.join(f'{c}: {n}' for c, n in report['windows_per_class'].items()))
+    if report['holdout_windows']:
+        print(f"Held-out accuracy on {report['holdout_windows']} windows: global head "
+              f"{report['global_accuracy']*100:.2f}%, adapter {report['adapter_accuracy']*100:.2f}%")
+    model = PersonalModel(backbone, adapter['kernel'], adapter['bias'])
+    cost = request_cost_us(cnn, model, X[0])
+    print(f"Fitted in {report['fit_s']*1000:.0f} ms; {model.nbytes()} bytes of weights saved as {path}")
+    print(f"Per window: global CNN {cost['global']:.0f} us, backbone + user head {cost['personal']:.0f} us")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
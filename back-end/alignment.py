@@ -0,0 +1,195 @@
+import os
+import sys
+import time
+import threading
+import argparse
+from collections import OrderedDict
+import numpy as np
+from preprocessing import GravityFilter
+
+# Usage: python alignment.py <acc.csv> <gyro.csv> <out.csv> [--rate 100] [--time-unit s|ms]
+#        (input CSVs: timestamp,x,y,z with or without a header row)
+#
+# Accelerometer and gyroscope callbacks do not tick in lockstep, so pairing samples by buffer index
+# (as motion.tsx does) mixes readings taken at different times. Here both streams keep their
+# timestamps and are linearly interpolated onto one uniform grid (100 Hz by default), which is
+# what the model was trained on. Stretches where either stream has a gap longer than MAX_GAP are
+# dropped rather than interpolated across.
+# align_streams() handles a whole recording; StreamAligner does the same incrementally for a live
+# session, carrying just enough of each stream between calls to interpolate the next grid points.
+
+RATE = 100
+MAX_GAP = 0.25  # seconds
+TIME_SCALE = {'s': 1.0, 'ms': 1e-3}
+
+def parse_stream(samples, time_unit='s'):
+    # [{'x':..,'y':..,'z':..,'timestamp':..}, ...] or [[t, x, y, z], ...] -> (times in s, (N, 3) values),
+    # sorted by time with repeated timestamps dropped
+    if time_unit not in TIME_SCALE:
+        raise ValueError(f"time_unit must be one of {', '.join(TIME_SCALE)}")
+    if len(samples) and isinstance(samples[0], dict):
+        arr = np.array([[s['timestamp'], s['x'], s['y'], s['z']] for s in samples], dtype=np.float64)
+    else:
+        arr = np.asarray(samples, dtype=np.float64)
+    if arr.size == 0:
+        return np.zeros(0), np.zeros((0, 3))
+    if arr.ndim != 2 or arr.shape[1] != 4:
+        raise ValueError(f'Each sample needs a timestamp and x, y, z; got shape {arr.shape}')
+    if not np.isfinite(arr).all():
+        raise ValueError('Samples contain non-finite values')
+    arr = arr[np.argsort(arr[:, 0], kind='stable')]
+    keep = np.concatenate([[True], np.diff(arr[:, 0]) > 0])
+    arr = arr[keep]
+    return arr[:, 0] * TIME_SCALE[time_unit], arr[:, 1:]
+
+def _interp(grid, t, v):
+    return np.stack([np.interp(grid, t, v[:, c]) for c in range(v.shape[1])], axis=1)
+
+def _covered(grid, t, max_gap):
+    # True where the stream has samples on both sides of a grid point no more than max_gap apart
+    right = np.clip(np.searchsorted(t, grid, side='left'), 1, len(t) - 1)
+    return (t[right] - t[right - 1] <= max_gap) | (t[right] == grid) | (t[right - 1] == grid)
+
+def align_on_grid(grid, acc_t, acc_v, gyro_t, gyro_v, max_gap=MAX_GAP):
+    # (len(grid), 6) aligned samples and a mask of grid points not inside a gap of either stream
+    samples = np.concatenate([_interp(grid, acc_t, acc_v), _interp(grid, gyro_t, gyro_v)], axis=1)
+    valid = _covered(grid, acc_t, max_gap) & _covered(grid, gyro_t, max_gap)
+    return samples.astype(np.float32), valid
+
+def align_streams(acc, gyro, rate=RATE, time_unit='s', max_gap=MAX_GAP):
+    # Whole recording: both streams resampled onto the grid covering the time both were running.
+    # Returns (grid times in s, (M, 6) float32 samples); gap stretches are removed.
+    acc_t, acc_v = parse_stream(acc, time_unit)
+    gyro_t, gyro_v = parse_stream(gyro, time_unit)
+    if len(acc_t) < 2 or len(gyro_t) < 2:
+        raise ValueError('Both streams need at least two samples')
+    start, end = max(acc_t[0], gyro_t[0]), min(acc_t[-1], gyro_t[-1])
+    if end <= start:
+        raise ValueError('The accelerometer and gyroscope streams do not overlap in time')
+    grid = start + np.arange(int(np.floor((end - start) * rate)) + 1) / rate
+    samples, valid = align_on_grid(grid, acc_t, acc_v, gyro_t, gyro_v, max_gap)
+    return grid[valid], samples[valid]
+
+class StreamAligner:
+    # Incremental alignment for one live session; push() returns newly aligned samples and
+    # pop_windows() cuts model windows from them with the usual hop.
+    # With gravity_alpha set, aligned samples also pass through a per-session preprocessing.GravityFilter,
+    # so the gravity estimate carries over from hop to hop instead of restarting in every window; the raw
+    # samples are kept next to them for models that filter every window on their own.
+    # Callers sharing one aligner between threads hold its lock across push() and pop_windows().
+    def __init__(self, rate=RATE, time_unit='s', max_gap=MAX_GAP, gravity_alpha=None):
+        self.rate = rate
+        self.time_unit = time_unit
+        self.max_gap = max_gap
+        self.gravity = GravityFilter(gravity_alpha) if gravity_alpha is not None else None
+        self.acc = (np.zeros(0), np.zeros((0, 3)))
+        self.gyro = (np.zeros(0), np.zeros((0, 3)))
+        self.next_t = None
+        self.pending = np.zeros((0, 6), dtype=np.float32)
+        self.pending_filtered = np.zeros((0, 6), dtype=np.float32) if self.gravity is not None else None
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _append(buf, t, v):
+        # Samples older than what is already buffered arrived too late to be used
+        if len(buf[0]):
+            newer = t > buf[0][-1]
+            t, v = t[newer], v[newer]
+        return np.concatenate([buf[0], t]), np.concatenate([buf[1], v])
+
+    def push(self, acc=(), gyro=()):
+        self.last_used = time.monotonic()
+        self.acc = self._append(self.acc, *parse_stream(acc, self.time_unit))
+        self.gyro = self._append(self.gyro, *parse_stream(gyro, self.time_unit))
+        (acc_t, acc_v), (gyro_t, gyro_v) = self.acc, self.gyro
+        if len(acc_t) < 2 or len(gyro_t) < 2:
+            return np.zeros((0, 6), dtype=np.float32)
+        if self.next_t is None:
+            self.next_t = max(acc_t[0], gyro_t[0])
+        end = min(acc_t[-1], gyro_t[-1])
+        count = int(np.floor((end - self.next_t) * self.rate)) + 1 if end >= self.next_t else 0
+        grid = self.next_t + np.arange(count) / self.rate
+        samples, valid = align_on_grid(grid, acc_t, acc_v, gyro_t, gyro_v, self.max_gap)
+        if count:
+            self.next_t = grid[-1] + 1.0 / self.rate
+        if not valid.all():
+            # Windows must be contiguous in time: drop everything up to the last gap
+            last_gap = np.flatnonzero(~valid)[-1]
+            self.pending = self.pending[:0]
+            samples, valid = samples[last_gap + 1:], valid[last_gap + 1:]
+            if self.gravity is not None:
+                self.gravity.reset()
+                self.pending_filtered = self.pending_filtered[:0]
+        self.pending = np.concatenate([self.pending, samples])
+        if self.gravity is not None:
+            samples = self.gravity(samples)
+            self.pending_filtered = np.concatenate([self.pending_filtered, samples])
+        # Keep only the samples still needed to interpolate the next grid points
+        if self.next_t is not None:
+            self.acc = tuple(a[max(np.searchsorted(acc_t, self.next_t) - 1, 0):] for a in self.acc)
+            self.gyro = tuple(a[max(np.searchsorted(gyro_t, self.next_t) - 1, 0):] for a in self.gyro)
+        return samples
+
+    def pop_windows(self, window_size, step):
+        # [(raw window, gravity-filtered window or None without gravity_alpha), ...]
+        windows = []
+        while len(self.pending) >= window_size:
+            filtered = self.pending_filtered[:window_size].copy() if self.gravity is not None else None
+            windows.append((self.pending[:window_size].copy(), filtered))
+            self.pending = self.pending[step:]
+            if self.gravity is not None:
+                self.pending_filtered = self.pending_filtered[step:]
+        return windows
+
+class AlignerSessions:
+    # Thread-safe session key (app.py: (user_id, session_id)) -> StreamAligner map with LRU eviction and an idle timeout
+    def __init__(self, max_sessions=1000, idle_timeout=300.0, **aligner_settings):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.aligner_settings = aligner_settings
+        self.sessions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, session_id, time_unit='s'):
+        # time_unit only applies when this call starts the session; a session keeps the unit it started with
+        if time_unit not in TIME_SCALE:
+            raise ValueError(f"time_unit must be one of {', '.join(TIME_SCALE)}")
+        with self.lock:
+            now = time.monotonic()
+            for sid in [s for s, a in self.sessions.items() if now - a.last_used > self.idle_timeout]:
+                del self.sessions[sid]
+            aligner = self.sessions.pop(session_id, None) or StreamAligner(time_unit=time_unit, **self.aligner_settings)
+            self.sessions[session_id] = aligner
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+            return aligner
+
+    def close(self, session_id):
+        with self.lock:
+            return self.sessions.pop(session_id, None) is not None
+
+def read_stream_csv(path):
+    from ingest import parse_recording
+    # float64: timestamps in seconds since boot need more precision than float32 offers
+    samples, bad_rows, _ = parse_recording(path, columns=4, dtype=np.float64)
+    if bad_rows:
+        print(f'{path}: skipped {len(bad_rows)} bad row(s)')
+    return samples
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Align separately timestamped accelerometer and gyroscope CSVs.')
+    parser.add_argument('acc')
+    parser.add_argument('gyro')
+    parser.add_argument('output')
+    parser.add_argument('--rate', type=int, default=RATE)
+    parser.add_argument('--time-unit', choices=list(TIME_SCALE), default='s')
+    args = parser.parse_args(argv)
+    grid, samples = align_streams(read_stream_csv(args.acc), read_stream_csv(args.gyro), args.rate, args.time_unit)
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    np.savetxt(args.output, samples, delimiter=',', header='AccX,AccY,AccZ,GyroX,GyroY,GyroZ', comments='', fmt='%.9g')
+    print(f'{len(samples)} aligned samples at {args.rate} Hz ({grid[-1] - grid[0]:.2f}s) saved to {args.output}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
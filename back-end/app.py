@@ -1,3 +1,8 @@
+from thread_config import apply_thread_config
+
+# Size the CPU thread pools for this host before numpy/TensorFlow start them (see tune_threads.py)
+apply_thread_config()
+
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import numpy as np
@@ -5,9 +10,15 @@ import os
 import json
 import hashlib
 import time
-from tensorflow.keras.models import load_model
+import threading
+from collections import OrderedDict
 from supabase import create_client
 from dotenv import load_dotenv
+from inference import (WINDOW_SIZE, N_CHANNELS, EngineSelector, load_classes, load_inference_model,
+                       load_preprocessing, model_input, predict_window, stream_alpha)
+from alignment import AlignerSessions, align_streams
+from preprocessing import remove_gravity_recording
+from adapters import ADAPTER_DIR, AdapterCache, SharedBackbone, fit_adapter
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}}, supports_credentials=True)
@@ -19,19 +30,85 @@ SUPABASE_KEY = os.getenv('SUPABASE_KEY')
 supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 MODEL_PATH = 'cnn_motion_model.keras'
+FEATURE_MODEL_PATH = 'feature_model.joblib'
+# Concurrent CNN predictions before further requests go to the feature classifier
+CNN_MAX_BUSY = int(os.getenv('CNN_MAX_BUSY', '4'))
+# Memory for cached per-user adapters (adapters.py); the least recently used ones are dropped beyond it
+ADAPTER_CACHE_MB = float(os.getenv('ADAPTER_CACHE_MB', '64'))
+# Labeled windows one POST /adapters may send; the fit runs inside the request
+MAX_ADAPTER_WINDOWS = 2000
+# Access tokens are checked with Supabase once per TOKEN_TTL_S, not on every request
+TOKEN_TTL_S = 300
+MAX_TOKENS = 10000
 TRAIN_DATA_DIR = 'data/train'
-WINDOW_SIZE = 100
-N_CHANNELS = 6
+UPLOAD_DIR = 'data/uploads'
+STREAM_STEP = WINDOW_SIZE // 2
 
 # Supabase already provides auth.users table by default
 # We'll use the Supabase auth API for signup and login
 print("Using Supabase's built-in authentication system")
 
 # Always load class labels from class_labels.json for consistent mapping
-with open('class_labels.json', 'r') as f:
-    CLASSES = json.load(f)
+CLASSES = load_classes()
+
+model = load_inference_model(MODEL_PATH)
+
+# Engines a request can pick with {"engine": ...}: the CNN, and the handcrafted-feature classifier
+# (feature_model.py) when it has been trained, which also takes requests while the CNN is overloaded
+engines = {'cnn': model}
+if os.path.exists(FEATURE_MODEL_PATH):
+    feature_model = load_inference_model(FEATURE_MODEL_PATH)
+    if feature_model.classes == CLASSES:
+        engines['features'] = feature_model
+    else:
+        print(f'{FEATURE_MODEL_PATH} was trained on other classes than class_labels.json; not serving it')
+engine_selector = EngineSelector(engines, default='cnn', fallback='features', max_busy=CNN_MAX_BUSY)
 
-model = load_model(MODEL_PATH)
+# Per-user heads on top of the shared CNN backbone, for requests with an "Authorization: Bearer <token>" header
+adapter_cache = AdapterCache(SharedBackbone(model), CLASSES, ADAPTER_DIR, int(ADAPTER_CACHE_MB * 2 ** 20))
+user_tokens = OrderedDict()  # access token -> (user id, checked until)
+user_tokens_lock = threading.Lock()
+
+# Gravity filtering the model was trained with: per window (the filter restarts in every window), or per
+# recording, which for live sessions means one GravityFilter per session carried across hops
+PREPROCESSING = load_preprocessing()
+GRAVITY_ALPHA = PREPROCESSING['alpha']
+STREAM_FILTERED = PREPROCESSING['gravity'] == 'recording'
+
+# Live sessions for /stream: timestamped acc/gyro samples are aligned onto the 100 Hz grid server-side
+aligner_sessions = AlignerSessions(gravity_alpha=stream_alpha(PREPROCESSING) if STREAM_FILTERED else None)
+
+def authenticated_user():
+    # Supabase user id of the request's bearer token, or None for anonymous requests and invalid tokens.
+    # Only definitive answers are cached: a user, or a token Supabase rejected
+    header = request.headers.get('Authorization', '')
+    if not header.startswith('Bearer '):
+        return None
+    token = header[len('Bearer '):].strip()
+    now = time.time()
+    with user_tokens_lock:
+        cached = user_tokens.get(token)
+        if cached and cached[1] > now:
+            return cached[0]
+    try:
+        response = supabase.auth.get_user(token)
+    except Exception as e:
+        print(f'Token check failed: {e}')
+        if getattr(e, 'status', None) not in (401, 403):
+            # A network error or Supabase outage says nothing about the token: not cached, checked again next time
+            return None
+        response = None
+    user_id = response.user.id if response and response.user else None
+    with user_tokens_lock:
+        user_tokens[token] = (user_id, now + TOKEN_TTL_S)
+        user_tokens.move_to_end(token)
+        while len(user_tokens) > MAX_TOKENS:
+            user_tokens.popitem(last=False)
+    return user_id
+
+def personal_model(user_id, engine):
+    # The user's adapter on the shared CNN backbone, when the CNN serves the request and the user has one
+    return adapter_cache.get(user_id) if user_id and engine == 'cnn' else None
 
 @app.route('/predict', methods=['POST'])
 def predict():
@@ -40,23 +117,144 @@ def predict():
         data = request.get_json(force=True, silent=True)
     except Exception as e:
         return jsonify({'error': 'Invalid JSON', 'details': str(e)}), 400
-    if not data or 'window' not in data:
+    if not data or ('window' not in data and not ('acc' in data and 'gyro' in data)):
         return jsonify({'error': 'Missing window data'}), 400
-    window = data['window']
     try:
-        arr = np.array(window)
-        if arr.shape != (WINDOW_SIZE, N_CHANNELS):
-            return jsonify({'error': f'Input shape must be (100, 6), got {arr.shape}'}), 400
-        arr = arr.reshape(1, WINDOW_SIZE, N_CHANNELS)
-        pred = model.predict(arr)
-        pred_class = int(np.argmax(pred))
-        pred_label = CLASSES[pred_class]
-        confidence = float(np.max(pred))
-        print('Prediction:', pred_label)
-        print('Confidence:', confidence)
-        return jsonify({'prediction': pred_label, 'confidence': confidence, 'probabilities': pred[0].tolist()})
+        filtered = None
+        if 'window' in data:
+            window = data['window']
+        else:
+            # Timestamped streams instead of an index-paired window: align, then use the latest second
+            _, samples = align_streams(data['acc'], data['gyro'], time_unit=data.get('time_unit', 's'))
+            if len(samples) < WINDOW_SIZE:
+                return jsonify({'error': f'Need {WINDOW_SIZE} aligned samples, got {len(samples)}'}), 400
+            if STREAM_FILTERED:
+                # The whole stream settles the gravity estimate before the window starts
+                filtered = remove_gravity_recording(samples, stream_alpha(PREPROCESSING))[-WINDOW_SIZE:]
+            window = samples[-WINDOW_SIZE:]
+        user_id = authenticated_user()
+        with engine_selector.select(data.get('engine')) as (engine, engine_model):
+            personal = personal_model(user_id, engine)
+            result = predict_window(personal or engine_model, CLASSES, window, GRAVITY_ALPHA, filtered)
+        result.update({'engine': engine, 'personalized': personal is not None})
+        print('Prediction:', result['prediction'])
+        print('Confidence:', result['confidence'])
+        return jsonify(result)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/stream', methods=['POST'])
+def stream():
+    # {session_id, acc: [[t, x, y, z], ...] or [{x, y, z, timestamp}, ...], gyro: same, time_unit?: 's'|'ms', close?: bool,
+    #  engine?: 'cnn'|'features'}
+    # Returns a prediction for every full window (50% overlap) completed by these samples
+    data = request.get_json(force=True, silent=True)
+    if not data or not data.get('session_id'):
+        return jsonify({'error': 'Missing session_id'}), 400
+    session_id = str(data['session_id'])
+    # Sessions are per user, so a client cannot push into or close another user's stream by guessing its id;
+    # anonymous clients share the None namespace
+    user_id = authenticated_user()
+    key = (user_id, session_id)
+    if data.get('close'):
+        return jsonify({'closed': aligner_sessions.close(key)})
+    try:
+        aligner = aligner_sessions.get(key, time_unit=data.get('time_unit', 's'))
+        # Overlapping requests for one session (e.g. a client retry) take turns, so no window is lost or repeated
+        with aligner.lock:
+            if data.get('time_unit', aligner.time_unit) != aligner.time_unit:
+                raise ValueError(f'Session {session_id} uses time_unit {aligner.time_unit!r}')
+            aligner.push(data.get('acc', []), data.get('gyro', []))
+            windows = aligner.pop_windows(WINDOW_SIZE, STREAM_STEP)
+            buffered = len(aligner.pending)
+        with engine_selector.select(data.get('engine')) as (engine, engine_model):
+            personal = personal_model(user_id, engine)
+            predictions = [predict_window(personal or engine_model, CLASSES, w, GRAVITY_ALPHA, f)
+                           for w, f in windows]
+        return jsonify({'predictions': predictions, 'buffered': buffered, 'engine': engine,
+                        'personalized': personal is not None})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/recordings', methods=['POST'])
+def upload_recording():
+    # {activity, acc, gyro, time_unit?}: aligned and saved as a training-format CSV under data/uploads/<activity>/,
+    # to be reviewed (e.g. with quality.py data/uploads) before moving it into the raw data
+    data = request.get_json(force=True, silent=True)
+    if not data or not all(k in data for k in ('activity', 'acc', 'gyro')):
+        return jsonify({'error': 'activity, acc and gyro are required'}), 400
+    activity = os.path.basename(str(data['activity']).strip())
+    if not activity or activity.startswith('.'):
+        return jsonify({'error': 'Invalid activity'}), 400
+    try:
+        _, samples = align_streams(data['acc'], data['gyro'], time_unit=data.get('time_unit', 's'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    folder = os.path.join(UPLOAD_DIR, activity)
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{time.strftime('%Y%m%d_%H%M%S')}_{os.urandom(3).hex()}.csv")
+    np.savetxt(path, samples, delimiter=',', header='AccX,AccY,AccZ,GyroX,GyroY,GyroZ', comments='', fmt='%.9g')
+    return jsonify({'path': path, 'samples': len(samples)})
+
+def labeled_windows(data):
+    # [(raw window, stream-filtered window or None, label), ...] from a POST /adapters body: index-paired windows
+    # (prepared like a /predict window) and/or timestamped recordings (cut and filtered like a /stream session)
+    windows, labels = data.get('windows') or [], data.get('labels') or []
+    if not isinstance(windows, list) or not isinstance(labels, list) or len(windows) != len(labels):
+        raise ValueError('windows and labels must be lists of the same length')
+    if len(windows) > MAX_ADAPTER_WINDOWS:
+        raise ValueError(f'At most {MAX_ADAPTER_WINDOWS} windows per request, got {len(windows)}')
+    out = [(w, None, str(label)) for w, label in zip(windows, labels)]
+    recordings = data.get('recordings') or []
+    if not isinstance(recordings, list):
+        raise ValueError('recordings must be a list')
+    for rec in recordings:
+        if not isinstance(rec, dict) or not all(k in rec for k in ('label', 'acc', 'gyro')):
+            raise ValueError('Each recording needs label, acc and gyro')
+        _, samples = align_streams(rec['acc'], rec['gyro'], time_unit=rec.get('time_unit', 's'))
+        filtered = remove_gravity_recording(samples, stream_alpha(PREPROCESSING)) if STREAM_FILTERED else None
+        for start in range(0, len(samples) - WINDOW_SIZE + 1, STREAM_STEP):
+            out.append((samples[start:start + WINDOW_SIZE],
+                        None if filtered is None else filtered[start:start + WINDOW_SIZE], str(rec['label'])))
+        if len(out) > MAX_ADAPTER_WINDOWS:
+            raise ValueError(f'At most {MAX_ADAPTER_WINDOWS} windows per request, the recordings hold more')
+    if not out:
+        raise ValueError(f'No complete {WINDOW_SIZE}-sample window in the request')
+    unknown = sorted({label for _, _, label in out} - set(CLASSES))
+    if unknown:
+        raise ValueError(f"Unknown activities {', '.join(unknown)}; known: {', '.join(CLASSES)}")
+    return out
+
+@app.route('/adapters', methods=['POST', 'DELETE'])
+def user_adapter():
+    # POST {windows: [[[AccX, AccY, AccZ, GyroX, GyroY, GyroZ] x 100], ...], labels: [activity, ...]} and/or
+    # {recordings: [{label, acc, gyro, time_unit?}, ...]}: fits the authenticated user's adapter on these labeled
+    # windows and serves it from the next request on. DELETE drops it, back to the global model.
+    user_id = authenticated_user()
+    if not user_id:
+        return jsonify({'error': 'A valid bearer token is required'}), 401
+    if request.method == 'DELETE':
+        return jsonify({'removed': adapter_cache.remove(user_id)})
+    data = request.get_json(force=True, silent=True)
+    if not data or not (data.get('windows') or data.get('recordings')):
+        return jsonify({'error': 'windows and labels, or recordings, are required'}), 400
+    try:
+        samples = labeled_windows(data)
+        backbone = adapter_cache.backbone
+        # The same preprocessing as the windows the adapter will be served (resampling included)
+        X = np.concatenate([model_input(backbone, w, GRAVITY_ALPHA, f) for w, f, _ in samples])
+        y = [CLASSES.index(label) for _, _, label in samples]
+        adapter, report = fit_adapter(backbone, X, y, CLASSES)
+        adapter_cache.put(user_id, adapter)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    return jsonify(report)
 
 @app.route('/signup', methods=['POST'])
 def signup():
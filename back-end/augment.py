@@ -0,0 +1,92 @@
+import numpy as np
+
+# Batched, seeded augmentation of raw (N, W, 6) windows, applied while training (see train_model.py --augment).
+# Every transform works on the whole batch at once; nothing is written to disk.
+#   shift     move each window's start by up to `shift` samples within its recording
+#             (only for RecordingWindows, which still has the continuous recording)
+#   rotate    one random 3D rotation per window, applied to acc and gyro together,
+#             as if the phone had been carried in a different orientation
+#   scale     per-window magnitude factor ~ N(1, scale), drawn separately for acc and gyro
+#   jitter    gaussian noise of `jitter` x the window's per-channel standard deviation
+#   warp      smooth random speed-up / slow-down of time, speed ~ N(1, warp) at a few knots
+
+SEED = 42
+DEFAULTS = {'shift': 25, 'rotate': 180.0, 'scale': 0.1, 'jitter': 0.05, 'warp': 0.2}
+WARP_KNOTS = 4
+
+def random_rotations(n, rng, max_angle=180.0):
+    # Rodrigues' formula for a random axis and an angle up to max_angle degrees; (n, 3, 3)
+    axis = rng.normal(size=(n, 3))
+    axis /= np.linalg.norm(axis, axis=1, keepdims=True)
+    angle = np.radians(rng.uniform(0, max_angle, size=n))
+    K = np.zeros((n, 3, 3))
+    K[:, 0, 1], K[:, 0, 2], K[:, 1, 2] = -axis[:, 2], axis[:, 1], -axis[:, 0]
+    K -= K.transpose(0, 2, 1)
+    sin, cos = np.sin(angle)[:, None, None], np.cos(angle)[:, None, None]
+    return np.eye(3) + sin * K + (1 - cos) * (K @ K)
+
+def rotate(batch, rotations):
+    out = np.empty_like(batch)
+    out[..., :3] = np.einsum('nij,ntj->nti', rotations, batch[..., :3])
+    out[..., 3:] = np.einsum('nij,ntj->nti', rotations, batch[..., 3:])
+    return out
+
+def scale(batch, rng, sigma):
+    factors = rng.normal(1.0, sigma, size=(len(batch), 1, 2)).repeat(3, axis=2)
+    return batch * factors
+
+def jitter(batch, rng, sigma):
+    return batch + rng.normal(size=batch.shape) * (sigma * batch.std(axis=1, keepdims=True))
+
+def _warp_weights(length, knots=WARP_KNOTS):
+    # Linear interpolation from knots+2 evenly spaced knots to `length` positions; (length, knots+2)
+    pos = np.linspace(0, knots + 1, length)
+    lo = np.minimum(pos.astype(int), knots)
+    frac = pos - lo
+    weights = np.zeros((length, knots + 2))
+    weights[np.arange(length), lo] = 1 - frac
+    weights[np.arange(length), lo + 1] += frac
+    return weights
+
+def time_warp(batch, rng, sigma, knots=WARP_KNOTS):
+    n, length, _ = batch.shape
+    speed = np.clip(rng.normal(1.0, sigma, size=(n, knots + 2)), 0.1, None) @ _warp_weights(length, knots).T
+    t = np.cumsum(speed, axis=1)
+    t = (t - t[:, :1]) / (t[:, -1:] - t[:, :1]) * (length - 1)
+    lo = np.minimum(t.astype(int), length - 2)
+    frac = (t - lo)[..., None]
+    before = np.take_along_axis(batch, lo[..., None], axis=1)
+    after = np.take_along_axis(batch, lo[..., None] + 1, axis=1)
+    return before + frac * (after - before)
+
+class Augmenter:
+    def __init__(self, seed=SEED, **settings):
+        self.seed = seed
+        self.settings = dict(DEFAULTS, **settings)
+
+    def config(self):
+        return {'seed': self.seed, **self.settings}
+
+    def rng(self, *key):
+        # Independent stream per (epoch, batch), so results do not depend on batch order or worker count
+        return np.random.default_rng([self.seed, *key])
+
+    def load(self, windows, indices, rng):
+        # Raw windows for indices, shifted within their recordings when the source allows it
+        shift = self.settings['shift']
+        if shift and hasattr(windows, 'batch_at'):
+            return windows.batch_at(indices, rng.integers(-shift, shift + 1, size=len(indices)))
+        return windows.batch(indices)
+
+    def __call__(self, batch, rng):
+        s = self.settings
+        out = np.asarray(batch, dtype=np.float64)
+        if s['rotate']:
+            out = rotate(out, random_rotations(len(out), rng, s['rotate']))
+        if s['warp']:
+            out = time_warp(out, rng, s['warp'])
+        if s['scale']:
+            out = scale(out, rng, s['scale'])
+        if s['jitter']:
+            out = jitter(out, rng, s['jitter'])
+        return out.astype(np.float32)
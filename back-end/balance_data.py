@@ -1,37 +1,50 @@
 import os
-import random
-import shutil
+import argparse
+import numpy as np
+from sampling import SEED, STRATEGIES, ClassSampler, class_counts
+from splits import DEFAULT_SPLIT, load_split, split_exists
+from window_store import load_store
+
+# Balancing now happens while loading (see sampling.py and train_model.py --balance), so no window is
+# ever deleted. This script only reports the class counts and what each strategy would train on.
 
 # Paths to train and test directories
 TRAIN_DIR = 'data/train'
 TEST_DIR = 'data/test'
 
-# Set random seed for reproducibility
-random.seed(42)
+def folder_labels(folder_path):
+    classes = sorted(d for d in os.listdir(folder_path) if os.path.isdir(os.path.join(folder_path, d)))
+    labels = []
+    for class_idx, cls in enumerate(classes):
+        files = [f for f in os.listdir(os.path.join(folder_path, cls)) if f.endswith('.csv')]
+        labels.extend([class_idx] * len(files))
+    return np.array(labels, dtype=np.int64), classes
+
+def report(desc, labels, classes, seed=SEED):
+    counts = class_counts(labels, len(classes))
+    print(f"{desc}: {', '.join(f'{c} {n}' for c, n in zip(classes, counts))}")
+    indices = np.arange(len(labels))
+    for strategy in STRATEGIES:
+        sampler = ClassSampler(labels, strategy, seed, len(classes))
+        weights = sampler.class_weight(indices)
+        extra = f" (class weights {', '.join(f'{classes[c]} {w:.2f}' for c, w in weights.items())})" if weights else ''
+        print(f"  {strategy:<12} {sampler.sample_size(indices)} windows per epoch{extra}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Report class balance and the effect of each load-time balancing strategy.')
+    parser.add_argument('--split', default=DEFAULT_SPLIT)
+    parser.add_argument('--seed', type=int, default=SEED)
+    args = parser.parse_args(argv)
 
-def balance_folder(folder_path):
-    # Get all class subfolders
-    class_folders = [d for d in os.listdir(folder_path) if os.path.isdir(os.path.join(folder_path, d))]
-    # Get list of file counts for each class
-    file_counts = {}
-    for cls in class_folders:
-        cls_path = os.path.join(folder_path, cls)
-        files = [f for f in os.listdir(cls_path) if f.endswith('.csv')]
-        file_counts[cls] = len(files)
-    # Find the minimum count
-    min_count = min(file_counts.values())
-    print(f'Balancing {folder_path}: limiting each class to {min_count} samples')
-    # For each class, randomly remove extra files
-    for cls in class_folders:
-        cls_path = os.path.join(folder_path, cls)
-        files = [f for f in os.listdir(cls_path) if f.endswith('.csv')]
-        if len(files) > min_count:
-            to_remove = random.sample(files, len(files) - min_count)
-            for f in to_remove:
-                os.remove(os.path.join(cls_path, f))
-                print(f'Removed {os.path.join(cls_path, f)}')
+    if split_exists(args.split):
+        parts, meta = load_split(args.split)
+        store = load_store(meta['source'])
+        for part, idx in parts.items():
+            report(f'{args.split} {part}', np.asarray(store.labels)[idx], store.classes, args.seed)
+    for folder in [TRAIN_DIR, TEST_DIR]:
+        if os.path.isdir(folder):
+            labels, classes = folder_labels(folder)
+            report(folder, labels, classes, args.seed)
 
 if __name__ == '__main__':
-    balance_folder(TRAIN_DIR)
-    balance_folder(TEST_DIR)
-    print('Balancing complete.')
+    main()
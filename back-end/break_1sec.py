@@ -1,30 +1,35 @@
-import os
-import pandas as pd
+import argparse
+from manifest import Manifest
+from parallel import add_workers_argument
+from windowing import update_window_store
+from window_store import store_path, update_csv_export
 
 INPUT_ROOT = 'data/all_data'
 OUTPUT_ROOT = 'data/all_data_1sec'
+OUTPUT_STORE = store_path('all_data_1sec')
 SAMPLES_PER_SECOND = 100
 
-os.makedirs(OUTPUT_ROOT, exist_ok=True)
+def segment_name(stem, offset):
+    return f"{stem}_sec{offset // SAMPLES_PER_SECOND + 1}.csv"
 
-# Dynamically get all activity class folders
-CLASSES = [d for d in os.listdir(INPUT_ROOT) if os.path.isdir(os.path.join(INPUT_ROOT, d))]
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Split raw recordings into 1-second segments.')
+    parser.add_argument('--csv', action='store_true', help=f'Also write one CSV per segment to {OUTPUT_ROOT}')
+    parser.add_argument('--force', action='store_true', help='Rebuild even if inputs and config are unchanged')
+    add_workers_argument(parser)
+    args = parser.parse_args(argv)
 
-for class_name in CLASSES:
-    input_class_dir = os.path.join(INPUT_ROOT, class_name)
-    output_class_dir = os.path.join(OUTPUT_ROOT, class_name)
-    os.makedirs(output_class_dir, exist_ok=True)
-    for fname in os.listdir(input_class_dir):
-        if fname.endswith('.csv'):
-            in_path = os.path.join(input_class_dir, fname)
-            df = pd.read_csv(in_path, header=None)
-            n_windows = len(df) // SAMPLES_PER_SECOND
-            for i in range(n_windows):
-                start = i * SAMPLES_PER_SECOND
-                end = start + SAMPLES_PER_SECOND
-                window_df = df.iloc[start:end]
-                if len(window_df) == SAMPLES_PER_SECOND:
-                    out_fname = f"{os.path.splitext(fname)[0]}_sec{i+1}.csv"
-                    out_path = os.path.join(output_class_dir, out_fname)
-                    window_df.to_csv(out_path, index=False, header=False)
-print(f"All files split into 1-second segments and saved in {OUTPUT_ROOT}")
+    # Non-overlapping 1-second windows over every recording in INPUT_ROOT (class folders sorted for consistent label ids).
+    # Only new or changed recordings are parsed; the manifest tracks what each output was built from.
+    manifest = Manifest()
+    store, config, inputs = update_window_store('segment', OUTPUT_STORE, SAMPLES_PER_SECOND, SAMPLES_PER_SECOND,
+                                                INPUT_ROOT, args.workers, args.force, manifest)
+    print(f"All files split into {len(store)} 1-second segments and saved in {OUTPUT_STORE}")
+
+    if args.csv:
+        update_csv_export(manifest, 'segment_csv', config, inputs, OUTPUT_STORE, OUTPUT_ROOT,
+                          segment_name, args.workers, args.force)
+        print(f"Per-window CSV files saved in {OUTPUT_ROOT}")
+
+if __name__ == '__main__':
+    main()
@@ -1,36 +1,50 @@
-import os
-import pandas as pd
+import argparse
+from manifest import Manifest
+from parallel import add_workers_argument
+from downsample import SOURCE_RATE, scale_length
+from windowing import update_window_store
+from window_store import store_path, update_csv_export
 
-INPUT_ROOT = 'data/all_data_1sec'
+# Windows are cut straight from the continuous recordings, so consecutive windows really overlap
+# (cutting the 1-second segments again only ever yielded one window per segment)
+INPUT_ROOT = 'data/all_data'
 OUTPUT_ROOT = 'data/all_data_overlap'
+OUTPUT_STORE = store_path('all_data_overlap')
 WINDOW_SIZE = 100
 STEP_SIZE = 50  # 50% overlap: 100 - 50 = 50
 
-os.makedirs(OUTPUT_ROOT, exist_ok=True)
+class WindowName:
+    # Same naming as before: Run_1_sec9_ovl2.csv starts half-way through second 9 of Run_1
+    def __init__(self, window_size=WINDOW_SIZE, step=STEP_SIZE):
+        self.window_size = window_size
+        self.step = step
 
-# Dynamically get all activity class folders
-CLASSES = [d for d in os.listdir(INPUT_ROOT) if os.path.isdir(os.path.join(INPUT_ROOT, d))]
+    def __call__(self, stem, offset):
+        return f"{stem}_sec{offset // self.window_size + 1}_ovl{(offset % self.window_size) // self.step + 1}.csv"
 
-def process_class(class_name):
-    input_class_dir = os.path.join(INPUT_ROOT, class_name)
-    output_class_dir = os.path.join(OUTPUT_ROOT, class_name)
-    os.makedirs(output_class_dir, exist_ok=True)
-    for fname in sorted(os.listdir(input_class_dir)):
-        if fname.endswith('.csv'):
-            in_path = os.path.join(input_class_dir, fname)
-            df = pd.read_csv(in_path, header=None)
-            n_rows = len(df)
-            window_idx = 1
-            for start in range(0, n_rows - WINDOW_SIZE + 1, STEP_SIZE):
-                end = start + WINDOW_SIZE
-                window_df = df.iloc[start:end]
-                if len(window_df) == WINDOW_SIZE:
-                    out_fname = f"{os.path.splitext(fname)[0]}_ovl{window_idx}.csv"
-                    out_path = os.path.join(output_class_dir, out_fname)
-                    window_df.to_csv(out_path, index=False, header=False)
-                    window_idx += 1
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Cut overlapping windows from raw recordings.')
+    parser.add_argument('--csv', action='store_true', help=f'Also write one CSV per window to {OUTPUT_ROOT}')
+    parser.add_argument('--force', action='store_true', help='Rebuild even if inputs and config are unchanged')
+    parser.add_argument('--window-size', type=int, default=WINDOW_SIZE)
+    parser.add_argument('--step', type=int, default=STEP_SIZE)
+    parser.add_argument('--rate', type=int, default=SOURCE_RATE,
+                        help='Resample to this rate in Hz first; --window-size and --step stay in 100 Hz samples '
+                             '(the same durations)')
+    add_workers_argument(parser)
+    args = parser.parse_args(argv)
+    window_size, step = scale_length(args.window_size, args.rate), scale_length(args.step, args.rate)
 
-for class_name in CLASSES:
-    process_class(class_name)
+    manifest = Manifest()
+    store, config, inputs = update_window_store('window', OUTPUT_STORE, window_size, step,
+                                                INPUT_ROOT, args.workers, args.force, manifest, args.rate)
+    print(f"{len(store)} windows of {window_size} samples with a {step}-sample hop at {args.rate} Hz "
+          f"saved in {OUTPUT_STORE}")
 
-print(f"All files processed with 50% overlap and saved in {OUTPUT_ROOT}")
+    if args.csv:
+        update_csv_export(manifest, 'window_csv', config, inputs, OUTPUT_STORE, OUTPUT_ROOT,
+                          WindowName(window_size, step), args.workers, args.force)
+        print(f"All files processed and saved in {OUTPUT_ROOT}")
+
+if __name__ == '__main__':
+    main()
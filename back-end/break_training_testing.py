@@ -1,31 +1,77 @@
 import os
 import shutil
 import random
+import argparse
+from manifest import Manifest
+from splits import DEFAULT_SPLIT, SEED, SOURCE_STORE, create_split, split_exists, split_path
+from window_store import ARRAYS, store_exists, store_path
 
 INPUT_ROOT = 'data/all_data_overlap'
 TRAIN_ROOT = 'data/train'
 TEST_ROOT = 'data/test'
+INPUT_STORE = SOURCE_STORE
+# Copies written by earlier versions of this script; the split is now an index manifest (see splits.py)
+LEGACY_STORES = [store_path('train'), store_path('test')]
 TRAIN_RATIO = 0.75
 
-os.makedirs(TRAIN_ROOT, exist_ok=True)
-os.makedirs(TEST_ROOT, exist_ok=True)
-
-# Dynamically get all activity class folders
-CLASSES = [d for d in os.listdir(INPUT_ROOT) if os.path.isdir(os.path.join(INPUT_ROOT, d))]
-
-for class_name in CLASSES:
-    input_class_dir = os.path.join(INPUT_ROOT, class_name)
-    train_class_dir = os.path.join(TRAIN_ROOT, class_name)
-    test_class_dir = os.path.join(TEST_ROOT, class_name)
-    os.makedirs(train_class_dir, exist_ok=True)
-    os.makedirs(test_class_dir, exist_ok=True)
-    files = [f for f in os.listdir(input_class_dir) if f.endswith('.csv')]
-    random.shuffle(files)
-    split_idx = int(len(files) * TRAIN_RATIO)
-    train_files = files[:split_idx]
-    test_files = files[split_idx:]
-    for f in train_files:
-        shutil.copy(os.path.join(input_class_dir, f), os.path.join(train_class_dir, f))
-    for f in test_files:
-        shutil.copy(os.path.join(input_class_dir, f), os.path.join(test_class_dir, f))
-print(f"Data split: {TRAIN_RATIO*100:.0f}% training, {100-TRAIN_RATIO*100:.0f}% testing. Results in {TRAIN_ROOT} and {TEST_ROOT}.")
+def split_store(train_ratio=TRAIN_RATIO, strategy='random', seed=SEED, name=DEFAULT_SPLIT):
+    folds, _ = create_split(name, strategy, round(1 - train_ratio, 6), seed, source=INPUT_STORE)
+    for path in LEGACY_STORES:
+        if store_exists(path):
+            shutil.rmtree(path)
+    return len(folds[0]['train']), len(folds[0]['test'])
+
+def split_csv(train_ratio=TRAIN_RATIO, seed=SEED):
+    rng = random.Random(seed)
+    os.makedirs(TRAIN_ROOT, exist_ok=True)
+    os.makedirs(TEST_ROOT, exist_ok=True)
+
+    # Dynamically get all activity class folders
+    CLASSES = [d for d in os.listdir(INPUT_ROOT) if os.path.isdir(os.path.join(INPUT_ROOT, d))]
+
+    for class_name in CLASSES:
+        input_class_dir = os.path.join(INPUT_ROOT, class_name)
+        train_class_dir = os.path.join(TRAIN_ROOT, class_name)
+        test_class_dir = os.path.join(TEST_ROOT, class_name)
+        os.makedirs(train_class_dir, exist_ok=True)
+        os.makedirs(test_class_dir, exist_ok=True)
+        files = [f for f in os.listdir(input_class_dir) if f.endswith('.csv')]
+        files.sort()
+        rng.shuffle(files)
+        split_idx = int(len(files) * train_ratio)
+        train_files = files[:split_idx]
+        test_files = files[split_idx:]
+        for f in train_files:
+            shutil.copy(os.path.join(input_class_dir, f), os.path.join(train_class_dir, f))
+        for f in test_files:
+            shutil.copy(os.path.join(input_class_dir, f), os.path.join(test_class_dir, f))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Split the window store into train and test index sets.')
+    parser.add_argument('--csv', action='store_true', help=f'Also copy window CSV files into {TRAIN_ROOT} and {TEST_ROOT}')
+    parser.add_argument('--force', action='store_true', help='Resplit even if the windows and the ratio are unchanged')
+    parser.add_argument('--train-ratio', type=float, default=TRAIN_RATIO)
+    parser.add_argument('--strategy', choices=['random', 'grouped'], default='random',
+                        help='grouped keeps all windows of a recording on the same side')
+    parser.add_argument('--seed', type=int, default=SEED)
+    args = parser.parse_args(argv)
+    ratio = args.train_ratio
+
+    manifest = Manifest()
+    config = {'train_ratio': ratio, 'strategy': args.strategy, 'seed': args.seed}
+    # The split only has to be redone when the window store or the split settings changed
+    inputs = manifest.digests({name: os.path.join(INPUT_STORE, f'{name}.npy') for name in ARRAYS})
+    if not args.force and split_exists(DEFAULT_SPLIT) and manifest.is_current('split', config, inputs):
+        print(f"{split_path(DEFAULT_SPLIT)} is up to date.")
+    else:
+        n_train, n_test = split_store(ratio, args.strategy, args.seed)
+        manifest.record('split', config, inputs)
+        print(f"Data split: {ratio*100:.0f}% training, {100-ratio*100:.0f}% testing. "
+              f"{n_train} training and {n_test} test windows indexed in {split_path(DEFAULT_SPLIT)}.")
+    manifest.save()
+    if args.csv:
+        split_csv(ratio, args.seed)
+        print(f"Window files copied to {TRAIN_ROOT} and {TEST_ROOT}.")
+
+if __name__ == '__main__':
+    main()
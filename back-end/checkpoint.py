@@ -0,0 +1,172 @@
+import os
+import json
+import random
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.callbacks import Callback
+
+# Full-state training checkpoints for train_model.py (--checkpoint-every, --resume).
+# One .npz holds everything needed to continue an interrupted run from the last saved epoch:
+#   model weights and optimizer variables (Adam moments, step count), the epoch, the NumPy, Python and
+#   TensorFlow global RNG states, the model's own seed generators (Dropout masks), the data-pipeline position (balancing sampler RNG, epoch order, augmentation epoch;
+#   anything registered with track() that has get_state()/set_state()), the EarlyStopping state (wait,
+#   best, best weights) and ModelCheckpoint's best score, plus the training arguments.
+# It is written to a temporary file and renamed over the previous one, so a run killed mid-write leaves
+# the last complete checkpoint in place. The file is removed once training finishes normally.
+
+CHECKPOINT_PATH = 'data/checkpoints/train_model.npz'
+EVERY_EPOCHS = 1
+
+def read_checkpoint(path=CHECKPOINT_PATH):
+    # (meta, arrays) of a saved checkpoint, or None
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        meta = json.loads(str(data['meta']))
+        arrays = {k: data[k] for k in data.files if k != 'meta'}
+    return meta, arrays
+
+def saved_config(path=CHECKPOINT_PATH):
+    # Training arguments of the checkpointed run, so --resume continues with the same settings
+    checkpoint = read_checkpoint(path)
+    return checkpoint[0]['config'] if checkpoint else None
+
+def _seed_states(model):
+    # The model's SeedGenerator state variables (one per Dropout layer): not part of get_weights(), but they
+    # decide the next dropout masks
+    weights = {id(w) for w in model.weights}
+    return [v for v in model.variables if id(v) not in weights]
+
+def _split_state(prefix, state, arrays):
+    # JSON part of a get_state() dict; ndarray values go into arrays under prefix
+    plain = {}
+    for key, value in state.items():
+        if isinstance(value, np.ndarray):
+            arrays[f'{prefix}.{key}'] = value
+            plain[key] = {'array': f'{prefix}.{key}'}
+        else:
+            plain[key] = value
+    return plain
+
+def _join_state(plain, arrays):
+    return {k: arrays[v['array']] if isinstance(v, dict) and set(v) == {'array'} else v for k, v in plain.items()}
+
+class TrainingCheckpoint(Callback):
+    # Keras callback; list it after the EarlyStopping/ModelCheckpoint callbacks it restores
+    def __init__(self, path=CHECKPOINT_PATH, every=EVERY_EPOCHS, config=None, resume=False,
+                 early_stopping=None, best_checkpoint=None):
+        super().__init__()
+        self.path = path
+        self.every = every  # epochs between saves; 0 disables checkpointing
+        self.config = config or {}
+        self.early_stopping = early_stopping
+        self.best_checkpoint = best_checkpoint
+        self.pipeline = {}
+        self.saved = read_checkpoint(path) if resume else None
+        # Epoch to continue from (model.fit initial_epoch); known before the data pipeline is built
+        self.initial_epoch = self.saved[0]['epoch'] if self.saved else 0
+
+    def track(self, name, obj):
+        # Register a data-pipeline object with get_state()/set_state(); restored right away on resume
+        self.pipeline[name] = obj
+        if self.saved:
+            meta, arrays = self.saved
+            if name not in meta['pipeline']:
+                raise ValueError(f'Checkpoint {self.path} has no state for {name}; it was made by another training mode')
+            obj.set_state(_join_state(meta['pipeline'][name], arrays))
+        return obj
+
+    def restore(self, model):
+        # Weights, optimizer and RNG state into a freshly built (compiled) model; returns the initial epoch
+        if not self.saved:
+            return 0
+        meta, arrays = self.saved
+        if not model.built:
+            # A Sequential model without an Input layer only creates its weights on the first call
+            model.build((None, *meta['input_shape']))
+        model.set_weights([arrays[f'weights.{i}'] for i in range(meta['n_weights'])])
+        model.optimizer.build(model.trainable_variables)
+        variables = model.optimizer.variables
+        if len(variables) != meta['n_optimizer']:
+            raise ValueError(f'Checkpoint {self.path} was saved with a different optimizer')
+        for i, variable in enumerate(variables):
+            variable.assign(arrays[f'optimizer.{i}'])
+        seed_states = _seed_states(model)
+        if len(seed_states) != meta['n_seed_states']:
+            raise ValueError(f'Checkpoint {self.path} was saved from a different model')
+        for i, variable in enumerate(seed_states):
+            variable.assign(arrays[f'seed_state.{i}'])
+        tf.random.get_global_generator().reset(arrays['tf_rng'])
+        np.random.set_state(tuple(meta['numpy_rng'][:1]) + (arrays['numpy_rng'],) + tuple(meta['numpy_rng'][1:]))
+        random.setstate((meta['python_rng'][0], tuple(meta['python_rng'][1]), meta['python_rng'][2]))
+        print(f"Resuming from {self.path} after epoch {meta['epoch']}")
+        return self.initial_epoch
+
+    def on_train_begin(self, logs=None):
+        # EarlyStopping resets itself in its own on_train_begin, which runs before this one
+        if not self.saved:
+            return
+        meta, arrays = self.saved
+        es = meta.get('early_stopping')
+        if self.early_stopping is not None and es:
+            self.early_stopping.wait = es['wait']
+            self.early_stopping.best = es['best']
+            self.early_stopping.best_epoch = es['best_epoch']
+            if es['has_best_weights']:
+                self.early_stopping.best_weights = [arrays[f'best_weights.{i}'] for i in range(meta['n_weights'])]
+        if self.best_checkpoint is not None and meta.get('best_checkpoint') is not None:
+            self.best_checkpoint.best = meta['best_checkpoint']
+        self.saved = None
+
+    def on_epoch_end(self, epoch, logs=None):
+        if self.every and (epoch + 1) % self.every == 0:
+            self.save(epoch + 1)
+
+    def on_train_end(self, logs=None):
+        # Reached only when fit() returns normally; an interrupted run keeps its checkpoint
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def save(self, epoch):
+        arrays = {}
+        weights = self.model.get_weights()
+        for i, w in enumerate(weights):
+            arrays[f'weights.{i}'] = w
+        variables = self.model.optimizer.variables
+        for i, variable in enumerate(variables):
+            arrays[f'optimizer.{i}'] = np.asarray(variable)
+        seed_states = _seed_states(self.model)
+        for i, variable in enumerate(seed_states):
+            arrays[f'seed_state.{i}'] = np.asarray(variable)
+        arrays['tf_rng'] = tf.random.get_global_generator().state.numpy()
+        np_state = np.random.get_state()
+        arrays['numpy_rng'] = np_state[1]
+        py_state = random.getstate()
+        meta = {
+            'epoch': epoch,
+            'config': self.config,
+            'input_shape': list(self.model.input_shape[1:]),
+            'n_weights': len(weights),
+            'n_optimizer': len(variables),
+            'n_seed_states': len(seed_states),
+            'numpy_rng': [np_state[0], *[int(v) if isinstance(v, (int, np.integer)) else float(v) for v in np_state[2:]]],
+            'python_rng': [py_state[0], list(py_state[1]), py_state[2]],
+            'pipeline': {name: _split_state(f'pipeline.{name}', obj.get_state(), arrays)
+                         for name, obj in self.pipeline.items()},
+        }
+        es = self.early_stopping
+        if es is not None:
+            best = None if es.best is None else float(es.best)
+            meta['early_stopping'] = {'wait': int(es.wait), 'best': best, 'best_epoch': int(es.best_epoch),
+                                      'has_best_weights': es.best_weights is not None}
+            for i, w in enumerate(es.best_weights or []):
+                arrays[f'best_weights.{i}'] = w
+        if self.best_checkpoint is not None and self.best_checkpoint.best is not None:
+            meta['best_checkpoint'] = float(self.best_checkpoint.best)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f'{self.path}.tmp{os.getpid()}'
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, meta=np.array(json.dumps(meta)), **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
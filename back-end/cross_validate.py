@@ -0,0 +1,165 @@
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import as_completed
+import numpy as np
+from parallel import thread_limited_pool, threads_per_worker
+
+# Usage: python cross_validate.py [--k 5] [--workers 5] [--threads-per-fold N] [--epochs 75] [--output cv_report.json]
+# Example: python cross_validate.py --k 5 --epochs 30
+#
+# K-fold cross-validation grouped by source recording: every recording is in exactly one test fold, so
+# overlapping windows of one recording never sit on both sides (unlike a random split of the windows).
+# The folds come from a grouped k-fold split (splits.py, created on first use) and are trained in parallel
+# worker processes with a bounded number of CPU threads each. Early stopping watches a recording-grouped
+# holdout inside each fold's training side; the fold's test recordings are only used for the final scores.
+# Reports per-fold and mean/std accuracy and macro F1, the pooled confusion matrix, and timing.
+
+K = 5
+SEED = 42
+VAL_RATIO = 0.2
+REPORT_PATH = 'cv_report.json'
+
+def split_name(k, seed):
+    return f'cv_grouped_k{k}_s{seed}'
+
+def macro_f1(confusion):
+    tp = np.diag(confusion).astype(np.float64)
+    precision = tp / np.maximum(confusion.sum(axis=0), 1)
+    recall = tp / np.maximum(confusion.sum(axis=1), 1)
+    f1 = 2 * precision * recall / np.maximum(precision + recall, 1e-12)
+    present = confusion.sum(axis=1) > 0
+    return float(f1[present].mean()) if present.any() else 0.0
+
+def run_fold(job):
+    # Worker process: train on one fold's training recordings, score on its test recordings
+    import tensorflow as tf
+    from tensorflow.keras.callbacks import EarlyStopping
+    from tensorflow.keras.utils import to_categorical
+    from sampling import ClassSampler
+    from splits import grouped_holdout
+    from tensor_cache import split_arrays
+    from train_model import SampledArrays, build_cnn_model
+
+    start = time.perf_counter()
+    tf.keras.utils.set_random_seed(job['seed'])
+    split, fold = job['split'], job['fold']
+    X, y, classes = split_arrays('train', split, fold)
+    X_test, y_test, _ = split_arrays('test', split, fold)
+    fit_pos, val_pos = grouped_holdout('train', split, fold, VAL_RATIO, job['seed'])
+    n_classes = len(classes)
+    X_fit, y_fit = np.asarray(X[fit_pos]), to_categorical(y[fit_pos], num_classes=n_classes)
+    X_val, y_val = np.asarray(X[val_pos]), to_categorical(y[val_pos], num_classes=n_classes)
+    load_s = time.perf_counter() - start
+
+    model = build_cnn_model(X_fit.shape[1:], n_classes, X_fit, job['learning_rate'])
+    es = EarlyStopping(monitor='val_loss', patience=job['patience'], restore_best_weights=True)
+    sampler = ClassSampler(y[fit_pos], job['balance'], seed=job['seed'], n_classes=n_classes)
+    if job['balance'] in ('undersample', 'oversample'):
+        history = model.fit(SampledArrays(X_fit, y_fit, sampler, job['batch_size']), epochs=job['epochs'],
+                            validation_data=(X_val, y_val), callbacks=[es], verbose=0)
+    else:
+        history = model.fit(X_fit, y_fit, epochs=job['epochs'], batch_size=job['batch_size'],
+                            validation_data=(X_val, y_val), callbacks=[es], verbose=0,
+                            class_weight=sampler.class_weight(np.arange(len(fit_pos))))
+    train_s = time.perf_counter() - start - load_s
+
+    pred = np.argmax(model.predict(np.asarray(X_test), batch_size=256, verbose=0), axis=1)
+    confusion = np.zeros((n_classes, n_classes), dtype=np.int64)
+    np.add.at(confusion, (np.asarray(y_test), pred), 1)
+    return {
+        'fold': fold,
+        'train_windows': len(fit_pos),
+        'val_windows': len(val_pos),
+        'test_windows': len(y_test),
+        'accuracy': float(np.trace(confusion) / max(confusion.sum(), 1)),
+        'macro_f1': macro_f1(confusion),
+        'confusion': confusion.tolist(),
+        'epochs_run': len(history.history['val_loss']),
+        'load_s': load_s,
+        'train_s': train_s,
+        'wall_time_s': time.perf_counter() - start,
+    }
+
+def aggregate(folds, classes, wall_time_s):
+    confusion = np.sum([f['confusion'] for f in folds], axis=0)
+    acc = np.array([f['accuracy'] for f in folds])
+    f1 = np.array([f['macro_f1'] for f in folds])
+    fold_time = sum(f['wall_time_s'] for f in folds)
+    return {
+        'classes': list(classes),
+        'folds': folds,
+        'accuracy_mean': float(acc.mean()), 'accuracy_std': float(acc.std()),
+        'macro_f1_mean': float(f1.mean()), 'macro_f1_std': float(f1.std()),
+        # Every window is tested exactly once across the folds
+        'pooled_accuracy': float(np.trace(confusion) / max(confusion.sum(), 1)),
+        'pooled_confusion': confusion.tolist(),
+        'per_class_recall': {c: float(confusion[i, i] / max(confusion[i].sum(), 1)) for i, c in enumerate(classes)},
+        'wall_time_s': wall_time_s,
+        'summed_fold_time_s': fold_time,
+        'parallel_speedup': fold_time / wall_time_s if wall_time_s else 0.0,
+    }
+
+def print_report(report):
+    for f in report['folds']:
+        print(f"  fold {f['fold']}: accuracy {f['accuracy']:.4f}, macro F1 {f['macro_f1']:.4f} on {f['test_windows']} "
+              f"test windows ({f['epochs_run']} epochs, {f['wall_time_s']:.0f}s)")
+    print(f"Accuracy {report['accuracy_mean']:.4f} +/- {report['accuracy_std']:.4f}, "
+          f"macro F1 {report['macro_f1_mean']:.4f} +/- {report['macro_f1_std']:.4f}, "
+          f"pooled accuracy {report['pooled_accuracy']:.4f}")
+    print('Per-class recall: ' + ', '.join(f'{c} {r:.3f}' for c, r in report['per_class_recall'].items()))
+    print(f"Wall time {report['wall_time_s']:.0f}s for {report['summed_fold_time_s']:.0f}s of fold training "
+          f"({report['parallel_speedup']:.1f}x)")
+
+def main(argv=None):
+    from sampling import STRATEGIES
+    from splits import create_split, load_folds, split_exists
+    from tensor_cache import split_arrays
+    from train_model import BALANCE, BATCH_SIZE, EPOCHS, LEARNING_RATE
+    parser = argparse.ArgumentParser(description='Recording-grouped k-fold cross-validation in parallel processes.')
+    parser.add_argument('--k', type=int, default=K)
+    parser.add_argument('--split', help='Existing k-fold split to use (default: a grouped one for --k/--seed)')
+    parser.add_argument('--workers', type=int, help='Folds trained at the same time (default: k)')
+    parser.add_argument('--threads-per-fold', type=int, help='CPU threads per fold (default: cores / workers)')
+    parser.add_argument('--epochs', type=int, default=EPOCHS)
+    parser.add_argument('--patience', type=int, default=8)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--learning-rate', type=float, default=LEARNING_RATE)
+    parser.add_argument('--balance', choices=STRATEGIES, default=BALANCE)
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--output', default=REPORT_PATH)
+    args = parser.parse_args(argv)
+
+    name = args.split or split_name(args.k, args.seed)
+    if not split_exists(name):
+        create_split(name, 'grouped', seed=args.seed, k=args.k)
+        print(f'Created grouped {args.k}-fold split {name}')
+    folds, _ = load_folds(name)
+    # Preprocess every fold once up front; the workers read the cached arrays through mmap
+    for fold in range(len(folds)):
+        _, _, classes = split_arrays('train', name, fold)
+        split_arrays('test', name, fold)
+    workers = args.workers or len(folds)
+    threads = args.threads_per_fold or threads_per_worker(workers)
+    jobs = [{'split': name, 'fold': fold, 'epochs': args.epochs, 'patience': args.patience,
+             'batch_size': args.batch_size, 'learning_rate': args.learning_rate, 'balance': args.balance,
+             'seed': args.seed} for fold in range(len(folds))]
+    print(f'{len(folds)} folds of {name}, {workers} at a time with {threads} thread(s) each')
+    start = time.perf_counter()
+    results = []
+    with thread_limited_pool(workers, threads) as pool:
+        for future in as_completed([pool.submit(run_fold, job) for job in jobs]):
+            result = future.result()
+            results.append(result)
+            print(f"  fold {result['fold']} done: accuracy {result['accuracy']:.4f} ({result['wall_time_s']:.0f}s)")
+    report = aggregate(sorted(results, key=lambda r: r['fold']), classes, time.perf_counter() - start)
+    report.update({'split': name, 'settings': {k: v for k, v in vars(args).items() if k not in ('output', 'split')}})
+    print_report(report)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Report saved as {args.output}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
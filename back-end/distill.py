@@ -0,0 +1,186 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+# Usage: python distill.py [--students small separable single] [--teacher cnn_motion_model.keras]
+#                          [--temperature 4] [--alpha 0.3] [--epochs 40] [--baseline] [--output distill_report.json]
+# Example: python distill.py --students separable single --baseline
+#
+# Knowledge distillation: the trained model (the teacher) labels the training windows with its full
+# probability distribution, and much smaller students learn from it. Students are trained on
+#   alpha * cross-entropy(true label) + (1 - alpha) * T^2 * KL(teacher || student), both softened by T,
+# so they pick up which activities the teacher finds similar, not just the hard label.
+# Students (see STUDENTS): the usual CNN with far fewer filters, depthwise-separable convolutions, and a
+# single convolution layer. Each is saved to STUDENT_DIR as a drop-in model for app.py / test_model.py,
+# and the report lists test accuracy, params, FLOPs and measured single-window latency next to the teacher.
+# --baseline also trains every student on the labels alone, to show what the teacher adds.
+
+TEACHER_PATH = 'cnn_motion_model.keras'
+STUDENT_DIR = 'students'
+REPORT_PATH = 'distill_report.json'
+TEMPERATURE = 4.0
+ALPHA = 0.3
+EPOCHS = 40
+PATIENCE = 6
+LEARNING_RATE = 0.002
+VAL_RATIO = 0.2
+SEED = 42
+STUDENTS = ['small', 'separable', 'single']
+
+def build_student(kind, input_shape, n_classes, X_train):
+    from tensorflow.keras.layers import (BatchNormalization, Conv1D, Dense, Dropout, Flatten, GlobalAveragePooling1D,
+                                         Input, MaxPooling1D, Normalization, SeparableConv1D)
+    from tensorflow.keras.models import Sequential
+    from train_model import build_cnn_model
+    if kind == 'small':
+        # The teacher's layout at an eighth of the width
+        return build_cnn_model(input_shape, n_classes, X_train, filters=(8, 16), dense=32, dropout=0.3)
+    norm_layer = Normalization()
+    norm_layer.adapt(X_train)
+    if kind == 'separable':
+        # Per-channel temporal filters followed by 1x1 channel mixing, pooled over time (no large Dense)
+        body = [SeparableConv1D(24, kernel_size=5, activation='relu'), BatchNormalization(), MaxPooling1D(pool_size=2),
+                SeparableConv1D(32, kernel_size=5, activation='relu'), BatchNormalization(), GlobalAveragePooling1D()]
+    elif kind == 'single':
+        # One strided convolution straight into the classifier
+        body = [Conv1D(16, kernel_size=7, strides=2, activation='relu'), BatchNormalization(),
+                MaxPooling1D(pool_size=4), Flatten(), Dropout(0.3)]
+    else:
+        raise ValueError(f"Unknown student '{kind}'; choose from {', '.join(STUDENTS)}")
+    return Sequential([Input(input_shape), norm_layer] + body + [Dense(n_classes, activation='softmax')])
+
+def soften(probs, temperature):
+    # Probabilities at temperature T; log-probabilities stand in for logits (softmax ignores the offset)
+    logits = np.log(np.clip(probs, 1e-7, 1.0)) / temperature
+    logits -= logits.max(axis=1, keepdims=True)
+    soft = np.exp(logits)
+    return (soft / soft.sum(axis=1, keepdims=True)).astype(np.float32)
+
+def distillation_loss(n_classes, temperature, alpha):
+    # y_true packs [one-hot label | softened teacher probabilities]; y_pred is the student's softmax output
+    import tensorflow as tf
+
+    def loss(y_true, y_pred):
+        hard, soft = y_true[:, :n_classes], y_true[:, n_classes:]
+        log_p = tf.math.log(tf.clip_by_value(y_pred, 1e-7, 1.0))
+        ce = -tf.reduce_sum(hard * log_p, axis=1)
+        student_log_soft = tf.nn.log_softmax(log_p / temperature, axis=1)
+        kl = tf.reduce_sum(soft * (tf.math.log(tf.clip_by_value(soft, 1e-7, 1.0)) - student_log_soft), axis=1)
+        return alpha * ce + (1 - alpha) * temperature ** 2 * kl
+    return loss
+
+def packed_accuracy(n_classes):
+    import tensorflow as tf
+
+    def accuracy(y_true, y_pred):
+        return tf.cast(tf.equal(tf.argmax(y_true[:, :n_classes], axis=1), tf.argmax(y_pred, axis=1)), tf.float32)
+    return accuracy
+
+def evaluate(model, X, y):
+    from downsample import model_flops, single_window_latency
+    pred = np.argmax(model.predict(X, batch_size=256, verbose=0), axis=1)
+    return {
+        'test_accuracy': float(np.mean(pred == y)),
+        'params': int(model.count_params()),
+        'flops_per_window': model_flops(model),
+        'latency_ms': single_window_latency(model, X[0]),
+    }
+
+def train_student(kind, data, n_classes, args, distill=True):
+    from tensorflow.keras.callbacks import EarlyStopping
+    from tensorflow.keras.optimizers import Adam
+    (X_fit, y_fit, soft_fit), (X_val, y_val, soft_val) = data['fit'], data['val']
+    eye = np.eye(n_classes, dtype=np.float32)
+    alpha = args.alpha if distill else 1.0
+    model = build_student(kind, X_fit.shape[1:], n_classes, X_fit)
+    model.compile(optimizer=Adam(learning_rate=args.learning_rate),
+                  loss=distillation_loss(n_classes, args.temperature, alpha), metrics=[packed_accuracy(n_classes)])
+    es = EarlyStopping(monitor='val_loss', patience=args.patience, restore_best_weights=True)
+    start = time.perf_counter()
+    history = model.fit(X_fit, np.concatenate([eye[y_fit], soft_fit], axis=1), epochs=args.epochs,
+                        batch_size=args.batch_size, callbacks=[es], verbose=0,
+                        validation_data=(X_val, np.concatenate([eye[y_val], soft_val], axis=1)))
+    train_s = time.perf_counter() - start
+    # Recompiled with the standard loss so the saved file loads anywhere without the custom objects
+    model.compile(optimizer=Adam(learning_rate=args.learning_rate), loss='categorical_crossentropy',
+                  metrics=['accuracy'])
+    return model, {'epochs_run': len(history.history['val_loss']), 'train_s': train_s}
+
+def main(argv=None):
+    import tensorflow as tf
+    from tensorflow.keras.models import load_model
+    from inference import load_preprocessing
+    from splits import DEFAULT_SPLIT, grouped_holdout
+    from tensor_cache import split_arrays
+    parser = argparse.ArgumentParser(description='Distil the trained motion CNN into smaller, faster students.')
+    parser.add_argument('--students', nargs='+', choices=STUDENTS, default=STUDENTS)
+    parser.add_argument('--teacher', default=TEACHER_PATH)
+    parser.add_argument('--temperature', type=float, default=TEMPERATURE)
+    parser.add_argument('--alpha', type=float, default=ALPHA, help='Weight of the true-label loss (1 = no teacher)')
+    parser.add_argument('--epochs', type=int, default=EPOCHS)
+    parser.add_argument('--patience', type=int, default=PATIENCE)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--learning-rate', type=float, default=LEARNING_RATE)
+    parser.add_argument('--baseline', action='store_true', help='Also train each student without the teacher')
+    parser.add_argument('--split', default=DEFAULT_SPLIT)
+    parser.add_argument('--fold', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--output-dir', default=STUDENT_DIR)
+    parser.add_argument('--output', default=REPORT_PATH)
+    args = parser.parse_args(argv)
+
+    config = load_preprocessing()
+    if config['gravity'] != 'window':
+        print(f"The teacher was trained with --gravity {config['gravity']}; distillation reads per-window "
+              'filtered windows, so retrain the teacher with --gravity window first')
+        return 1
+    tf.keras.utils.set_random_seed(args.seed)
+    X, y, classes = split_arrays('train', args.split, args.fold)
+    X_test, y_test, _ = split_arrays('test', args.split, args.fold)
+    X_test = np.asarray(X_test)
+    teacher = load_model(args.teacher)
+    if teacher.output_shape[-1] != len(classes):
+        print(f'{args.teacher} predicts {teacher.output_shape[-1]} classes but split {args.split} has {len(classes)}')
+        return 1
+    # Teacher targets are computed once for all students
+    fit_pos, val_pos = grouped_holdout('train', args.split, args.fold, VAL_RATIO, args.seed)
+    data = {}
+    for part, pos in (('fit', fit_pos), ('val', val_pos)):
+        X_part = np.asarray(X[pos])
+        data[part] = (X_part, np.asarray(y[pos]), soften(teacher.predict(X_part, batch_size=256, verbose=0),
+                                                         args.temperature))
+
+    rows = [dict(name='teacher', path=args.teacher, **evaluate(teacher, X_test, y_test))]
+    print(f"Teacher: {rows[0]['test_accuracy']*100:.2f}% test accuracy, {rows[0]['params']} params, "
+          f"{rows[0]['flops_per_window']} FLOPs, {rows[0]['latency_ms']:.2f} ms per window")
+    os.makedirs(args.output_dir, exist_ok=True)
+    runs = [(kind, True) for kind in args.students] + [(kind, False) for kind in args.students if args.baseline]
+    for kind, distill in runs:
+        name = kind if distill else f'{kind}-labels-only'
+        print(f'Training student {name}...')
+        model, stats = train_student(kind, data, len(classes), args, distill)
+        path = os.path.join(args.output_dir, f'{name}.keras')
+        model.save(path)
+        row = dict(name=name, path=path, distilled=distill, **evaluate(model, X_test, y_test), **stats)
+        rows.append(row)
+        print(f"  {row['test_accuracy']*100:.2f}% test accuracy after {row['epochs_run']} epochs, saved as {path}")
+
+    teacher_row = rows[0]
+    print(f"\n{'model':<24} {'accuracy':>9} {'of teacher':>10} {'params':>8} {'FLOPs':>10} {'of teacher':>10} {'latency':>9}")
+    for row in rows:
+        row['accuracy_retained'] = row['test_accuracy'] / max(teacher_row['test_accuracy'], 1e-12)
+        row['flops_fraction'] = row['flops_per_window'] / max(teacher_row['flops_per_window'], 1)
+        print(f"{row['name']:<24} {row['test_accuracy']*100:>8.2f}% {row['accuracy_retained']*100:>9.1f}% "
+              f"{row['params']:>8} {row['flops_per_window']:>10} {row['flops_fraction']*100:>9.1f}% "
+              f"{row['latency_ms']:>7.2f}ms")
+    settings = {k: v for k, v in vars(args).items() if k not in ('output', 'output_dir')}
+    with open(args.output, 'w') as f:
+        json.dump({'classes': list(classes), 'settings': settings, 'results': rows}, f, indent=2)
+    print(f'Report saved as {args.output}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,159 @@
+import sys
+import json
+import time
+import argparse
+from fractions import Fraction
+import numpy as np
+from scipy.signal import resample_poly
+
+# Usage: python downsample.py [--rates 100 50 25] [--epochs 15] [--output downsample_report.json]
+#
+# Anti-aliased resampling of the 100 Hz sensor data to lower rates, and a report of model accuracy,
+# size and latency per rate. Windows keep their duration: a 1-second window is 100 samples at 100 Hz
+# and 25 samples at 25 Hz.
+
+SOURCE_RATE = 100
+RATES = [100, 50, 25]
+REPORT_PATH = 'downsample_report.json'
+GRAVITY_ALPHA = 0.8  # preprocessing.remove_gravity default, tuned for 100 Hz
+
+def resample_factors(target_rate, source_rate=SOURCE_RATE):
+    ratio = Fraction(int(target_rate), int(source_rate))
+    return ratio.numerator, ratio.denominator
+
+def resample(samples, target_rate, source_rate=SOURCE_RATE, axis=0):
+    # Polyphase resampling: a Kaiser-windowed FIR low-pass removes everything above the new Nyquist
+    # frequency before decimation, so fast motion does not alias into the remaining band.
+    # axis=0 for one recording (T, C); axis=1 resamples a whole batch of windows (N, T, C) in one call.
+    samples = np.asarray(samples, dtype=np.float32)
+    if target_rate == source_rate:
+        return samples
+    up, down = resample_factors(target_rate, source_rate)
+    # 'line' padding extends the signal along its trend, which keeps the constant gravity offset
+    # from ringing at the edges
+    return resample_poly(samples, up, down, axis=axis, padtype='line').astype(np.float32)
+
+def resample_windows(windows, target_rate, source_rate=SOURCE_RATE):
+    return resample(windows, target_rate, source_rate, axis=1)
+
+def scale_length(n_samples, rate, source_rate=SOURCE_RATE):
+    # Sample count covering the same duration at another rate
+    return max(1, n_samples * rate // source_rate)
+
+def gravity_alpha(rate, alpha=GRAVITY_ALPHA, source_rate=SOURCE_RATE):
+    # Same low-pass time constant for the gravity estimate at a lower rate
+    return float(alpha ** (source_rate / rate))
+
+def store_rate(store):
+    return (store.meta.get('config') or {}).get('sample_rate', SOURCE_RATE)
+
+def model_flops(model):
+    # Multiply-adds x2 of the convolution and Dense layers for one window; other layers are negligible
+    flops = 0
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind == 'Conv1D':
+            out_len, filters = layer.output.shape[1], layer.filters
+            flops += 2 * out_len * layer.kernel_size[0] * layer.input.shape[-1] * filters
+        elif kind in ('SeparableConv1D', 'DepthwiseConv1D'):
+            # Depthwise pass per input channel, then (separable only) a pointwise 1x1 mix into filters
+            out_len, channels = layer.output.shape[1], layer.input.shape[-1] * layer.depth_multiplier
+            flops += 2 * out_len * layer.kernel_size[0] * channels
+            if kind == 'SeparableConv1D':
+                flops += 2 * out_len * channels * layer.filters
+        elif kind == 'Dense':
+            flops += 2 * layer.input.shape[-1] * layer.units
+    return int(flops)
+
+def single_window_latency(model, window, repeats=50):
+    x = window[np.newaxis]
+    model(x, training=False)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model(x, training=False)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times) * 1000)
+
+def evaluate_rate(rate, recordings, labels, names, classes, test_recordings, epochs, seed):
+    from sklearn.model_selection import train_test_split
+    from tensorflow.keras.callbacks import EarlyStopping
+    from tensorflow.keras.utils import to_categorical
+    from preprocessing import remove_gravity_batch
+    from train_model import BATCH_SIZE, build_cnn_model
+    from windowing import RecordingWindows, STEP_SIZE, WINDOW_SIZE
+
+    start = time.perf_counter()
+    resampled = [resample(r, rate) for r in recordings]
+    resample_s = time.perf_counter() - start
+    windows = RecordingWindows(resampled, labels, names, classes,
+                               scale_length(WINDOW_SIZE, rate), scale_length(STEP_SIZE, rate))
+    X = remove_gravity_batch(windows.batch(np.arange(len(windows))), gravity_alpha(rate))
+    y = windows.labels
+    is_test = np.isin(windows.recording_ids, test_recordings)
+    X_train, X_val, y_train, y_val = train_test_split(X[~is_test], y[~is_test], test_size=0.2, random_state=seed)
+
+    model = build_cnn_model(X.shape[1:], len(classes), X_train)
+    es = EarlyStopping(monitor='val_loss', patience=3, restore_best_weights=True)
+    start = time.perf_counter()
+    model.fit(X_train, to_categorical(y_train, len(classes)), epochs=epochs, batch_size=BATCH_SIZE,
+              validation_data=(X_val, to_categorical(y_val, len(classes))), callbacks=[es], verbose=0)
+    train_s = time.perf_counter() - start
+    pred = np.argmax(model.predict(X[is_test], batch_size=256, verbose=0), axis=1)
+    return {
+        'rate_hz': rate,
+        'window_samples': int(X.shape[1]),
+        'bytes_per_second': rate * X.shape[2] * 4,
+        'windows': len(windows),
+        'test_windows': int(is_test.sum()),
+        'test_accuracy': float(np.mean(pred == y[is_test])),
+        'params': int(model.count_params()),
+        'flops_per_window': model_flops(model),
+        'latency_ms': single_window_latency(model, X[0]),
+        'resample_s': resample_s,
+        'train_s': train_s,
+    }
+
+def accuracy_report(rates=RATES, epochs=15, seed=42, output=REPORT_PATH):
+    import tensorflow as tf
+    from splits import grouped_split
+    from windowing import RAW_ROOT, RecordingWindows, ingest_recordings
+
+    tf.keras.utils.set_random_seed(seed)
+    cached, _ = ingest_recordings(RAW_ROOT)
+    names = list(cached)
+    classes = sorted({n.split('/', 1)[0] for n in names})
+    labels = [classes.index(n.split('/', 1)[0]) for n in names]
+    recordings = [cached[n] for n in names]
+    # Hold out the same whole recordings at every rate, so only the rate differs between rows
+    full = RecordingWindows(recordings, labels, names, classes)
+    test_recordings = np.unique(full.recording_ids[grouped_split(full.recording_ids, full.labels, seed=seed)['test']])
+
+    rows = []
+    for rate in rates:
+        print(f'Training at {rate} Hz...')
+        row = evaluate_rate(rate, recordings, labels, names, classes, test_recordings, epochs, seed)
+        rows.append(row)
+        print(f"  {row['test_accuracy']*100:.2f}% test accuracy, {row['flops_per_window']} FLOPs, "
+              f"{row['latency_ms']:.2f} ms per window")
+    print(f"\n{'rate':>6} {'samples':>8} {'accuracy':>9} {'params':>8} {'FLOPs':>10} {'latency':>9} {'bytes/s':>8}")
+    for row in rows:
+        print(f"{row['rate_hz']:>4}Hz {row['window_samples']:>8} {row['test_accuracy']*100:>8.2f}% {row['params']:>8} "
+              f"{row['flops_per_window']:>10} {row['latency_ms']:>7.2f}ms {row['bytes_per_second']:>8}")
+    with open(output, 'w') as f:
+        json.dump({'source_rate_hz': SOURCE_RATE, 'epochs': epochs, 'seed': seed, 'results': rows}, f, indent=2)
+    print(f'Report saved as {output}')
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare model accuracy, size and latency at lower sample rates.')
+    parser.add_argument('--rates', type=int, nargs='+', default=RATES)
+    parser.add_argument('--epochs', type=int, default=15)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=REPORT_PATH)
+    args = parser.parse_args(argv)
+    accuracy_report(args.rates, args.epochs, args.seed, args.output)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
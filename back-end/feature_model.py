@@ -0,0 +1,203 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+# Usage: python feature_model.py train [--kind gbm|logreg] [--output feature_model.joblib]
+#        python feature_model.py benchmark [--cnn cnn_motion_model.keras] [--output feature_model_report.json]
+#
+# Second inference engine next to the CNN: a small fixed feature vector per window, computed for a whole
+# batch at once, classified by gradient boosting or logistic regression (scikit-learn).
+# Features per gravity-filtered window (the CNN's input), FEATURES_PER_WINDOW in total:
+#   per channel   mean, std, min, max, zero crossings (of the mean-removed signal, per second), and the
+#                 log energy in each of BANDS (Hz) from one batched rFFT
+#   accelerometer and gyroscope signal magnitude area (mean of |x| + |y| + |z|)
+# Trained on the same windows as train_model.py: the train side of the split, or data/train without one.
+# Those windows are gravity-filtered one by one, so the model is saved with gravity 'window' and
+# inference.model_input filters every window it serves on its own, also when the CNN next to it is a
+# --gravity recording model served stream-filtered windows.
+# FeatureClassifier has the predict()/input_shape interface of a Keras model, so predict_window, app.py
+# (per request or as the overload fallback, see inference.EngineSelector) and model_zoo.py use it as is.
+
+FEATURE_MODEL_PATH = 'feature_model.joblib'
+REPORT_PATH = 'feature_model_report.json'
+DATA_DIR = 'data/train'
+TEST_DIR = 'data/test'
+RATE = 100
+BANDS = [(0.0, 1.0), (1.0, 2.0), (2.0, 3.0), (3.0, 5.0), (5.0, 8.0), (8.0, 12.0), (12.0, 20.0), (20.0, 50.0)]
+N_CHANNELS = 6
+FEATURES_PER_WINDOW = N_CHANNELS * (5 + len(BANDS)) + 2
+KINDS = ['gbm', 'logreg']
+SEED = 42
+
+def window_features(X, rate=RATE):
+    # (N, T, 6) windows -> (N, FEATURES_PER_WINDOW) float32 features
+    X = np.asarray(X, dtype=np.float32)
+    n, length = X.shape[:2]
+    mean = X.mean(axis=1)
+    centered = X - mean[:, None, :]
+    crossings = np.count_nonzero(np.diff(np.signbit(centered), axis=1), axis=1) * (rate / length)
+    power = np.abs(np.fft.rfft(centered, axis=1)) ** 2
+    freqs = np.fft.rfftfreq(length, 1.0 / rate)
+    bands = [power[:, (freqs >= lo) & (freqs < hi)].sum(axis=1) for lo, hi in BANDS]
+    sma = np.abs(X).reshape(n, length, 2, 3).sum(axis=3).mean(axis=1)
+    return np.concatenate([mean, X.std(axis=1), X.min(axis=1), X.max(axis=1), crossings,
+                           np.log1p(np.concatenate(bands, axis=1) / length), sma], axis=1).astype(np.float32)
+
+def make_estimator(kind, seed=SEED):
+    from sklearn.ensemble import HistGradientBoostingClassifier
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+    # Balanced class weights, the counterpart of the CNN's class balancing
+    if kind == 'gbm':
+        return HistGradientBoostingClassifier(max_iter=200, learning_rate=0.1, class_weight='balanced', random_state=seed)
+    if kind == 'logreg':
+        return make_pipeline(StandardScaler(), LogisticRegression(max_iter=2000, class_weight='balanced'))
+    raise ValueError(f"Unknown classifier '{kind}'; choose from {', '.join(KINDS)}")
+
+class FeatureClassifier:
+    def __init__(self, estimator, classes, kind, window_size=100, rate=RATE, gravity='window'):
+        from downsample import gravity_alpha
+        self.estimator = estimator
+        self.classes = list(classes)
+        self.kind = kind
+        self.rate = rate
+        self.input_shape = (None, window_size, N_CHANNELS)
+        # How the training windows were gravity-filtered (see inference.model_input)
+        self.gravity = gravity
+        self.gravity_alpha = gravity_alpha(rate)
+
+    @classmethod
+    def fit(cls, X, y, classes, kind='gbm', rate=RATE, seed=SEED):
+        estimator = make_estimator(kind, seed).fit(window_features(X, rate), np.asarray(y))
+        return cls(estimator, classes, kind, X.shape[1], rate)
+
+    def predict(self, x, batch_size=None, verbose=0):
+        # Class probabilities in self.classes order, also for classes missing from the training data
+        probs = self.estimator.predict_proba(window_features(x, self.rate))
+        out = np.zeros((len(probs), len(self.classes)), dtype=np.float32)
+        out[:, self.estimator.classes_] = probs
+        return out
+
+    def __call__(self, x, training=False):
+        return self.predict(x)
+
+    def count_params(self):
+        # Coefficients of the linear model, or tree nodes of the boosted ensemble
+        if self.kind == 'logreg':
+            linear = self.estimator[-1]
+            return int(linear.coef_.size + linear.intercept_.size)
+        return int(sum(tree.nodes.size for trees in self.estimator._predictors for tree in trees))
+
+    def save(self, path=FEATURE_MODEL_PATH):
+        # Saved as plain fields, so the file does not depend on where this class is imported from
+        import joblib
+        joblib.dump({'estimator': self.estimator, 'classes': self.classes, 'kind': self.kind,
+                     'window_size': self.input_shape[1], 'rate': self.rate, 'gravity': self.gravity}, path)
+        return path
+
+def load_feature_model(path=FEATURE_MODEL_PATH):
+    import joblib
+    return FeatureClassifier(**joblib.load(path))
+
+def window_arrays(part, split, fold=0, gravity=True):
+    # Gravity-filtered (X, y, classes) from the split like train_model.py / test_model.py, else the CSV folders;
+    # the raw windows with gravity False
+    from splits import load_split_windows, split_exists
+    from tensor_cache import csv_window_arrays, split_arrays
+    if split_exists(split):
+        X, y, classes = split_arrays(part, split, fold) if gravity else load_split_windows(part, split, fold)
+        return np.asarray(X), np.asarray(y), classes
+    with open('class_labels.json', 'r') as f:
+        classes = json.load(f)
+    X, y = csv_window_arrays(DATA_DIR if part == 'train' else TEST_DIR, classes, alpha=0.8 if gravity else None)
+    return np.asarray(X), np.asarray(y), classes
+
+def microseconds_per_window(model, X, repeats=200):
+    # (single window, batched over X), both median-of-repeats / one full pass
+    x = X[:1]
+    model.predict(x, verbose=0)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.predict(x, verbose=0)
+        times.append(time.perf_counter() - start)
+    model.predict(X, batch_size=256, verbose=0)
+    start = time.perf_counter()
+    model.predict(X, batch_size=256, verbose=0)
+    return float(np.median(times) * 1e6), (time.perf_counter() - start) * 1e6 / len(X)
+
+def benchmark(args):
+    from inference import load_inference_model, load_preprocessing, model_inputs
+    X, y, classes = window_arrays('train', args.split, args.fold)
+    # Every engine is scored on the inputs it is served (inference.model_inputs): the CNN's per its
+    # preprocessing.json, the feature classifiers' filtered one by one with their own alpha
+    X_raw, y_test, _ = window_arrays('test', args.split, args.fold, gravity=False)
+    preprocessing = load_preprocessing()
+    alpha, filtered = preprocessing['alpha'], None
+    if preprocessing['gravity'] == 'recording' and os.path.exists(args.cnn):
+        from splits import split_exists
+        from tensor_cache import split_stream_windows
+        if not split_exists(args.split):
+            raise SystemExit(f'{args.cnn} was trained with --gravity recording; comparing it needs a split')
+        filtered, _, _ = split_stream_windows('test', args.split, args.fold, preprocessing)
+    engines = {}
+    for kind in KINDS:
+        start = time.perf_counter()
+        engines[f'features-{kind}'] = FeatureClassifier.fit(X, y, classes, kind, args.rate, args.seed)
+        print(f'Trained {kind} on {len(X)} windows in {time.perf_counter() - start:.1f}s')
+    if os.path.exists(args.cnn):
+        engines['cnn'] = load_inference_model(args.cnn)
+    rows = []
+    for name, model in engines.items():
+        X_test = model_inputs(model, X_raw, alpha, filtered)
+        pred = np.argmax(model.predict(X_test, batch_size=256, verbose=0), axis=1)
+        single_us, batched_us = microseconds_per_window(model, X_test)
+        rows.append({'engine': name, 'test_accuracy': float(np.mean(pred == y_test)), 'params': int(model.count_params()),
+                     'single_window_us': single_us, 'batched_us_per_window': batched_us})
+    X_test = model_inputs(engines[f'features-{KINDS[0]}'], X_raw)
+    start = time.perf_counter()
+    window_features(X_test, args.rate)
+    feature_us = (time.perf_counter() - start) * 1e6 / len(X_test)
+    print(f"\nFeature extraction: {feature_us:.1f} us per window (batched), {FEATURES_PER_WINDOW} features")
+    print(f"{'engine':<18} {'accuracy':>9} {'params':>8} {'single':>11} {'batched':>11}")
+    for r in rows:
+        print(f"{r['engine']:<18} {r['test_accuracy']*100:>8.2f}% {r['params']:>8} {r['single_window_us']:>8.0f} us "
+              f"{r['batched_us_per_window']:>8.1f} us")
+    with open(args.output, 'w') as f:
+        json.dump({'classes': list(classes), 'test_windows': len(X_raw), 'feature_us_per_window': feature_us,
+                   'results': rows}, f, indent=2)
+    print(f'Report saved as {args.output}')
+
+def main(argv=None):
+    from splits import DEFAULT_SPLIT
+    parser = argparse.ArgumentParser(description='Handcrafted-feature classifier, a fast second engine next to the CNN.')
+    parser.add_argument('command', choices=['train', 'benchmark'])
+    parser.add_argument('--kind', choices=KINDS, default='gbm')
+    parser.add_argument('--cnn', default='cnn_motion_model.keras', help='CNN compared against in benchmark')
+    parser.add_argument('--split', default=DEFAULT_SPLIT)
+    parser.add_argument('--fold', type=int, default=0)
+    parser.add_argument('--rate', type=int, default=RATE, help='Sample rate of the windows in Hz')
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--output', help=f'Model file for train ({FEATURE_MODEL_PATH}), report for benchmark '
+                                         f'({REPORT_PATH})')
+    args = parser.parse_args(argv)
+    if args.command == 'benchmark':
+        args.output = args.output or REPORT_PATH
+        benchmark(args)
+        return 0
+    X, y, classes = window_arrays('train', args.split, args.fold)
+    start = time.perf_counter()
+    model = FeatureClassifier.fit(X, y, classes, args.kind, args.rate, args.seed)
+    X_test, y_test, _ = window_arrays('test', args.split, args.fold)
+    accuracy = float(np.mean(np.argmax(model.predict(X_test), axis=1) == y_test)) if len(X_test) else float('nan')
+    path = model.save(args.output or FEATURE_MODEL_PATH)
+    print(f'{args.kind} on {FEATURES_PER_WINDOW} features, trained in {time.perf_counter() - start:.1f}s: '
+          f'{accuracy*100:.2f}% test accuracy; saved as {path}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,225 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+from concurrent.futures import as_completed
+import numpy as np
+from parallel import thread_limited_pool, threads_per_worker
+
+# Usage: python hparam_search.py run [--trials 24] [--workers 4] [--threads-per-trial N] [--epochs 30] [--study NAME]
+#        python hparam_search.py show [--study NAME] [--top 10]
+# Example: python hparam_search.py run --trials 40 --workers 6
+#
+# Random search over the training settings and CNN architecture of train_model.py. Trials run concurrently
+# in worker processes, each limited to a few CPU threads, on the train side of a split (validation is a
+# recording-grouped holdout inside it, so overlapping windows do not leak). Every trial stops early when
+# val_loss stalls, and is pruned when its best val_accuracy after PRUNE_WARMUP epochs is below the median of
+# the other trials at the same epoch. Params, val metrics, wall time, FLOPs and single-window latency of each
+# trial go into a SQLite database; `show` ranks them and lists the accuracy/latency Pareto front.
+
+DB_PATH = 'data/hparam_search.db'
+STUDY = 'default'
+SEED = 42
+EPOCHS = 30
+PATIENCE = 5
+PRUNE_WARMUP = 5
+PRUNE_MIN_TRIALS = 3
+VAL_RATIO = 0.2
+SPACE = {
+    'learning_rate': ('log', 1e-4, 3e-3),
+    'batch_size': [32, 64, 128],
+    'filters': [[16, 32], [32, 64], [64, 64], [32, 64, 64]],
+    'kernel_size': [3, 5, 7],
+    'dense': [32, 64, 128],
+    'dropout': [0.3, 0.5],
+}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS trials (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, study TEXT, params TEXT, status TEXT,
+    val_accuracy REAL, val_loss REAL, best_epoch INTEGER, epochs_run INTEGER,
+    wall_time_s REAL, latency_ms REAL, flops INTEGER, n_params INTEGER, error TEXT,
+    created REAL, finished REAL);
+CREATE TABLE IF NOT EXISTS trial_epochs (
+    trial_id INTEGER, epoch INTEGER, val_accuracy REAL, val_loss REAL, PRIMARY KEY (trial_id, epoch));
+'''
+
+def connect(path=DB_PATH):
+    # WAL lets the worker processes write epochs while others read them for pruning
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    db = sqlite3.connect(path, timeout=60)
+    db.execute('PRAGMA journal_mode=WAL')
+    db.executescript(SCHEMA)
+    return db
+
+def sample_params(rng):
+    params = {}
+    for name, choices in SPACE.items():
+        if isinstance(choices, tuple):
+            _, low, high = choices
+            params[name] = float(np.exp(rng.uniform(np.log(low), np.log(high))))
+        else:
+            params[name] = choices[int(rng.integers(len(choices)))]
+    return params
+
+def should_prune(db, study, trial_id, epoch, best):
+    if epoch < PRUNE_WARMUP:
+        return False
+    rows = db.execute('''
+        SELECT MAX(e.val_accuracy) FROM trial_epochs e JOIN trials t ON t.id = e.trial_id
+        WHERE t.study = ? AND e.trial_id != ? AND e.epoch <= ?
+        GROUP BY e.trial_id HAVING MAX(e.epoch) >= ?''', (study, trial_id, epoch, epoch)).fetchall()
+    return len(rows) >= PRUNE_MIN_TRIALS and best < float(np.median([r[0] for r in rows]))
+
+def run_trial(job):
+    # Worker process: one training run, reporting every epoch to the database
+    import tensorflow as tf
+    from tensorflow.keras.callbacks import Callback, EarlyStopping
+    from tensorflow.keras.utils import to_categorical
+    from downsample import model_flops, single_window_latency
+    from splits import grouped_holdout
+    from tensor_cache import split_arrays
+    from train_model import build_cnn_model
+
+    trial_id, params, study, db_path = job['trial_id'], job['params'], job['study'], job['db']
+    db = connect(db_path)
+    start = time.perf_counter()
+    db.execute("UPDATE trials SET status = 'running' WHERE id = ?", (trial_id,))
+    db.commit()
+    try:
+        tf.keras.utils.set_random_seed(job['seed'])
+        X, y, classes = split_arrays('train', job['split'], job['fold'])
+        train_pos, val_pos = grouped_holdout('train', job['split'], job['fold'], VAL_RATIO, SEED)
+        X_train, X_val = np.asarray(X[train_pos]), np.asarray(X[val_pos])
+        y_train = to_categorical(y[train_pos], num_classes=len(classes))
+        y_val = to_categorical(y[val_pos], num_classes=len(classes))
+
+        class Report(Callback):
+            def __init__(self):
+                super().__init__()
+                self.best = 0.0
+                self.pruned = False
+
+            def on_epoch_end(self, epoch, logs=None):
+                acc, loss = float(logs['val_accuracy']), float(logs['val_loss'])
+                self.best = max(self.best, acc)
+                db.execute('INSERT OR REPLACE INTO trial_epochs VALUES (?, ?, ?, ?)', (trial_id, epoch + 1, acc, loss))
+                db.commit()
+                if should_prune(db, study, trial_id, epoch + 1, self.best):
+                    self.pruned = True
+                    self.model.stop_training = True
+
+        report = Report()
+        model = build_cnn_model(X_train.shape[1:], len(classes), X_train, params['learning_rate'],
+                                filters=params['filters'], kernel_size=params['kernel_size'],
+                                dense=params['dense'], dropout=params['dropout'])
+        es = EarlyStopping(monitor='val_loss', patience=job['patience'], restore_best_weights=True)
+        history = model.fit(X_train, y_train, epochs=job['epochs'], batch_size=params['batch_size'],
+                            validation_data=(X_val, y_val), callbacks=[es, report], verbose=0)
+        val_loss, val_accuracy = model.evaluate(X_val, y_val, verbose=0)
+        result = {
+            'status': 'pruned' if report.pruned else 'complete',
+            'val_accuracy': float(val_accuracy),
+            'val_loss': float(val_loss),
+            'best_epoch': int(np.argmin(history.history['val_loss'])) + 1,
+            'epochs_run': len(history.history['val_loss']),
+            'wall_time_s': time.perf_counter() - start,
+            'latency_ms': single_window_latency(model, X_val[0]),
+            'flops': model_flops(model),
+            'n_params': int(model.count_params()),
+            'error': None,
+        }
+    except Exception as e:
+        result = {'status': 'failed', 'wall_time_s': time.perf_counter() - start, 'error': repr(e)}
+    columns = ', '.join(f'{k} = ?' for k in result)
+    db.execute(f'UPDATE trials SET {columns}, finished = ? WHERE id = ?', (*result.values(), time.time(), trial_id))
+    db.commit()
+    db.close()
+    return trial_id, result
+
+def run(args):
+    from tensor_cache import split_arrays
+    db = connect(args.db)
+    # Preprocessed once here; the workers then read the same cache entry through mmap
+    split_arrays('train', args.split, args.fold)
+    rng = np.random.default_rng([args.seed, db.execute('SELECT COUNT(*) FROM trials').fetchone()[0]])
+    jobs = []
+    for i in range(args.trials):
+        params = sample_params(rng)
+        cur = db.execute("INSERT INTO trials (study, params, status, created) VALUES (?, ?, 'queued', ?)",
+                         (args.study, json.dumps(params), time.time()))
+        jobs.append({'trial_id': cur.lastrowid, 'params': params, 'study': args.study, 'db': args.db,
+                     'split': args.split, 'fold': args.fold, 'epochs': args.epochs, 'patience': args.patience,
+                     'seed': args.seed + i})
+    db.commit()
+    threads = args.threads_per_trial or threads_per_worker(args.workers)
+    print(f'{len(jobs)} trials in study {args.study}, {args.workers} at a time with {threads} thread(s) each')
+    start = time.perf_counter()
+    with thread_limited_pool(args.workers, threads) as pool:
+        for future in as_completed([pool.submit(run_trial, job) for job in jobs]):
+            trial_id, result = future.result()
+            if result['status'] == 'failed':
+                print(f"  trial {trial_id}: failed {result['error']}")
+            else:
+                print(f"  trial {trial_id}: {result['status']}, val_accuracy {result['val_accuracy']:.4f} after "
+                      f"{result['epochs_run']} epochs, {result['latency_ms']:.2f} ms/window, "
+                      f"{result['wall_time_s']:.0f}s")
+    print(f'Search finished in {time.perf_counter() - start:.0f}s')
+    show(args)
+
+def pareto_front(rows):
+    # Trials not beaten on both accuracy and latency by any other trial
+    front = []
+    for r in sorted(rows, key=lambda r: (r['latency_ms'], -r['val_accuracy'])):
+        if not front or r['val_accuracy'] > front[-1]['val_accuracy']:
+            front.append(r)
+    return front
+
+def show(args):
+    db = connect(args.db)
+    db.row_factory = sqlite3.Row
+    rows = [dict(r) for r in db.execute(
+        "SELECT * FROM trials WHERE study = ? AND status IN ('complete', 'pruned') ORDER BY val_accuracy DESC",
+        (args.study,))]
+    counts = dict(db.execute('SELECT status, COUNT(*) FROM trials WHERE study = ? GROUP BY status', (args.study,)).fetchall())
+    print(f"Study {args.study}: {', '.join(f'{n} {s}' for s, n in sorted(counts.items()))}")
+    for r in rows[:args.top]:
+        print(f"  #{r['id']:<4} val_acc {r['val_accuracy']:.4f}  {r['latency_ms']:.2f} ms  {r['flops'] / 1e6:.2f} MFLOPs  "
+              f"{r['wall_time_s']:.0f}s  {r['status']:<8} {r['params']}")
+    front = pareto_front([r for r in rows if r['status'] == 'complete'])
+    if front:
+        print('Accuracy/latency Pareto front:')
+        for r in front:
+            print(f"  #{r['id']:<4} val_acc {r['val_accuracy']:.4f}  {r['latency_ms']:.2f} ms")
+        best = json.loads(next(r for r in rows if r['status'] == 'complete')['params'])
+        print('Train the best trial with: python train_model.py '
+              f"--learning-rate {best['learning_rate']:.6g} --batch-size {best['batch_size']} "
+              f"--filters {' '.join(map(str, best['filters']))} --kernel-size {best['kernel_size']} "
+              f"--dense {best['dense']} --dropout {best['dropout']}")
+
+def main(argv=None):
+    from splits import DEFAULT_SPLIT
+    parser = argparse.ArgumentParser(description='Parallel hyperparameter search for the motion CNN.')
+    parser.add_argument('command', choices=['run', 'show'])
+    parser.add_argument('--study', default=STUDY)
+    parser.add_argument('--db', default=DB_PATH)
+    parser.add_argument('--trials', type=int, default=24)
+    parser.add_argument('--workers', type=int, default=4, help='Trials running at the same time')
+    parser.add_argument('--threads-per-trial', type=int, help='CPU threads per trial (default: cores / workers)')
+    parser.add_argument('--epochs', type=int, default=EPOCHS)
+    parser.add_argument('--patience', type=int, default=PATIENCE)
+    parser.add_argument('--split', default=DEFAULT_SPLIT)
+    parser.add_argument('--fold', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--top', type=int, default=10)
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        run(args)
+    else:
+        show(args)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,107 @@
+import json
+import threading
+from contextlib import contextmanager
+import numpy as np
+from tensorflow.keras.models import load_model
+from downsample import SOURCE_RATE, gravity_alpha, resample_windows
+from preprocessing import CONFIG_PATH, GRAVITY_ALPHA, load_config, remove_gravity_batch
+
+# Serving path shared by app.py (/predict) and replay.py, so both exercise the same code
+MODEL_PATH = 'cnn_motion_model.keras'
+CLASS_LABELS_PATH = 'class_labels.json'
+WINDOW_SIZE = 100
+N_CHANNELS = 6
+
+def load_classes(path=CLASS_LABELS_PATH):
+    # Always load class labels from class_labels.json for consistent mapping
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def load_inference_model(path=MODEL_PATH):
+    # A .npz is a sparse export of a pruned model (see sparse_model.py), run with NumPy/SciPy;
+    # a .joblib is the handcrafted-feature classifier (see feature_model.py)
+    if path.endswith('.npz'):
+        from sparse_model import SparseCNN
+        return SparseCNN(path)
+    if path.endswith('.joblib'):
+        from feature_model import load_feature_model
+        return load_feature_model(path)
+    return load_model(path)
+
+class EngineSelector:
+    # Picks the model for each request: the engine the request names, else the default (the CNN) unless
+    # max_busy requests are already running on it, in which case the fallback (the fast feature
+    # classifier) takes the request instead of queueing behind them
+    def __init__(self, engines, default='cnn', fallback=None, max_busy=4):
+        self.engines = engines
+        self.default = default
+        self.fallback = fallback if fallback in engines else None
+        self.max_busy = max_busy
+        self.busy = {name: 0 for name in engines}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def select(self, requested=None):
+        # Yields (engine name, model); raises ValueError for an unknown engine
+        if requested is not None and requested not in self.engines:
+            raise ValueError(f"Unknown engine '{requested}'; available: {', '.join(self.engines)}")
+        with self.lock:
+            name = requested or self.default
+            if requested is None and self.fallback and self.busy[name] >= self.max_busy:
+                name = self.fallback
+            self.busy[name] += 1
+        try:
+            yield name, self.engines[name]
+        finally:
+            with self.lock:
+                self.busy[name] -= 1
+
+def load_preprocessing(path=CONFIG_PATH):
+    # How the model's training windows were gravity-filtered (written by train_model.py)
+    return load_config(path)
+
+def stream_alpha(config, rate=SOURCE_RATE):
+    # The model's gravity filter constant for samples arriving at `rate` (live streams are aligned at 100 Hz)
+    return gravity_alpha(rate, config['alpha'], source_rate=config['sample_rate'])
+
+def input_length(model):
+    # Samples per window the model was trained on: WINDOW_SIZE at 100 Hz, fewer for lower-rate models
+    shape = getattr(model, 'input_shape', None)
+    return shape[1] if shape and shape[1] else WINDOW_SIZE
+
+def prepare_batch(windows, length=WINDOW_SIZE):
+    # Validate raw windows (N, rows, N_CHANNELS) of [AccX, AccY, AccZ, GyroX, GyroY, GyroZ] rows for a model taking
+    # `length` samples. A lower-rate model accepts either 1-second windows at its own rate or 100 Hz windows,
+    # which are resampled.
+    X = np.asarray(windows)
+    if X.shape[1:] == (WINDOW_SIZE, N_CHANNELS) and length != WINDOW_SIZE:
+        X = resample_windows(X, length * SOURCE_RATE // WINDOW_SIZE)
+    if X.shape[1:] != (length, N_CHANNELS):
+        raise ValueError(f'Input shape must be ({length}, {N_CHANNELS}), got {X.shape[1:]}')
+    return X
+
+def model_inputs(model, windows, alpha=GRAVITY_ALPHA, filtered=None):
+    # The model's (N, length, N_CHANNELS) inputs for a batch of raw windows. filtered holds the same windows cut from
+    # streams filtered as whole recordings (a per-session preprocessing.GravityFilter, for models trained with
+    # --gravity recording) and is used when the caller has it; models whose gravity attribute is 'window' (the
+    # feature classifier) always get the raw windows filtered one by one with their gravity_alpha, as they were trained
+    length = input_length(model)
+    if getattr(model, 'gravity', None) == 'window':
+        return remove_gravity_batch(prepare_batch(windows, length), getattr(model, 'gravity_alpha', alpha))
+    if filtered is not None:
+        return prepare_batch(filtered, length)
+    return remove_gravity_batch(prepare_batch(windows, length), alpha)
+
+def model_input(model, window, alpha=GRAVITY_ALPHA, filtered=None):
+    # model_inputs for one raw window, as /predict, /stream and replay.py serve it
+    return model_inputs(model, np.array(window)[np.newaxis], alpha,
+                        None if filtered is None else np.array(filtered)[np.newaxis])
+
+def predict_window(model, classes, window, alpha=GRAVITY_ALPHA, filtered=None):
+    pred = model.predict(model_input(model, window, alpha, filtered))
+    pred_class = int(np.argmax(pred))
+    return {
+        'prediction': classes[pred_class],
+        'confidence': float(np.max(pred)),
+        'probabilities': pred[0].tolist(),
+    }
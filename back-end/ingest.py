@@ -0,0 +1,114 @@
+import sys
+import time
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # optional: numpy's C reader is used instead
+    pa = None
+
+# Usage: python ingest.py <csv> [<csv> ...]
+#
+# Header-aware parsing of raw sensor recordings straight to float32 (N, 6):
+# AccX, AccY, AccZ, GyroX, GyroY, GyroZ (extra columns are ignored).
+# A header row is detected instead of being coerced to NaN, and rows that cannot be used
+# (too few columns, non-numeric or non-finite values) are reported with their line number
+# instead of being dropped silently.
+
+COLUMNS = ['AccX', 'AccY', 'AccZ', 'GyroX', 'GyroY', 'GyroZ']
+N_CHANNELS = len(COLUMNS)
+# Stored in the ingest stage config (windowing.INGEST_CONFIG); bump it when parsing results change
+READER_VERSION = 'header-aware-v1'
+PARSE_ERRORS = (ValueError, IndexError) + ((pa.ArrowInvalid,) if pa is not None else ())
+
+def _is_number(text):
+    try:
+        float(text)
+        return True
+    except ValueError:
+        return False
+
+def detect_header(path, columns=N_CHANNELS):
+    with open(path, 'r', newline='') as f:
+        first = f.readline()
+    fields = first.strip().split(',')
+    return bool(first.strip()) and not all(_is_number(x) for x in fields[:columns])
+
+def _read_pyarrow(path, header, columns, dtype):
+    read_options = pa_csv.ReadOptions(skip_rows=int(header), autogenerate_column_names=True)
+    names = [f'f{i}' for i in range(columns)]
+    convert_options = pa_csv.ConvertOptions(include_columns=names,
+                                            column_types={name: pa.from_numpy_dtype(dtype) for name in names})
+    table = pa_csv.read_csv(path, read_options=read_options, convert_options=convert_options)
+    samples = np.empty((table.num_rows, columns), dtype=dtype)
+    for i, name in enumerate(names):
+        samples[:, i] = table.column(name).to_numpy()
+    return samples
+
+def _read_numpy(path, header, columns, dtype):
+    samples = np.loadtxt(path, delimiter=',', skiprows=int(header), usecols=range(columns),
+                         dtype=dtype, ndmin=2)
+    return samples.reshape(-1, columns)
+
+def _read_tolerant(path, header, columns, dtype):
+    # Line-by-line fallback, only used when the fast readers reject the file
+    rows, lines, bad_rows = [], [], []
+    with open(path, 'r', newline='') as f:
+        for line_no, line in enumerate(f, start=1):
+            if line_no == 1 and header or not line.strip():
+                continue
+            fields = line.strip().split(',')
+            if len(fields) < columns:
+                bad_rows.append((line_no, f'{len(fields)} columns'))
+                continue
+            try:
+                rows.append([float(x) for x in fields[:columns]])
+                lines.append(line_no)
+            except ValueError:
+                bad_rows.append((line_no, 'non-numeric value'))
+    return np.array(rows, dtype=dtype).reshape(-1, columns), np.array(lines, dtype=np.int64), bad_rows
+
+def parse_recording(path, columns=N_CHANNELS, dtype=np.float32):
+    # Returns (samples, bad rows as [(line number, reason)], engine used).
+    # columns/dtype are only changed for other layouts, e.g. timestamped streams in alignment.py
+    header = detect_header(path, columns)
+    bad_rows = []
+    try:
+        if pa is not None:
+            samples, engine = _read_pyarrow(path, header, columns, dtype), 'pyarrow'
+        else:
+            samples, engine = _read_numpy(path, header, columns, dtype), 'numpy'
+        lines = np.arange(len(samples)) + 1 + header
+    except PARSE_ERRORS:
+        samples, lines, bad_rows = _read_tolerant(path, header, columns, dtype)
+        engine = 'tolerant'
+    # NaN/inf parse fine but are no usable samples either; one vectorized check over the whole file
+    finite = np.isfinite(samples).all(axis=1)
+    if not finite.all():
+        bad_rows += [(int(line), 'non-finite value') for line in lines[~finite]]
+        samples = samples[finite]
+    return np.ascontiguousarray(samples), sorted(bad_rows), engine
+
+def format_bad_rows(path, bad_rows, limit=5):
+    shown = ', '.join(f'line {line} ({reason})' for line, reason in bad_rows[:limit])
+    more = f' and {len(bad_rows) - limit} more' if len(bad_rows) > limit else ''
+    return f'{path}: skipped {len(bad_rows)} bad row(s): {shown}{more}'
+
+def main(argv=None):
+    paths = sys.argv[1:] if argv is None else argv
+    if not paths:
+        print('Usage: python ingest.py <csv> [<csv> ...]')
+        return 1
+    for path in paths:
+        start = time.perf_counter()
+        samples, bad_rows, engine = parse_recording(path)
+        elapsed = time.perf_counter() - start
+        print(f'{path}: {len(samples)} samples via {engine} in {elapsed * 1000:.1f} ms'
+              f"{', header detected' if detect_header(path) else ''}")
+        if bad_rows:
+            print('  ' + format_bad_rows(path, bad_rows))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+import time
+import hashlib
+import numpy as np
+import tensorflow as tf
+from preprocessing import remove_gravity_batch
+
+# tf.data input pipeline for training (train_model.py --tf-data), fed straight from a window source:
+# the mmapped window store (ArrayWindows over store.windows) or RecordingWindows over the raw recordings.
+# Only index lists live in memory; windows are read batch by batch, so memory stays bounded as data grows.
+#   deterministic  (no augmentation, no per-epoch class sampling): windows are gravity-filtered once into a
+#                  tensor_cache.py entry (content-keyed, filled chunk by chunk, evicted with the other
+#                  entries under its MAX_BYTES), read back in chunks (in shuffled chunk order) by parallel
+#                  map calls, then shuffled through a bounded window buffer, batched and prefetched
+#   per-epoch      (--augment or undersample/oversample): a generator yields each epoch's index batches
+#                  (a fresh sampler draw), and parallel map calls load, augment and gravity-filter them
+#                  with the same (epoch, batch) seeding as WindowBatches; prefetched as well
+# input_bound_report() times the pipeline alone against the training step alone.
+
+AUTOTUNE = tf.data.AUTOTUNE
+SHUFFLE_BUFFER = 4096
+LOAD_CHUNK = 256  # windows per mmap read in the deterministic pipeline
+
+def preprocessed_windows(windows, order, preprocess, cache, window_shape):
+    # {'X', 'y'} of the windows at order (sorted indices), preprocessed, as one mmapped tensor_cache entry.
+    # cache: {'source': content digests of the window source, 'config': preprocessing settings}
+    from tensor_cache import cached_streamed
+    config = dict(cache['config'], kind='tf-data', indices=hashlib.sha256(order.tobytes()).hexdigest())
+
+    def fill(out):
+        for start in range(0, len(order), LOAD_CHUNK):
+            idx = order[start:start + LOAD_CHUNK]
+            out['X'][start:start + len(idx)] = preprocess(windows.batch(idx))
+            out['y'][start:start + len(idx)] = windows.labels[idx]
+    specs = {'X': ((len(order), *window_shape), np.float32), 'y': ((len(order),), np.int64)}
+    return cached_streamed(cache['source'], config, specs, fill)
+
+def _finish_shapes(window_shape, n_classes):
+    def finish(X, y):
+        X.set_shape((None, *window_shape))
+        y.set_shape((None, n_classes))
+        return X, y
+    return finish
+
+class PipelinePosition:
+    # Epoch counter and shuffle RNG of a window_dataset. A resumed run (see checkpoint.py) builds it with the
+    # epoch it continues from and restores the RNG, so it does not replay the first epochs' order.
+    def __init__(self, seed=42, epoch=0):
+        self.seed = seed
+        self.epoch = epoch
+        self.rng = np.random.default_rng(seed)
+
+    def get_state(self):
+        return {'rng': self.rng.bit_generator.state}
+
+    def set_state(self, state):
+        self.rng.bit_generator.state = state['rng']
+
+def window_dataset(windows, indices, n_classes, batch_size, window_shape, alpha=0.8, shuffle=True, seed=42,
+                   sampler=None, augmenter=None, cache=None, shuffle_buffer=SHUFFLE_BUFFER, position=None):
+    # windows: anything with batch(indices) and labels (ArrayWindows, RecordingWindows); alpha=None when the
+    # source is already gravity-filtered (--gravity recording). cache: see preprocessed_windows
+    indices = np.asarray(indices, dtype=np.int64)
+    position = position or PipelinePosition(seed)
+    eye = np.eye(n_classes, dtype=np.float32)
+
+    def preprocess(X):
+        return X if alpha is None else remove_gravity_batch(X, alpha)
+
+    per_epoch = augmenter is not None or (sampler is not None and sampler.strategy in ('undersample', 'oversample'))
+    if not per_epoch:
+        order = np.sort(indices)
+        if cache:
+            arrays = preprocessed_windows(windows, order, preprocess, cache, window_shape)
+
+            def load(pos):
+                return np.asarray(arrays['X'][pos]), eye[arrays['y'][pos]]
+        else:
+            def load(pos):
+                idx = order[pos]
+                return preprocess(windows.batch(idx)), eye[windows.labels[idx]]
+        ds = tf.data.Dataset.from_tensor_slices(np.arange(len(order))).batch(LOAD_CHUNK)
+        if shuffle:
+            # Sorted order is class by class, recording by recording, so the chunks (only their positions, no
+            # data) are shuffled first: the bounded window buffer below then mixes chunks from all over the data
+            # instead of the first class's windows. tf.data's reshuffle sequence restarts with the dataset, so a
+            # resumed run shifts the seed instead
+            ds = ds.shuffle(-(-len(order) // LOAD_CHUNK), seed=seed + position.epoch, reshuffle_each_iteration=True)
+        ds = ds.map(lambda pos: tf.numpy_function(load, [pos], (tf.float32, tf.float32)), num_parallel_calls=AUTOTUNE)
+        ds = ds.map(_finish_shapes(window_shape, n_classes)).unbatch()
+        if shuffle:
+            ds = ds.shuffle(shuffle_buffer, seed=seed + position.epoch + 1, reshuffle_each_iteration=True)
+        ds = ds.batch(batch_size).apply(tf.data.experimental.assert_cardinality(-(-len(indices) // batch_size)))
+        return ds.prefetch(AUTOTUNE)
+
+    def batches():
+        # Runs once per epoch (Keras re-iterates the dataset), so the sampler draws anew every epoch
+        epoch = position.epoch
+        position.epoch += 1
+        if sampler is not None:
+            order = sampler.sample(indices)
+        else:
+            order = position.rng.permutation(indices) if shuffle else indices
+        for i, start in enumerate(range(0, len(order), batch_size)):
+            yield epoch, i, order[start:start + batch_size]
+
+    def load(e, i, idx):
+        if augmenter is not None:
+            key = augmenter.rng(int(e), int(i))
+            X = augmenter(augmenter.load(windows, idx, key), key)
+        else:
+            X = windows.batch(idx)
+        return preprocess(X), eye[windows.labels[idx]]
+
+    ds = tf.data.Dataset.from_generator(batches, output_signature=(
+        tf.TensorSpec((), tf.int64), tf.TensorSpec((), tf.int64), tf.TensorSpec((None,), tf.int64)))
+    ds = ds.map(lambda e, i, idx: tf.numpy_function(load, [e, i, idx], (tf.float32, tf.float32)),
+                num_parallel_calls=AUTOTUNE)
+    # Known length, so Keras starts a fresh pass (and sampler draw) every epoch
+    n_batches = -(-(sampler.sample_size(indices) if sampler is not None else len(indices)) // batch_size)
+    ds = ds.apply(tf.data.experimental.assert_cardinality(n_batches))
+    return ds.map(_finish_shapes(window_shape, n_classes)).prefetch(AUTOTUNE)
+
+def input_bound_report(dataset, model, steps=20):
+    # Batches/s of the input pipeline alone vs. the training step alone on one in-memory batch.
+    # With prefetching, training runs at about the slower of the two; input-bound when the pipeline is slower.
+    # The timed train steps change the weights and optimizer state, so both are restored afterwards.
+    it = iter(dataset)
+    X, y = next(it)
+    start, n = time.perf_counter(), 0
+    for _ in range(steps):
+        try:
+            next(it)
+        except StopIteration:
+            break
+        n += 1
+    input_s = (time.perf_counter() - start) / max(n, 1)
+    weights = model.get_weights()
+    optimizer_state = [v.numpy() for v in model.optimizer.variables]
+    try:
+        model.train_on_batch(X, y)
+        start = time.perf_counter()
+        for _ in range(steps):
+            model.train_on_batch(X, y)
+        step_s = (time.perf_counter() - start) / steps
+    finally:
+        model.set_weights(weights)
+        for variable, value in zip(model.optimizer.variables, optimizer_state):
+            variable.assign(value)
+    report = {
+        'input_ms_per_batch': input_s * 1000,
+        'step_ms_per_batch': step_s * 1000,
+        'input_bound': input_s > step_s,
+    }
+    print(f"Input pipeline {report['input_ms_per_batch']:.1f} ms/batch, training step {report['step_ms_per_batch']:.1f} "
+          f"ms/batch: {'input-bound' if report['input_bound'] else 'compute-bound'}")
+    return report
@@ -0,0 +1,136 @@
+import os
+import json
+import time
+import hashlib
+
+# Content-hash manifest for the data pipeline.
+# Every stage records the config it ran with and the digest of each input it consumed, so a rerun
+# only has to touch inputs that are new or changed and can drop outputs of inputs that disappeared.
+
+MANIFEST_PATH = 'data/window_store/manifest.json'
+
+def file_digest(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def config_digest(config):
+    return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+
+class Manifest:
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self.data = self._read()
+        self.touched = set()
+
+    def _read(self):
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        return {'files': {}, 'stages': {}}
+
+    def digest(self, path):
+        # Files whose size and mtime are unchanged keep their recorded hash, so unchanged
+        # recordings are not re-read just to find out they are unchanged
+        st = os.stat(path)
+        entry = self.data['files'].get(path)
+        if entry and entry['size'] == st.st_size and entry['mtime_ns'] == st.st_mtime_ns:
+            return entry['sha256']
+        sha = file_digest(path)
+        self.data['files'][path] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': sha}
+        return sha
+
+    def digests(self, named_paths):
+        # {input name: path} -> {input name: content hash}
+        return {name: self.digest(path) for name, path in named_paths.items()}
+
+    def stage(self, name):
+        return self.data['stages'].get(name)
+
+    def is_current(self, name, config, inputs):
+        stage = self.stage(name)
+        return bool(stage) and stage['config_hash'] == config_digest(config) and stage['inputs'] == inputs
+
+    def plan(self, name, config, inputs):
+        # Returns (changed, removed) input names; a different config makes every input changed
+        stage = self.stage(name)
+        if not stage or stage['config_hash'] != config_digest(config):
+            previous = stage['inputs'] if stage else {}
+            return sorted(inputs), sorted(set(previous) - set(inputs))
+        previous = stage['inputs']
+        changed = sorted(k for k, v in inputs.items() if previous.get(k) != v)
+        removed = sorted(set(previous) - set(inputs))
+        return changed, removed
+
+    def outputs(self, name, inputs=None):
+        # Output paths recorded per input (only stages that write per-input files record them)
+        stage = self.stage(name) or {}
+        recorded = stage.get('outputs', {})
+        keys = recorded.keys() if inputs is None else inputs
+        return [p for k in keys for p in recorded.get(k, [])]
+
+    def record(self, name, config, inputs, outputs=None):
+        stage = {'config': config, 'config_hash': config_digest(config), 'inputs': dict(inputs)}
+        if outputs is not None:
+            stage['outputs'] = {k: v for k, v in outputs.items() if k in inputs}
+        self.data['stages'][name] = stage
+        self.touched.add(name)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        # Stages may run concurrently (see pipeline.py), so merge our records into the file on disk
+        # under a lock instead of overwriting what other processes recorded meanwhile
+        with FileLock(self.path + '.lock'):
+            data = self._read()
+            data['files'].update(self.data['files'])
+            for name in self.touched:
+                data['stages'][name] = self.data['stages'][name]
+            # Drop stat-cache entries for files that no longer exist
+            data['files'] = {p: e for p, e in data['files'].items() if os.path.exists(p)}
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        self.data = data
+
+class FileLock:
+    # Minimal cross-platform lock file; stale locks older than `stale` seconds are broken
+    def __init__(self, path, timeout=60, stale=300):
+        self.path = path
+        self.timeout = timeout
+        self.stale = stale
+
+    def __enter__(self):
+        deadline = time.time() + self.timeout
+        while True:
+            try:
+                fd = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode())
+                os.close(fd)
+                return self
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.path) > self.stale:
+                        os.remove(self.path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.time() > deadline:
+                    raise TimeoutError(f'Could not acquire {self.path}')
+                time.sleep(0.05)
+
+    def __exit__(self, *exc):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+def remove_outputs(paths):
+    removed = 0
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+            removed += 1
+    return removed
@@ -0,0 +1,152 @@
+import os
+import sys
+import glob
+import json
+import time
+import resource
+import argparse
+import numpy as np
+from parallel import thread_limited_pool, threads_per_worker
+
+# Usage: python model_zoo.py [--models a.keras b.npz ...] [--threads N] [--batch-size 256] [--tolerance 0.01]
+#                            [--output model_zoo_report.json]
+# Example: python model_zoo.py --models cnn_motion_model.keras students/single.keras --threads 1
+#
+# Benchmarks every candidate model artifact on this machine: the checked-in best_model.h5 and
+# cnn_motion_model.keras, the feature classifier (feature_model.py) plus whatever distill.py (students/),
+# prune.py (pruned/, .keras and sparse .npz) and --models add. Each model is measured in its own fresh
+# process, one after another with the same thread count, so load time and memory are not skewed by the
+# models measured before it:
+#   accuracy on the test side of the split (per-window gravity filtering, as in train_model.py),
+#   single-window latency, batched throughput (model.predict over the test set), load time through
+#   inference.load_inference_model, peak resident memory above the process baseline, and artifact size.
+# The report marks the accuracy/latency/memory Pareto front and recommends the fastest model within
+# --tolerance of the best accuracy, instead of picking on accuracy alone.
+
+DEFAULT_MODELS = ['best_model.h5', 'cnn_motion_model.keras', 'feature_model.joblib']
+CANDIDATE_GLOBS = ['students/*.keras', 'pruned/*.keras', 'pruned/*.npz']
+REPORT_PATH = 'model_zoo_report.json'
+BATCH_SIZE = 256
+TOLERANCE = 0.01
+
+def candidate_models(extra=()):
+    paths = [p for p in DEFAULT_MODELS if os.path.exists(p)]
+    for pattern in CANDIDATE_GLOBS:
+        paths += sorted(glob.glob(pattern))
+    paths += [p for p in extra if p not in paths]
+    return paths
+
+def artifact_bytes(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+    return os.path.getsize(path)
+
+def peak_rss_mb():
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def measure(job):
+    # Worker process (fresh for every model): everything except the model is loaded before the baseline
+    import tensorflow  # noqa: F401  imported before the baseline so only the model counts as its memory
+    from tensorflow.keras import Model
+    from downsample import model_flops, single_window_latency
+    from inference import input_length, load_inference_model
+    from tensor_cache import split_arrays
+
+    path = job['path']
+    X, y, classes = split_arrays('test', job['split'], job['fold'])
+    X, y = np.asarray(X), np.asarray(y)
+    baseline_mb = peak_rss_mb()
+    row = {'path': path, 'artifact_bytes': artifact_bytes(path)}
+    try:
+        start = time.perf_counter()
+        model = load_inference_model(path)
+        row['load_s'] = time.perf_counter() - start
+        if input_length(model) != X.shape[1] or model.predict(X[:1], verbose=0).shape[-1] != len(classes):
+            raise ValueError(f'expects {input_length(model)}-sample windows / another class count than split '
+                             f"{job['split']} ({X.shape[1]} samples, {len(classes)} classes)")
+        model.predict(X[:job['batch_size']], batch_size=job['batch_size'], verbose=0)
+        start = time.perf_counter()
+        pred = np.argmax(model.predict(X, batch_size=job['batch_size'], verbose=0), axis=1)
+        predict_s = time.perf_counter() - start
+        row.update({
+            'status': 'ok',
+            'test_accuracy': float(np.mean(pred == y)),
+            'latency_ms': single_window_latency(model, X[0]),
+            'throughput_windows_per_s': len(X) / predict_s,
+            'peak_memory_mb': peak_rss_mb() - baseline_mb,
+            'params': int(model.count_params()),
+            'flops_per_window': model_flops(model) if isinstance(model, Model) else None,
+        })
+    except Exception as e:
+        row.update({'status': 'failed', 'error': repr(e)})
+    return row
+
+def pareto_front(rows):
+    # Models that no other model beats on accuracy, latency and memory at once
+    def dominates(a, b):
+        no_worse = (a['test_accuracy'] >= b['test_accuracy'] and a['latency_ms'] <= b['latency_ms']
+                    and a['peak_memory_mb'] <= b['peak_memory_mb'])
+        better = (a['test_accuracy'] > b['test_accuracy'] or a['latency_ms'] < b['latency_ms']
+                  or a['peak_memory_mb'] < b['peak_memory_mb'])
+        return no_worse and better
+    return [r for r in rows if not any(dominates(o, r) for o in rows if o is not r)]
+
+def recommend(rows, tolerance=TOLERANCE):
+    # Fastest model whose accuracy is within tolerance of the best one
+    best = max(r['test_accuracy'] for r in rows)
+    return min((r for r in rows if r['test_accuracy'] >= best - tolerance), key=lambda r: r['latency_ms'])
+
+def print_report(rows, front, pick):
+    print(f"\n  {'model':<36} {'accuracy':>9} {'latency':>9} {'windows/s':>10} {'memory':>9} {'load':>7} {'size':>9}")
+    for r in sorted(rows, key=lambda r: -r['test_accuracy']):
+        mark = '*' if r in front else ' '
+        print(f"{mark} {r['path']:<36} {r['test_accuracy']*100:>8.2f}% {r['latency_ms']:>7.2f}ms "
+              f"{r['throughput_windows_per_s']:>10.0f} {r['peak_memory_mb']:>7.1f}MB {r['load_s']:>6.2f}s "
+              f"{r['artifact_bytes'] / 1024:>7.0f}KB")
+    print('* accuracy/latency/memory Pareto front')
+    print(f"Recommended: {pick['path']} ({pick['test_accuracy']*100:.2f}%, {pick['latency_ms']:.2f} ms per window)")
+
+def main(argv=None):
+    from splits import DEFAULT_SPLIT
+    parser = argparse.ArgumentParser(description='Benchmark candidate models for accuracy, latency and memory.')
+    parser.add_argument('--models', nargs='+', default=[], help='Artifacts to add to the default candidates')
+    parser.add_argument('--only', action='store_true', help='Benchmark only --models')
+    parser.add_argument('--threads', type=int, default=threads_per_worker(1), help='CPU threads per model')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, help='Accuracy given up for speed')
+    parser.add_argument('--split', default=DEFAULT_SPLIT)
+    parser.add_argument('--fold', type=int, default=0)
+    parser.add_argument('--output', default=REPORT_PATH)
+    args = parser.parse_args(argv)
+
+    from tensor_cache import split_arrays
+    # Preprocessed once here, so no worker spends its measurements building the cache entry
+    split_arrays('test', args.split, args.fold)
+    paths = args.models if args.only else candidate_models(args.models)
+    print(f'{len(paths)} models, {args.threads} thread(s) each')
+    rows = []
+    with thread_limited_pool(1, args.threads, max_tasks_per_child=1) as pool:
+        for path in paths:
+            row = pool.submit(measure, {'path': path, 'split': args.split, 'fold': args.fold,
+                                        'batch_size': args.batch_size}).result()
+            rows.append(row)
+            if row['status'] == 'ok':
+                print(f"  {path}: {row['test_accuracy']*100:.2f}%, {row['latency_ms']:.2f} ms per window, "
+                      f"{row['throughput_windows_per_s']:.0f} windows/s")
+            else:
+                print(f"  {path}: failed {row['error']}")
+    ok = [r for r in rows if r['status'] == 'ok']
+    report = {'split': args.split, 'fold': args.fold, 'threads': args.threads, 'batch_size': args.batch_size,
+              'results': rows}
+    if ok:
+        front, pick = pareto_front(ok), recommend(ok, args.tolerance)
+        print_report(ok, front, pick)
+        report.update({'pareto_front': [r['path'] for r in front], 'recommended': pick['path']})
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Report saved as {args.output}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+import os
+import time
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from thread_config import BLAS_ENV_VARS
+
+# Process pool helpers for the data preparation scripts.
+# Results always come back in input order, so outputs are identical for any worker count.
+
+def default_workers():
+    return os.cpu_count() or 1
+
+def parallel_map(func, items, workers=None, desc='items', report_every=2.0):
+    # func must be a module-level function so it can be sent to worker processes
+    items = list(items)
+    workers = default_workers() if workers is None else max(1, workers)
+    workers = min(workers, len(items)) or 1
+    start = time.perf_counter()
+    last_report = start
+    results = []
+    if workers == 1:
+        iterator = map(func, items)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        iterator = executor.map(func, items, chunksize=max(1, len(items) // (workers * 8)))
+    try:
+        for result in iterator:
+            results.append(result)
+            now = time.perf_counter()
+            if now - last_report >= report_every and len(results) < len(items):
+                last_report = now
+                print(f"  {desc}: {len(results)}/{len(items)} ({len(results) / (now - start):.1f}/s)", flush=True)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    elapsed = time.perf_counter() - start
+    rate = len(items) / elapsed if elapsed > 0 else float('inf')
+    print(f"  {desc}: {len(items)} done in {elapsed:.2f}s with {workers} worker(s) ({rate:.1f}/s)", flush=True)
+    return results
+
+def add_workers_argument(parser):
+    parser.add_argument('--workers', type=int, default=default_workers(),
+                        help='Number of worker processes (default: all cores)')
+
+def _limit_tf_threads(threads):
+    from thread_config import set_tf_threads
+    set_tf_threads(threads, 1)
+
+@contextmanager
+def thread_limited_pool(workers, threads_per_worker, tensorflow=True, max_tasks_per_child=None):
+    # Process pool for concurrent training jobs, each capped at threads_per_worker CPU threads so the
+    # jobs share the cores instead of oversubscribing them. Workers are spawned (not forked) fresh
+    # processes; the BLAS/OpenMP limits are passed through the environment because they only apply
+    # before numpy loads, and TensorFlow's pools are sized in the worker initializer before first use.
+    # max_tasks_per_child=1 gives every job a fresh process (e.g. to measure its memory on its own).
+    saved = {var: os.environ.get(var) for var in BLAS_ENV_VARS}
+    for var in BLAS_ENV_VARS:
+        os.environ[var] = str(threads_per_worker)
+    initializer, initargs = (_limit_tf_threads, (threads_per_worker,)) if tensorflow else (None, ())
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=initializer, initargs=initargs, max_tasks_per_child=max_tasks_per_child)
+    try:
+        yield executor
+    finally:
+        executor.shutdown()
+        for var, value in saved.items():
+            if value is None:
+                os.environ.pop(var, None)
+            else:
+                os.environ[var] = value
+
+def threads_per_worker(workers):
+    return max(1, default_workers() // max(1, workers))
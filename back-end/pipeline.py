@@ -0,0 +1,199 @@
+import os
+import sys
+import time
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from manifest import Manifest, config_digest
+from parallel import default_workers
+from sampling import STRATEGIES
+from splits import DEFAULT_SPLIT, split_path
+from window_store import store_path
+from windowing import RAW_ROOT, RECORDING_CACHE, INGEST_CONFIG, recording_inputs, ingest_recordings
+
+# Usage: python pipeline.py run [stage ...] [--force stage ...] [--jobs N] [--workers N]
+#        python pipeline.py status
+# Example: python pipeline.py run train --epochs 20
+#
+# Runs the data and model pipeline as a stage graph:
+#   ingest -> segment
+#   ingest -> window -> split -> train -> evaluate
+# Each stage is cached under a key made of its config, its script and the keys of the stages it
+# depends on (ingest: the content hashes of data/all_data), so a run only executes stale stages.
+# Stages whose dependencies are done run concurrently, e.g. segment and window.
+
+PIPELINE_STATE_PATH = 'data/window_store/pipeline.json'
+PYTHON = sys.executable
+
+class Stage:
+    def __init__(self, name, deps, config, run, outputs, code=(), sources=None):
+        self.name = name
+        self.deps = deps
+        self.config = config
+        self.run = run          # command line (list) or in-process callable
+        self.outputs = outputs  # paths that must exist for a cached result to count
+        self.code = list(code)  # scripts whose changes invalidate the stage
+        self.sources = sources  # callable returning digests of external inputs
+
+def build_stages(args, state):
+    workers = ['--workers', str(args.workers)]
+    return [
+        Stage('ingest', [], {'root': RAW_ROOT, **INGEST_CONFIG},
+              lambda: ingest_recordings(RAW_ROOT, workers=args.workers),
+              [RECORDING_CACHE], ['windowing.py'],
+              sources=lambda: state.digests(recording_inputs(RAW_ROOT))),
+        Stage('segment', ['ingest'], {'samples_per_second': 100},
+              [PYTHON, 'break_1sec.py', *workers],
+              [store_path('all_data_1sec')], ['break_1sec.py']),
+        Stage('window', ['ingest'], {'window_size': args.window_size, 'step': args.step, 'rate': args.rate},
+              [PYTHON, 'break_overlap.py', '--window-size', str(args.window_size), '--step', str(args.step),
+               '--rate', str(args.rate), *workers],
+              [store_path('all_data_overlap')], ['break_overlap.py', 'downsample.py']),
+        Stage('split', ['window'], {'train_ratio': args.train_ratio},
+              [PYTHON, 'break_training_testing.py', '--train-ratio', str(args.train_ratio), '--force'],
+              [split_path(DEFAULT_SPLIT)], ['break_training_testing.py', 'splits.py']),
+        Stage('train', ['split'],
+              {'epochs': args.epochs, 'batch_size': args.batch_size, 'learning_rate': args.learning_rate,
+               'balance': args.balance, 'augment': args.augment},
+              [PYTHON, 'train_model.py', '--epochs', str(args.epochs), '--batch-size', str(args.batch_size),
+               '--learning-rate', str(args.learning_rate), '--balance', args.balance,
+               *(['--augment'] if args.augment else [])],
+              ['cnn_motion_model.keras', 'class_labels.json'],
+              ['train_model.py', 'preprocessing.py', 'sampling.py', 'augment.py']),
+        Stage('evaluate', ['train', 'split'], {},
+              [PYTHON, 'test_model.py'],
+              ['test_confusion_matrix.png'], ['test_model.py']),
+    ]
+
+def stage_keys(stages, state):
+    keys = {}
+    for stage in stages:
+        inputs = {dep: keys[dep] for dep in stage.deps}
+        inputs['code'] = {path: state.digest(path) for path in stage.code if os.path.exists(path)}
+        if stage.sources:
+            inputs['sources'] = config_digest(stage.sources())
+        keys[stage.name] = config_digest({'config': stage.config, 'inputs': inputs})
+    return keys
+
+def is_fresh(stage, key, state):
+    return state.is_current(stage.name, stage.config, {'key': key}) and all(os.path.exists(p) for p in stage.outputs)
+
+def needed_stages(stages, targets):
+    by_name = {s.name: s for s in stages}
+    needed, todo = set(), list(targets)
+    while todo:
+        name = todo.pop()
+        if name not in needed:
+            needed.add(name)
+            todo.extend(by_name[name].deps)
+    return [s for s in stages if s.name in needed]
+
+def plan(stages, keys, state, force=()):
+    # A stage runs when its cache entry is missing or outdated, when forced, or when anything upstream runs
+    to_run = set()
+    for stage in stages:
+        if stage.name in force or not is_fresh(stage, keys[stage.name], state) \
+                or any(dep in to_run for dep in stage.deps):
+            to_run.add(stage.name)
+    return to_run
+
+def run_stage(stage):
+    start = time.perf_counter()
+    if callable(stage.run):
+        stage.run()
+        ok = True
+    else:
+        # Plots are only saved to files when stages run unattended
+        env = dict(os.environ, MPLBACKEND='Agg')
+        proc = subprocess.Popen(stage.run, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=env)
+        for line in proc.stdout:
+            print(f'[{stage.name}] {line.rstrip()}', flush=True)
+        ok = proc.wait() == 0
+    return ok, time.perf_counter() - start
+
+def run_pipeline(stages, keys, state, to_run, jobs):
+    done = {s.name for s in stages if s.name not in to_run}
+    pending = [s for s in stages if s.name in to_run]
+    timings, failed = {}, None
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        running = {}
+        while pending or running:
+            if failed is None:
+                for stage in list(pending):
+                    if all(dep in done for dep in stage.deps):
+                        print(f'>>> {stage.name}', flush=True)
+                        running[executor.submit(run_stage, stage)] = stage
+                        pending.remove(stage)
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                try:
+                    ok, elapsed = future.result()
+                except Exception as e:
+                    print(f'[{stage.name}] {e}', flush=True)
+                    ok, elapsed = False, 0.0
+                timings[stage.name] = elapsed
+                if ok:
+                    done.add(stage.name)
+                    state.record(stage.name, stage.config, {'key': keys[stage.name]})
+                    state.save()
+                    print(f'<<< {stage.name} done in {elapsed:.1f}s', flush=True)
+                elif failed is None:
+                    failed = stage.name
+                    print(f'!!! {stage.name} failed, not starting further stages', flush=True)
+    return failed, timings
+
+def print_status(stages, keys, state):
+    for stage in stages:
+        status = 'fresh' if is_fresh(stage, keys[stage.name], state) else 'stale'
+        deps = ', '.join(stage.deps) or '-'
+        print(f'{stage.name:<10} {status:<6} deps: {deps}')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run the motion data/model pipeline, executing only stale stages.')
+    parser.add_argument('command', choices=['run', 'status'])
+    parser.add_argument('targets', nargs='*', help='Stages to bring up to date (default: all)')
+    parser.add_argument('--force', nargs='+', default=[], metavar='STAGE', help='Rerun these stages regardless of cache')
+    parser.add_argument('--jobs', type=int, default=2, help='Maximum number of stages running at once')
+    parser.add_argument('--workers', type=int, default=default_workers(), help='Worker processes per data stage')
+    parser.add_argument('--window-size', type=int, default=100)
+    parser.add_argument('--step', type=int, default=50)
+    parser.add_argument('--rate', type=int, default=100, help='Sample rate in Hz the windows are resampled to')
+    parser.add_argument('--train-ratio', type=float, default=0.75)
+    parser.add_argument('--epochs', type=int, default=75)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--learning-rate', type=float, default=0.0001)
+    parser.add_argument('--balance', choices=STRATEGIES, default='undersample')
+    parser.add_argument('--augment', action='store_true', help='Train with on-the-fly augmentation')
+    args = parser.parse_args(argv)
+
+    state = Manifest(PIPELINE_STATE_PATH)
+    stages = build_stages(args, state)
+    names = [s.name for s in stages]
+    unknown = [t for t in args.targets + args.force if t not in names]
+    if unknown:
+        parser.error(f"unknown stage(s) {', '.join(unknown)}; stages are {', '.join(names)}")
+    stages = needed_stages(stages, args.targets or names)
+    keys = stage_keys(stages, state)
+
+    if args.command == 'status':
+        print_status(stages, keys, state)
+        return 0
+
+    to_run = plan(stages, keys, state, set(args.force))
+    if not to_run:
+        print('Everything is up to date.')
+        return 0
+    print(f"Stale stages: {', '.join(s.name for s in stages if s.name in to_run)}")
+    start = time.perf_counter()
+    failed, timings = run_pipeline(stages, keys, state, to_run, args.jobs)
+    state.save()
+    summary = ', '.join(f'{name} {t:.1f}s' for name, t in timings.items())
+    print(f"Pipeline {'failed at ' + failed if failed else 'finished'} in {time.perf_counter() - start:.1f}s ({summary})")
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,18 +1,28 @@
-import sys
+import argparse
 import pandas as pd
+import matplotlib
+# Plots are only saved to files, and a non-interactive backend is safe in worker processes
+matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import os
+from ingest import COLUMNS, format_bad_rows, parse_recording
+from parallel import add_workers_argument, parallel_map
 
-# Usage: python plot_raw_data.py <csv_file>
+# Usage: python plot_raw_data.py <csv_file ...|base_dir> [--workers N]
 # Example: python plot_raw_data.py data/all_data_1sec/Run/Run_1_sec9_ovl1.csv
 
+def read_sensor_frame(csv_path):
+    # Header rows are detected, so the axes stay numeric for both raw recordings and window files
+    samples, bad_rows, _ = parse_recording(csv_path)
+    if bad_rows:
+        print(format_bad_rows(csv_path, bad_rows))
+    return pd.DataFrame(samples, columns=COLUMNS)
+
 def plot_csv(csv_path):
-    df = pd.read_csv(csv_path, header=None)
-    if df.shape[1] < 6:
-        print(f"File {csv_path} does not have at least 6 columns.")
+    df = read_sensor_frame(csv_path)
+    if df.empty:
+        print(f"File {csv_path} has no usable sensor rows.")
         return
-    df = df.iloc[:, [0,1,2,3,4,5]]
-    df.columns = ['AccX', 'AccY', 'AccZ', 'GyroX', 'GyroY', 'GyroZ']
     t = range(len(df))
     plt.figure(figsize=(12, 6))
     plt.subplot(2,1,1)
@@ -37,96 +47,108 @@ def plot_csv(csv_path):
     print(f"Saved plot to {png_path}")
     plt.close()
 
-def plot_one_csv_per_activity(base_dir):
-    activities = [d for d in os.listdir(base_dir) if os.path.isdir(os.path.join(base_dir, d))]
-    for activity in activities:
-        activity_dir = os.path.join(base_dir, activity)
-        csv_files = [f for f in os.listdir(activity_dir) if f.endswith('.csv')]
-        if not csv_files:
-            print(f"No CSV files found for {activity}")
-            continue
-        csv_path = os.path.join(activity_dir, csv_files[0])
-        df = pd.read_csv(csv_path, header=None)
-        if df.shape[1] < 6:
-            print(f"File {csv_path} does not have at least 6 columns.")
+def list_activities(base_dir):
+    return sorted(d for d in os.listdir(base_dir) if os.path.isdir(os.path.join(base_dir, d)))
+
+def plot_activity_example(job):
+    base_dir, activity = job
+    activity_dir = os.path.join(base_dir, activity)
+    csv_files = [f for f in os.listdir(activity_dir) if f.endswith('.csv')]
+    if not csv_files:
+        print(f"No CSV files found for {activity}")
+        return None
+    csv_path = os.path.join(activity_dir, sorted(csv_files)[0])
+    df = read_sensor_frame(csv_path)
+    if df.empty:
+        print(f"File {csv_path} has no usable sensor rows.")
+        return None
+    t = range(len(df))
+    plt.figure(figsize=(12, 6))
+    plt.subplot(2,1,1)
+    plt.plot(t, df['AccX'], label='AccX')
+    plt.plot(t, df['AccY'], label='AccY')
+    plt.plot(t, df['AccZ'], label='AccZ')
+    plt.title(f'Accelerometer - {activity}')
+    plt.ylabel('Acceleration')
+    plt.legend()
+    plt.subplot(2,1,2)
+    plt.plot(t, df['GyroX'], label='GyroX')
+    plt.plot(t, df['GyroY'], label='GyroY')
+    plt.plot(t, df['GyroZ'], label='GyroZ')
+    plt.title(f'Gyroscope - {activity}')
+    plt.ylabel('Angular Velocity')
+    plt.xlabel('Sample (1/100s)')
+    plt.legend()
+    plt.tight_layout()
+    plt.suptitle(f'Activity: {activity}', y=1.02, fontsize=16)
+    # Save plot as PNG in the activity directory
+    png_path = os.path.join(activity_dir, f'{activity}_example.png')
+    plt.savefig(png_path)
+    print(f"Saved plot to {png_path}")
+    plt.close()
+    return png_path
+
+def plot_one_csv_per_activity(base_dir, workers=None):
+    jobs = [(base_dir, activity) for activity in list_activities(base_dir)]
+    return parallel_map(plot_activity_example, jobs, workers, desc='activity examples')
+
+def plot_activity_overlay(job):
+    base_dir, activity, out_dir = job
+    activity_dir = os.path.join(base_dir, activity)
+    csv_files = [f for f in os.listdir(activity_dir) if f.endswith('.csv')]
+    if len(csv_files) < 1:
+        print(f"No CSV files found for {activity}")
+        return None
+    # Take up to 6 files
+    csv_files = sorted(csv_files)[:6]
+    acc_fig, acc_ax = plt.subplots(figsize=(12, 4))
+    gyro_fig, gyro_ax = plt.subplots(figsize=(12, 4))
+    for i, csv_file in enumerate(csv_files):
+        csv_path = os.path.join(activity_dir, csv_file)
+        df = read_sensor_frame(csv_path)
+        if df.empty:
+            print(f"File {csv_path} has no usable sensor rows.")
             continue
-        df = df.iloc[:, [0,1,2,3,4,5]]
-        df.columns = ['AccX', 'AccY', 'AccZ', 'GyroX', 'GyroY', 'GyroZ']
         t = range(len(df))
-        plt.figure(figsize=(12, 6))
-        plt.subplot(2,1,1)
-        plt.plot(t, df['AccX'], label='AccX')
-        plt.plot(t, df['AccY'], label='AccY')
-        plt.plot(t, df['AccZ'], label='AccZ')
-        plt.title(f'Accelerometer - {activity}')
-        plt.ylabel('Acceleration')
-        plt.legend()
-        plt.subplot(2,1,2)
-        plt.plot(t, df['GyroX'], label='GyroX')
-        plt.plot(t, df['GyroY'], label='GyroY')
-        plt.plot(t, df['GyroZ'], label='GyroZ')
-        plt.title(f'Gyroscope - {activity}')
-        plt.ylabel('Angular Velocity')
-        plt.xlabel('Sample (1/100s)')
-        plt.legend()
-        plt.tight_layout()
-        plt.suptitle(f'Activity: {activity}', y=1.02, fontsize=16)
-        # Save plot as PNG in the activity directory
-        png_path = os.path.join(activity_dir, f'{activity}_example.png')
-        plt.savefig(png_path)
-        print(f"Saved plot to {png_path}")
-        plt.close()
+        acc_ax.plot(t, df['AccX'], alpha=0.7, label=f'AccX_{i+1}' if i==0 else None)
+        acc_ax.plot(t, df['AccY'], alpha=0.7, label=f'AccY_{i+1}' if i==0 else None)
+        acc_ax.plot(t, df['AccZ'], alpha=0.7, label=f'AccZ_{i+1}' if i==0 else None)
+        gyro_ax.plot(t, df['GyroX'], alpha=0.7, label=f'GyroX_{i+1}' if i==0 else None)
+        gyro_ax.plot(t, df['GyroY'], alpha=0.7, label=f'GyroY_{i+1}' if i==0 else None)
+        gyro_ax.plot(t, df['GyroZ'], alpha=0.7, label=f'GyroZ_{i+1}' if i==0 else None)
+    acc_ax.set_title(f'Accelerometer - {activity} (6 samples overlay)')
+    acc_ax.set_ylabel('Acceleration')
+    acc_ax.legend(['AccX', 'AccY', 'AccZ'])
+    gyro_ax.set_title(f'Gyroscope - {activity} (6 samples overlay)')
+    gyro_ax.set_ylabel('Angular Velocity')
+    gyro_ax.set_xlabel('Sample (1/100s)')
+    gyro_ax.legend(['GyroX', 'GyroY', 'GyroZ'])
+    acc_fig.tight_layout()
+    gyro_fig.tight_layout()
+    acc_png_path = os.path.join(out_dir, f'{activity}_acc_overlay.png')
+    gyro_png_path = os.path.join(out_dir, f'{activity}_gyro_overlay.png')
+    acc_fig.savefig(acc_png_path)
+    gyro_fig.savefig(gyro_png_path)
+    print(f"Saved overlay plots to {acc_png_path} and {gyro_png_path}")
+    plt.close(acc_fig)
+    plt.close(gyro_fig)
+    return acc_png_path, gyro_png_path
 
-def plot_overlay_per_activity(base_dir, out_dir):
-    activities = [d for d in os.listdir(base_dir) if os.path.isdir(os.path.join(base_dir, d))]
-    for activity in activities:
-        activity_dir = os.path.join(base_dir, activity)
-        csv_files = [f for f in os.listdir(activity_dir) if f.endswith('.csv')]
-        if len(csv_files) < 1:
-            print(f"No CSV files found for {activity}")
-            continue
-        # Take up to 6 files
-        csv_files = csv_files[:6]
-        acc_fig, acc_ax = plt.subplots(figsize=(12, 4))
-        gyro_fig, gyro_ax = plt.subplots(figsize=(12, 4))
-        for i, csv_file in enumerate(csv_files):
-            csv_path = os.path.join(activity_dir, csv_file)
-            df = pd.read_csv(csv_path, header=None)
-            if df.shape[1] < 6:
-                print(f"File {csv_path} does not have at least 6 columns.")
-                continue
-            df = df.iloc[:, [0,1,2,3,4,5]]
-            df.columns = ['AccX', 'AccY', 'AccZ', 'GyroX', 'GyroY', 'GyroZ']
-            t = range(len(df))
-            acc_ax.plot(t, df['AccX'], alpha=0.7, label=f'AccX_{i+1}' if i==0 else None)
-            acc_ax.plot(t, df['AccY'], alpha=0.7, label=f'AccY_{i+1}' if i==0 else None)
-            acc_ax.plot(t, df['AccZ'], alpha=0.7, label=f'AccZ_{i+1}' if i==0 else None)
-            gyro_ax.plot(t, df['GyroX'], alpha=0.7, label=f'GyroX_{i+1}' if i==0 else None)
-            gyro_ax.plot(t, df['GyroY'], alpha=0.7, label=f'GyroY_{i+1}' if i==0 else None)
-            gyro_ax.plot(t, df['GyroZ'], alpha=0.7, label=f'GyroZ_{i+1}' if i==0 else None)
-        acc_ax.set_title(f'Accelerometer - {activity} (6 samples overlay)')
-        acc_ax.set_ylabel('Acceleration')
-        acc_ax.legend(['AccX', 'AccY', 'AccZ'])
-        gyro_ax.set_title(f'Gyroscope - {activity} (6 samples overlay)')
-        gyro_ax.set_ylabel('Angular Velocity')
-        gyro_ax.set_xlabel('Sample (1/100s)')
-        gyro_ax.legend(['GyroX', 'GyroY', 'GyroZ'])
-        acc_fig.tight_layout()
-        gyro_fig.tight_layout()
-        acc_png_path = os.path.join(out_dir, f'{activity}_acc_overlay.png')
-        gyro_png_path = os.path.join(out_dir, f'{activity}_gyro_overlay.png')
-        acc_fig.savefig(acc_png_path)
-        gyro_fig.savefig(gyro_png_path)
-        print(f"Saved overlay plots to {acc_png_path} and {gyro_png_path}")
-        plt.close(acc_fig)
-        plt.close(gyro_fig)
+def plot_overlay_per_activity(base_dir, out_dir, workers=None):
+    # One activity per worker process; outputs are reported in activity order
+    jobs = [(base_dir, activity, out_dir) for activity in list_activities(base_dir)]
+    return parallel_map(plot_activity_overlay, jobs, workers, desc='activity overlays')
 
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print('Usage: python plot_raw_data.py <csv_file|base_dir>')
-        sys.exit(1)
-    if os.path.isdir(sys.argv[1]):
+    parser = argparse.ArgumentParser(description='Plot raw sensor recordings.')
+    parser.add_argument('paths', nargs='+', help='One or more CSV files, or a base dir with activity folders')
+    add_workers_argument(parser)
+    args = parser.parse_args()
+    if os.path.isdir(args.paths[0]):
+        base_dir = args.paths[0].rstrip('/')
         # Save overlays in data/ folder
-        plot_overlay_per_activity(sys.argv[1], os.path.join(os.path.dirname(sys.argv[1]), ''))
+        plot_overlay_per_activity(base_dir, os.path.join(os.path.dirname(base_dir), ''), args.workers)
+    elif len(args.paths) == 1:
+        plot_csv(args.paths[0])
     else:
-        plot_csv(sys.argv[1])
+        parallel_map(plot_csv, args.paths, args.workers, desc='plots')
@@ -0,0 +1,82 @@
+import os
+import json
+import numpy as np
+from scipy.signal import lfilter
+
+# Preprocessing shared by training, evaluation and the window store loaders
+
+GRAVITY_ALPHA = 0.8
+# How a model's training windows were gravity-filtered, written next to class_labels.json:
+#   window     the filter restarts at every window (remove_gravity_batch), as the window store is used
+#   recording  the filter runs over whole recordings before windowing, as a live stream is filtered
+GRAVITY_MODES = ['window', 'recording']
+CONFIG_PATH = 'preprocessing.json'
+
+# Gravity removal: high-pass filter (exponential moving average)
+def remove_gravity(df, alpha=GRAVITY_ALPHA):
+    gravity = np.zeros((df.shape[0], 3))
+    filtered = np.zeros((df.shape[0], 3))
+    for i in range(df.shape[0]):
+        if i == 0:
+            gravity[i] = df.iloc[i, 0:3]
+        else:
+            gravity[i] = alpha * gravity[i-1] + (1 - alpha) * df.iloc[i, 0:3]
+        filtered[i] = df.iloc[i, 0:3] - gravity[i]
+    # Replace AccX, AccY, AccZ with gravity-free values
+    df_filtered = df.copy()
+    df_filtered.iloc[:, 0:3] = filtered
+    return df_filtered
+
+# Same filter as remove_gravity, applied to a whole (N, WINDOW_SIZE, N_CHANNELS) batch at once.
+# The loop runs over the time axis only, so the cost per window is a handful of vector ops.
+def remove_gravity_batch(windows, alpha=GRAVITY_ALPHA):
+    windows = np.asarray(windows, dtype=np.float32)
+    out = windows.copy()
+    acc = windows[:, :, 0:3]
+    gravity = acc[:, 0].copy()
+    out[:, 0, 0:3] = 0.0
+    for i in range(1, windows.shape[1]):
+        gravity = alpha * gravity + (1 - alpha) * acc[:, i]
+        out[:, i, 0:3] = acc[:, i] - gravity
+    return out
+
+# The same filter as a stateful object for continuous streams: the gravity estimate is carried from one
+# call to the next, so each hop only filters its new samples (one lfilter call over the hop) and there is
+# no restart transient at window boundaries. Feeding a recording in any number of chunks gives exactly
+# remove_gravity_recording() of the whole recording.
+class GravityFilter:
+    def __init__(self, alpha=GRAVITY_ALPHA):
+        self.alpha = alpha
+        self.gravity = None
+
+    def reset(self):
+        self.gravity = None
+
+    def __call__(self, samples):
+        samples = np.asarray(samples, dtype=np.float32)
+        if not len(samples):
+            return samples.copy()
+        acc = samples[:, 0:3].astype(np.float64)
+        # gravity[i] = alpha * gravity[i-1] + (1 - alpha) * acc[i], started at gravity[0] = acc[0]
+        previous = acc[0] if self.gravity is None else self.gravity
+        gravity, _ = lfilter([1 - self.alpha], [1, -self.alpha], acc, axis=0, zi=self.alpha * previous[None, :])
+        self.gravity = gravity[-1]
+        out = samples.copy()
+        out[:, 0:3] = acc - gravity
+        return out
+
+def remove_gravity_recording(samples, alpha=GRAVITY_ALPHA):
+    # Offline equivalent of GravityFilter: one continuous (N, N_CHANNELS) recording, filtered before windowing
+    return GravityFilter(alpha)(samples)
+
+def save_config(gravity, alpha, rate, path=CONFIG_PATH):
+    with open(path, 'w') as f:
+        json.dump({'gravity': gravity, 'alpha': alpha, 'sample_rate': rate}, f)
+
+def load_config(path=CONFIG_PATH):
+    # Models trained before the file existed used per-window filtering at 100 Hz
+    config = {'gravity': 'window', 'alpha': GRAVITY_ALPHA, 'sample_rate': 100}
+    if os.path.exists(path):
+        with open(path, 'r') as f:
+            config.update(json.load(f))
+    return config
@@ -0,0 +1,199 @@
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+# Usage: python prune.py [--model cnn_motion_model.keras] [--sparsities 0.5 0.75 0.9 0.95] [--finetune-epochs 4]
+#                        [--batch-sizes 1 32 256] [--output prune_report.json]
+# Example: python prune.py --sparsities 0.8 0.9 0.95 0.98
+#
+# Iterative magnitude pruning of a trained build_cnn_model CNN. For each target sparsity in turn, the
+# smallest-magnitude weights of the hidden Dense layer (the Flatten -> Dense(128) kernel holds almost all
+# parameters) and of the Conv1D kernels are zeroed, then the model is fine-tuned with the zeros held in place
+# after every batch. Pruned weights stay pruned, so each level starts from the previous one.
+# Every level is saved twice to PRUNED_DIR: a .keras model (dense zeros, a drop-in for the current serving
+# path) and a sparse .npz export (sparse_model.py, CSR kernels) that load_inference_model() also serves.
+# The benchmark times Keras, the NumPy export with dense kernels and the CSR export at each batch size and
+# lists parameter memory, so it shows whether the zeros actually buy latency or memory on this machine.
+
+MODEL_PATH = 'cnn_motion_model.keras'
+PRUNED_DIR = 'pruned'
+REPORT_PATH = 'prune_report.json'
+SPARSITIES = [0.5, 0.75, 0.9, 0.95]
+# Conv kernels are small and every weight is reused at each time step, so they are pruned less
+CONV_SPARSITY_SCALE = 0.5
+FINETUNE_EPOCHS = 4
+PATIENCE = 2
+LEARNING_RATE = 1e-4
+VAL_RATIO = 0.2
+BATCH_SIZES = [1, 32, 256]
+REPEATS = 30
+SEED = 42
+
+def prunable_layers(model):
+    # Conv1D layers and every Dense layer but the classifier
+    dense = [layer for layer in model.layers if type(layer).__name__ == 'Dense']
+    return [layer for layer in model.layers
+            if type(layer).__name__ == 'Conv1D' or (type(layer).__name__ == 'Dense' and layer is not dense[-1])]
+
+def layer_sparsity(layer, target):
+    return target * CONV_SPARSITY_SCALE if type(layer).__name__ == 'Conv1D' else target
+
+def magnitude_masks(layers, target):
+    # Keep the largest-magnitude weights of each kernel; already-pruned zeros are the first to go again
+    masks = []
+    for layer in layers:
+        kernel = np.asarray(layer.kernel)
+        n_pruned = int(round(layer_sparsity(layer, target) * kernel.size))
+        mask = np.ones(kernel.size, dtype=np.float32)
+        mask[np.argsort(np.abs(kernel), axis=None, kind='stable')[:n_pruned]] = 0
+        masks.append((layer, mask.reshape(kernel.shape)))
+    return masks
+
+def sparsity(model):
+    layers = prunable_layers(model)
+    zeros = sum(int(np.sum(np.asarray(layer.kernel) == 0)) for layer in layers)
+    total = sum(int(np.prod(layer.kernel.shape)) for layer in layers)
+    return {'pruned_layers': zeros / max(total, 1),
+            'whole_model': zeros / max(sum(int(np.prod(w.shape)) for w in model.get_weights()), 1)}
+
+def mask_callback(masks):
+    from tensorflow.keras.callbacks import Callback
+
+    class HoldMasks(Callback):
+        # Optimizer updates move pruned weights off zero; they are zeroed again after every batch
+        def apply(self):
+            for layer, mask in masks:
+                layer.kernel.assign(layer.kernel * mask)
+
+        def on_train_batch_end(self, batch, logs=None):
+            self.apply()
+    return HoldMasks()
+
+def time_call(fn, x, repeats=REPEATS):
+    fn(x)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(x)
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+def benchmark(model, sparse_path, X, batch_sizes, tmp_dir):
+    # Latency per call and windows/s at each batch size for Keras, NumPy with dense kernels and NumPy with CSR
+    from sparse_model import SparseCNN, export_sparse
+    dense_path = export_sparse(model, os.path.join(tmp_dir, 'dense_kernels.npz'), min_sparsity=2.0)
+    engines = {'keras': lambda x: model(x, training=False), 'numpy-dense': SparseCNN(dense_path),
+               'numpy-csr': SparseCNN(sparse_path)}
+    rows = {}
+    for name, fn in engines.items():
+        rows[name] = {}
+        for batch in batch_sizes:
+            x = np.resize(X, (batch, *X.shape[1:])).astype(np.float32)
+            seconds = time_call(fn, x)
+            rows[name][str(batch)] = {'ms_per_call': seconds * 1000, 'windows_per_s': batch / seconds}
+    memory = {'keras': int(sum(w.nbytes for w in model.get_weights())), 'numpy-dense': engines['numpy-dense'].nbytes(),
+              'numpy-csr': engines['numpy-csr'].nbytes()}
+    os.remove(dense_path)
+    return {'latency': rows, 'param_bytes': memory, 'csr_file_bytes': os.path.getsize(sparse_path)}
+
+def print_benchmark(bench, batch_sizes):
+    print(f"  {'engine':<12} " + ' '.join(f'{f"batch {b}":>20}' for b in batch_sizes) + f" {'params':>10}")
+    for name, rows in bench['latency'].items():
+        cells = ' '.join(f"{rows[str(b)]['ms_per_call']:>8.2f}ms {rows[str(b)]['windows_per_s']:>7.0f}/s" for b in batch_sizes)
+        print(f"  {name:<12} {cells} {bench['param_bytes'][name] / 1024:>8.0f}KB")
+
+def main(argv=None):
+    import tensorflow as tf
+    from tensorflow.keras.callbacks import EarlyStopping
+    from tensorflow.keras.models import load_model
+    from tensorflow.keras.optimizers import Adam
+    from inference import load_preprocessing
+    from sampling import ClassSampler
+    from sparse_model import export_sparse
+    from splits import DEFAULT_SPLIT, grouped_holdout
+    from tensor_cache import split_arrays
+    from train_model import BALANCE, BATCH_SIZE, SampledArrays
+    parser = argparse.ArgumentParser(description='Iterative magnitude pruning with a sparse-aware benchmark.')
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--sparsities', type=float, nargs='+', default=SPARSITIES)
+    parser.add_argument('--finetune-epochs', type=int, default=FINETUNE_EPOCHS)
+    parser.add_argument('--learning-rate', type=float, default=LEARNING_RATE)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=BATCH_SIZES)
+    parser.add_argument('--split', default=DEFAULT_SPLIT)
+    parser.add_argument('--fold', type=int, default=0)
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--output-dir', default=PRUNED_DIR)
+    parser.add_argument('--output', default=REPORT_PATH)
+    args = parser.parse_args(argv)
+
+    if load_preprocessing()['gravity'] != 'window':
+        print('Pruning fine-tunes on per-window filtered windows; retrain the model with --gravity window first')
+        return 1
+    tf.keras.utils.set_random_seed(args.seed)
+    X, y, classes = split_arrays('train', args.split, args.fold)
+    X_test, y_test, _ = split_arrays('test', args.split, args.fold)
+    X_test = np.asarray(X_test)
+    fit_pos, val_pos = grouped_holdout('train', args.split, args.fold, VAL_RATIO, args.seed)
+    eye = np.eye(len(classes), dtype=np.float32)
+    X_fit, y_fit = np.asarray(X[fit_pos]), np.asarray(y[fit_pos])
+    X_val, y_val = np.asarray(X[val_pos]), eye[np.asarray(y[val_pos])]
+    sampler = ClassSampler(y_fit, BALANCE, seed=args.seed, n_classes=len(classes))
+    if BALANCE in ('undersample', 'oversample'):
+        train_data = {'x': SampledArrays(X_fit, eye[y_fit], sampler, BATCH_SIZE)}
+    else:
+        train_data = {'x': X_fit, 'y': eye[y_fit], 'batch_size': BATCH_SIZE,
+                      'class_weight': sampler.class_weight(np.arange(len(y_fit)))}
+
+    model = load_model(args.model)
+    model.compile(optimizer=Adam(learning_rate=args.learning_rate), loss='categorical_crossentropy',
+                  metrics=['accuracy'])
+    os.makedirs(args.output_dir, exist_ok=True)
+    base = os.path.splitext(os.path.basename(args.model))[0]
+    levels = []
+    for target in [0.0] + sorted(args.sparsities):
+        if target:
+            masks = magnitude_masks(prunable_layers(model), target)
+            hold = mask_callback(masks)
+            hold.apply()
+            pruned_accuracy = float(np.mean(np.argmax(model.predict(X_test, batch_size=256, verbose=0), axis=1) == y_test))
+            es = EarlyStopping(monitor='val_loss', patience=PATIENCE, restore_best_weights=True)
+            model.fit(**train_data, epochs=args.finetune_epochs, validation_data=(X_val, y_val),
+                      callbacks=[hold, es], verbose=0)
+            hold.apply()
+        pred = np.argmax(model.predict(X_test, batch_size=256, verbose=0), axis=1)
+        name = f'{base}_s{int(round(target * 100)):02d}'
+        keras_path = os.path.join(args.output_dir, f'{name}.keras')
+        sparse_path = export_sparse(model, os.path.join(args.output_dir, f'{name}.npz'))
+        model.save(keras_path)
+        level = {
+            'target_sparsity': target,
+            'sparsity': sparsity(model),
+            'test_accuracy': float(np.mean(pred == y_test)),
+            'accuracy_before_finetune': pruned_accuracy if target else None,
+            'keras_path': keras_path,
+            'sparse_path': sparse_path,
+            'keras_file_bytes': os.path.getsize(keras_path),
+        }
+        level.update(benchmark(model, sparse_path, X_test, args.batch_sizes, args.output_dir))
+        levels.append(level)
+        print(f"Sparsity {level['sparsity']['pruned_layers']*100:.1f}% of pruned kernels "
+              f"({level['sparsity']['whole_model']*100:.1f}% of the model): test accuracy "
+              f"{level['test_accuracy']*100:.2f}%" + (f" ({pruned_accuracy*100:.2f}% before fine-tuning)" if target else ''))
+        print_benchmark(level, args.batch_sizes)
+
+    # Verdict per batch size: does the CSR export beat the dense kernels at the highest sparsity?
+    last = levels[-1]['latency']
+    for b in map(str, args.batch_sizes):
+        ratio = last['numpy-dense'][b]['ms_per_call'] / last['numpy-csr'][b]['ms_per_call']
+        print(f"Batch {b}: CSR is {ratio:.2f}x the speed of dense kernels at {levels[-1]['target_sparsity']*100:.0f}% "
+              f"sparsity, Keras {last['keras'][b]['ms_per_call']:.2f} ms vs CSR {last['numpy-csr'][b]['ms_per_call']:.2f} ms")
+    with open(args.output, 'w') as f:
+        json.dump({'model': args.model, 'classes': list(classes), 'settings': vars(args), 'levels': levels}, f, indent=2)
+    print(f'Report saved as {args.output}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
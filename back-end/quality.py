@@ -0,0 +1,206 @@
+import os
+import sys
+import json
+import hashlib
+import argparse
+import numpy as np
+from ingest import COLUMNS, parse_recording
+from parallel import add_workers_argument, parallel_map
+from window_store import load_store, store_exists, store_path
+from windowing import RAW_ROOT, QUARANTINE_PATH, WINDOW_SIZE, list_recordings, load_quarantine
+
+# Usage: python quality.py [root] [--store PATH] [--output PATH] [--quarantine] [--workers N]
+# Example: python quality.py --quarantine
+#
+# Scans every raw recording and every stored window for data problems and writes a JSON report.
+# All recordings are concatenated and checked in one vectorized pass. Issues are 'error'
+# (unusable, a quarantine candidate) or 'warning' (worth a look). With --quarantine, recordings
+# with errors are added to data/quarantine.json, which windowing.list_recordings() skips, so the
+# pipeline stops using them until they are removed from that list.
+
+REPORT_PATH = 'data/window_store/quality_report.json'
+STORE = store_path('all_data_overlap')
+GRAVITY = 9.81
+# A recording shorter than this fraction of the median recording is probably cut off
+TRUNCATED_FRACTION = 0.5
+# Identical consecutive values on one channel for this many samples (0.5 s at 100 Hz)
+FLAT_RUN = 50
+# Samples pinned at a channel's extreme value, far from its typical range, suggest clipping
+CLIP_COUNT = 5
+CLIP_SIGMAS = 4.0
+# Physically implausible for a phone carried by a person
+MAX_ACC = 16 * GRAVITY       # m/s^2
+MAX_GYRO = 35.0              # rad/s (about 2000 deg/s)
+GRAVITY_RANGE = (0.5 * GRAVITY, 1.5 * GRAVITY)  # mean |acc| of a whole recording
+MAX_BAD_ROW_FRACTION = 0.01
+
+def _parse(path):
+    samples, bad_rows, _ = parse_recording(path)
+    return samples, bad_rows
+
+def _issue(severity, kind, detail):
+    return {'severity': severity, 'kind': kind, 'detail': detail}
+
+def longest_runs(values, starts):
+    # Longest run of identical consecutive values per recording and channel.
+    # values: all recordings concatenated (N, C); starts: first row of each recording.
+    same = np.zeros(values.shape, dtype=bool)
+    same[1:] = values[1:] == values[:-1]
+    same[starts] = False
+    # Run length at each row: rows since the last row that started a new run
+    pos = np.arange(len(values))[:, None]
+    last_reset = np.maximum.accumulate(np.where(same, 0, pos), axis=0)
+    run = pos - last_reset + 1
+    return np.maximum.reduceat(run, starts, axis=0) if len(values) else np.zeros((0, values.shape[1]))
+
+def scan_recordings(listing, workers=None):
+    names = [f'{class_name}/{os.path.basename(path)}' for path, class_name in listing]
+    parsed = parallel_map(_parse, [path for path, _ in listing], workers, desc='recordings scanned')
+    counts = np.array([len(s) for s, _ in parsed], dtype=np.int64)
+    issues = {name: [] for name in names}
+    nonempty = counts > 0
+    for name, (_, bad_rows), n in zip(names, parsed, counts):
+        if bad_rows:
+            severity = 'error' if len(bad_rows) > MAX_BAD_ROW_FRACTION * max(n + len(bad_rows), 1) else 'warning'
+            issues[name].append(_issue(severity, 'bad-rows', {'count': len(bad_rows), 'first': bad_rows[:5]}))
+
+    # Sample counts
+    median = float(np.median(counts[nonempty])) if nonempty.any() else 0.0
+    for name, n in zip(names, counts):
+        if n < WINDOW_SIZE:
+            issues[name].append(_issue('error', 'too-short', {'samples': int(n), 'window_size': WINDOW_SIZE}))
+        elif n < TRUNCATED_FRACTION * median:
+            issues[name].append(_issue('error', 'truncated', {'samples': int(n), 'median_samples': median}))
+
+    if nonempty.any():
+        kept = [i for i in range(len(names)) if nonempty[i]]
+        values = np.concatenate([parsed[i][0] for i in kept])
+        starts = np.concatenate([[0], np.cumsum(counts[kept])[:-1]])
+        n = counts[kept][:, None]
+        mean = np.add.reduceat(values, starts, axis=0, dtype=np.float64) / n
+        std = np.sqrt(np.maximum(np.add.reduceat(values.astype(np.float64) ** 2, starts, axis=0) / n - mean ** 2, 0))
+        vmax = np.maximum.reduceat(values, starts, axis=0)
+        vmin = np.minimum.reduceat(values, starts, axis=0)
+        rec = np.repeat(np.arange(len(kept)), counts[kept])
+        at_max = np.add.reduceat((values == vmax[rec]).astype(np.int64), starts, axis=0)
+        at_min = np.add.reduceat((values == vmin[rec]).astype(np.int64), starts, axis=0)
+        runs = longest_runs(values, starts)
+        acc_mag = np.linalg.norm(values[:, :3], axis=1)
+        gyro_mag = np.linalg.norm(values[:, 3:], axis=1)
+        mean_acc_mag = np.add.reduceat(acc_mag, starts) / counts[kept]
+        acc_spikes = np.add.reduceat((acc_mag > MAX_ACC).astype(np.int64), starts)
+        gyro_spikes = np.add.reduceat((gyro_mag > MAX_GYRO).astype(np.int64), starts)
+        channels = COLUMNS
+
+        for j, i in enumerate(kept):
+            name = names[i]
+            flat = [c for c, r in zip(channels, runs[j]) if r >= FLAT_RUN]
+            if flat:
+                issues[name].append(_issue('warning', 'flatline', {
+                    'channels': flat, 'longest_run': int(runs[j].max())}))
+            spread = np.maximum(std[j], 1e-6)
+            clipped = [c for c in range(len(channels))
+                       if at_max[j, c] >= CLIP_COUNT and (vmax[j, c] - mean[j, c]) / spread[c] > CLIP_SIGMAS
+                       or at_min[j, c] >= CLIP_COUNT and (mean[j, c] - vmin[j, c]) / spread[c] > CLIP_SIGMAS]
+            if clipped:
+                issues[name].append(_issue('warning', 'saturated', {
+                    'channels': [channels[c] for c in clipped],
+                    'max': [float(vmax[j, c]) for c in clipped], 'min': [float(vmin[j, c]) for c in clipped]}))
+            if not GRAVITY_RANGE[0] <= mean_acc_mag[j] <= GRAVITY_RANGE[1]:
+                issues[name].append(_issue('error', 'implausible-gravity', {'mean_acc_magnitude': float(mean_acc_mag[j])}))
+            if acc_spikes[j] or gyro_spikes[j]:
+                issues[name].append(_issue('warning', 'implausible-magnitude', {
+                    'acc_samples_over': int(acc_spikes[j]), 'gyro_samples_over': int(gyro_spikes[j]),
+                    'max_acc': MAX_ACC, 'max_gyro': MAX_GYRO}))
+
+    # Exact duplicate recordings: the first in sorted order is kept, later copies are errors
+    seen = {}
+    for name, (samples, _) in zip(names, parsed):
+        if not len(samples):
+            continue
+        digest = hashlib.sha256(samples.tobytes()).hexdigest()
+        if digest in seen:
+            issues[name].append(_issue('error', 'duplicate', {'of': seen[digest]}))
+        else:
+            seen[digest] = name
+
+    return {name: {'samples': int(n), 'issues': issues[name]} for name, n in zip(names, counts)}
+
+def scan_windows(path):
+    # Window-level checks over the whole (N, W, C) store at once
+    store = load_store(path)
+    windows = np.asarray(store.windows)
+    if not len(windows):
+        return {'store': path, 'windows': 0, 'non_finite': [], 'flat_channel': [], 'duplicates': 0,
+                'cross_recording_duplicates': [], 'cross_recording_duplicate_count': 0}
+    non_finite = ~np.isfinite(windows).all(axis=(1, 2))
+    flat = (windows.max(axis=1) == windows.min(axis=1)).any(axis=1)
+    rows = np.ascontiguousarray(windows.reshape(len(windows), -1)).view(np.dtype((np.void, windows[0].nbytes)))
+    _, first, inverse = np.unique(rows.ravel(), return_index=True, return_inverse=True)
+    original = first[inverse.ravel()]  # earliest identical window for every window
+    duplicate = np.flatnonzero(original != np.arange(len(windows)))
+    names = store.recording_names()
+    cross = [(int(i), str(names[i]), str(names[original[i]])) for i in duplicate if names[i] != names[original[i]]]
+    return {
+        'store': path,
+        'windows': len(windows),
+        'non_finite': np.flatnonzero(non_finite).tolist(),
+        'flat_channel': np.flatnonzero(flat).tolist(),
+        'duplicates': len(duplicate),
+        # (window, its recording, recording of the identical earlier window): these leak across splits
+        'cross_recording_duplicates': cross[:50],
+        'cross_recording_duplicate_count': len(cross),
+    }
+
+def write_quarantine(report, path=QUARANTINE_PATH):
+    quarantine = load_quarantine(path, with_reasons=True)
+    for name, entry in report['recordings'].items():
+        errors = [i['kind'] for i in entry['issues'] if i['severity'] == 'error']
+        if errors and name not in quarantine:
+            quarantine[name] = ', '.join(errors)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({'recordings': dict(sorted(quarantine.items()))}, f, indent=2)
+    return quarantine
+
+def print_summary(report):
+    for name, entry in report['recordings'].items():
+        for issue in entry['issues']:
+            print(f"{issue['severity']:<8} {name}: {issue['kind']} {json.dumps(issue['detail'])}")
+    windows = report.get('windows')
+    if windows:
+        print(f"{windows['store']}: {windows['windows']} windows, {len(windows['non_finite'])} non-finite, "
+              f"{len(windows['flat_channel'])} with a flat channel, {windows['duplicates']} duplicates "
+              f"({windows['cross_recording_duplicate_count']} across recordings)")
+    n_err = sum(i['severity'] == 'error' for e in report['recordings'].values() for i in e['issues'])
+    n_warn = sum(i['severity'] == 'warning' for e in report['recordings'].values() for i in e['issues'])
+    print(f"{len(report['recordings'])} recordings scanned: {n_err} error(s), {n_warn} warning(s)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Scan sensor recordings and windows for data-quality problems.')
+    parser.add_argument('root', nargs='?', default=RAW_ROOT)
+    parser.add_argument('--store', default=STORE, help='Window store to scan as well (skipped if missing)')
+    parser.add_argument('--output', default=REPORT_PATH)
+    parser.add_argument('--quarantine', action='store_true',
+                        help=f'Add recordings with errors to {QUARANTINE_PATH} so the pipeline skips them')
+    add_workers_argument(parser)
+    args = parser.parse_args(argv)
+
+    # Quarantined recordings are scanned too, so the report shows why they are excluded
+    listing = list_recordings(args.root, skip_quarantined=False)
+    report = {'root': args.root, 'recordings': scan_recordings(listing, args.workers),
+              'quarantined': sorted(load_quarantine())}
+    if store_exists(args.store):
+        report['windows'] = scan_windows(args.store)
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print_summary(report)
+    print(f'Report saved as {args.output}')
+    if args.quarantine:
+        quarantine = write_quarantine(report)
+        print(f'{len(quarantine)} recording(s) quarantined in {QUARANTINE_PATH}')
+    return 1 if any(i['severity'] == 'error' for e in report['recordings'].values() for i in e['issues']) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
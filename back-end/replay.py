@@ -0,0 +1,181 @@
+import os
+import sys
+import json
+import time
+import argparse
+import urllib.request
+from thread_config import apply_thread_config
+
+# Size the CPU thread pools for this host before numpy/TensorFlow start them, as the server does (see tune_threads.py)
+apply_thread_config()
+
+import numpy as np
+from inference import (WINDOW_SIZE, N_CHANNELS, load_classes, load_inference_model, load_preprocessing,
+                       predict_window, stream_alpha)
+from preprocessing import remove_gravity_recording
+from windowing import read_recording, sliding_windows, window_offsets
+
+# Usage: python replay.py <csv_file|class_dir|base_dir> [--url http://localhost:5000/predict]
+# Example: python replay.py data/all_data/Run/Run_1.csv
+# Streams continuous recordings through the /predict windowing (100 samples, 50 hop),
+# either in-process through inference.py or over HTTP against a running server.
+
+DEFAULT_INPUT = 'data/all_data'
+STEP_SIZE = 50  # Same 50% overlap as the app's windowing loop
+
+def find_recordings(path):
+    # Accepts a single recording, a class folder or the all_data root; the label is the class folder name
+    if os.path.isfile(path):
+        return [(path, os.path.basename(os.path.dirname(os.path.abspath(path))))]
+    recordings = []
+    subdirs = sorted(d for d in os.listdir(path) if os.path.isdir(os.path.join(path, d)))
+    if not subdirs:
+        label = os.path.basename(os.path.abspath(path))
+        return [(os.path.join(path, f), label) for f in sorted(os.listdir(path)) if f.endswith('.csv')]
+    for class_name in subdirs:
+        class_dir = os.path.join(path, class_name)
+        for fname in sorted(os.listdir(class_dir)):
+            if fname.endswith('.csv'):
+                recordings.append((os.path.join(class_dir, fname), class_name))
+    return recordings
+
+def iter_windows(samples, window_size=WINDOW_SIZE, step=STEP_SIZE):
+    offsets = window_offsets(len(samples), window_size, step)
+    return zip(offsets.tolist(), sliding_windows(samples, window_size, step))
+
+def make_local_predictor(model_path):
+    model = load_inference_model(model_path)
+    classes = load_classes()
+    alpha = load_preprocessing()['alpha']
+    def predict(window, filtered=None):
+        return predict_window(model, classes, window, alpha, filtered)
+    return predict
+
+def make_http_predictor(url, timeout=30):
+    def predict(window, filtered=None):
+        # The server does its own gravity filtering
+        body = json.dumps({'window': window}).encode('utf-8')
+        req = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(req, timeout=timeout) as res:
+            return json.loads(res.read().decode('utf-8'))
+    return predict
+
+def latency_summary(latencies_ms):
+    if not latencies_ms:
+        return {}
+    lat = np.array(latencies_ms)
+    return {
+        'mean_ms': float(lat.mean()),
+        'p50_ms': float(np.percentile(lat, 50)),
+        'p95_ms': float(np.percentile(lat, 95)),
+        'p99_ms': float(np.percentile(lat, 99)),
+        'max_ms': float(lat.max()),
+    }
+
+def replay(recordings, predict, window_size=WINDOW_SIZE, step=STEP_SIZE, warmup=1, gravity_alpha=None):
+    # gravity_alpha: filter each recording as one continuous stream first (models trained with --gravity recording)
+    windows = []
+    per_recording = []
+    total_start = time.perf_counter()
+    for path, label in recordings:
+        samples = read_recording(path)
+        if samples.shape[1] != N_CHANNELS:
+            print(f"File {path} does not have {N_CHANNELS} sensor columns, skipping.")
+            continue
+        filtered = remove_gravity_recording(samples, gravity_alpha) if gravity_alpha is not None else None
+        latencies, correct = [], 0
+        for start, window in iter_windows(samples, window_size, step):
+            payload = window.tolist()
+            t0 = time.perf_counter()
+            result = predict(payload, None if filtered is None else filtered[start:start + window_size])
+            latency_ms = (time.perf_counter() - t0) * 1000
+            if warmup > 0:
+                # The first calls pay for graph tracing / connection setup, keep them out of the stats
+                warmup -= 1
+                continue
+            hit = result.get('prediction') == label
+            correct += int(hit)
+            latencies.append(latency_ms)
+            windows.append({
+                'recording': path,
+                'offset': start,
+                'label': label,
+                'prediction': result.get('prediction'),
+                'confidence': result.get('confidence'),
+                'latency_ms': latency_ms,
+            })
+        n = len(latencies)
+        per_recording.append({
+            'recording': path,
+            'label': label,
+            'windows': n,
+            'agreement': correct / n if n else 0.0,
+            'latency': latency_summary(latencies),
+        })
+        print(f"{path}: {n} windows, {correct}/{n} agree with '{label}'")
+    wall = time.perf_counter() - total_start
+
+    latencies = [w['latency_ms'] for w in windows]
+    per_class = {}
+    for w in windows:
+        stats = per_class.setdefault(w['label'], {'correct': 0, 'total': 0})
+        stats['total'] += 1
+        stats['correct'] += int(w['prediction'] == w['label'])
+    for stats in per_class.values():
+        stats['agreement'] = stats['correct'] / stats['total']
+    n_correct = sum(s['correct'] for s in per_class.values())
+    return {
+        'windows': len(windows),
+        'agreement': n_correct / len(windows) if windows else 0.0,
+        'per_class': per_class,
+        'latency': latency_summary(latencies),
+        'wall_time_s': wall,
+        # End-to-end throughput over the whole replay (summed latencies would leave out parsing and filtering)
+        'throughput_wps': len(windows) / wall if windows and wall > 0 else 0.0,
+        'recordings': per_recording,
+        'per_window': windows,
+    }
+
+def print_report(report):
+    print(f"\nWindows replayed: {report['windows']}")
+    print(f"Label agreement: {report['agreement'] * 100:.2f}%")
+    for cls, stats in sorted(report['per_class'].items()):
+        print(f"  {cls}: {stats['agreement'] * 100:.2f}% ({stats['correct']}/{stats['total']})")
+    lat = report['latency']
+    if lat:
+        print(f"Latency: mean {lat['mean_ms']:.2f} ms, p50 {lat['p50_ms']:.2f} ms, "
+              f"p95 {lat['p95_ms']:.2f} ms, p99 {lat['p99_ms']:.2f} ms, max {lat['max_ms']:.2f} ms")
+    print(f"Throughput: {report['throughput_wps']:.1f} windows/s (wall time {report['wall_time_s']:.1f} s)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay raw recordings through the /predict serving path.')
+    parser.add_argument('input', nargs='?', default=DEFAULT_INPUT, help='Recording CSV, class folder or data root')
+    parser.add_argument('--url', help='POST windows to a running server instead of predicting in-process')
+    parser.add_argument('--model', default='cnn_motion_model.keras', help='Model used for in-process replay')
+    parser.add_argument('--step', type=int, default=STEP_SIZE)
+    parser.add_argument('--warmup', type=int, default=1, help='Number of initial windows excluded from stats')
+    parser.add_argument('--output', help='Write the full report (including per-window results) as JSON')
+    args = parser.parse_args(argv)
+
+    recordings = find_recordings(args.input)
+    if not recordings:
+        print(f"No recordings found in {args.input}")
+        return 1
+    # In-process replay of a --gravity recording model filters whole recordings, like a /stream session;
+    # over HTTP, /predict filters each window itself
+    config = load_preprocessing()
+    stream_filter = None if args.url or config['gravity'] != 'recording' else stream_alpha(config)
+    predict = make_http_predictor(args.url) if args.url else make_local_predictor(args.model)
+    # Always 1-second windows at 100 Hz, as the app sends them; inference.model_inputs resamples them for
+    # lower-rate models
+    report = replay(recordings, predict, WINDOW_SIZE, args.step, args.warmup, stream_filter)
+    report['mode'] = 'http' if args.url else 'in-process'
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved replay report to {args.output}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,65 @@
+import numpy as np
+
+# Class balancing at load time, over window indices (e.g. one side of a split from splits.py).
+# Nothing is deleted: every call to sample() draws a new seeded selection from all collected windows.
+#   none         every window once
+#   undersample  every class cut down to the size of the smallest class
+#   oversample   every class filled up to the size of the largest class (extra windows drawn with replacement)
+#   weight       every window once, with per-class loss weights for model.fit(class_weight=...)
+
+STRATEGIES = ['none', 'undersample', 'oversample', 'weight']
+SEED = 42
+
+def class_counts(labels, n_classes=None):
+    labels = np.asarray(labels)
+    return np.bincount(labels, minlength=n_classes or (int(labels.max()) + 1 if len(labels) else 0))
+
+class ClassSampler:
+    def __init__(self, labels, strategy='undersample', seed=SEED, n_classes=None):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown balancing strategy '{strategy}'; choose from {', '.join(STRATEGIES)}")
+        self.labels = np.asarray(labels)
+        self.strategy = strategy
+        self.n_classes = n_classes or (int(self.labels.max()) + 1 if len(self.labels) else 0)
+        self.rng = np.random.default_rng(seed)
+
+    def _by_class(self, indices):
+        indices = np.asarray(indices)
+        return [indices[self.labels[indices] == c] for c in range(self.n_classes)]
+
+    def sample(self, indices):
+        # Shuffled indices for one pass (epoch); may contain repeats when oversampling
+        indices = np.asarray(indices)
+        if self.strategy in ('none', 'weight'):
+            return self.rng.permutation(indices)
+        groups = [g for g in self._by_class(indices) if len(g)]
+        if self.strategy == 'undersample':
+            target = min(len(g) for g in groups)
+            picked = [self.rng.choice(g, target, replace=False) for g in groups]
+        else:
+            target = max(len(g) for g in groups)
+            picked = [np.concatenate([g, self.rng.choice(g, target - len(g), replace=True)]) for g in groups]
+        return self.rng.permutation(np.concatenate(picked))
+
+    def sample_size(self, indices):
+        counts = [len(g) for g in self._by_class(indices) if len(g)]
+        if self.strategy == 'undersample':
+            return min(counts) * len(counts)
+        if self.strategy == 'oversample':
+            return max(counts) * len(counts)
+        return sum(counts)
+
+    def class_weight(self, indices):
+        # Inverse class frequency, scaled so a perfectly balanced set gets weight 1 everywhere
+        if self.strategy != 'weight':
+            return None
+        counts = np.array([len(g) for g in self._by_class(indices)])
+        present = counts > 0
+        return {c: float(counts.sum() / (present.sum() * n)) for c, n in enumerate(counts) if n}
+
+    def get_state(self):
+        # RNG position, saved in training checkpoints so a resumed run continues the same draws
+        return {'rng': self.rng.bit_generator.state}
+
+    def set_state(self, state):
+        self.rng.bit_generator.state = state['rng']
@@ -0,0 +1,142 @@
+import json
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from scipy import sparse
+
+# NumPy/SciPy forward pass for the layer stack of train_model.build_cnn_model (Normalization, Conv1D,
+# BatchNormalization, MaxPooling1D, Flatten, Dense, Dropout), exported from a Keras model into one .npz.
+# Kernels that are mostly zero (after pruning, see prune.py) are stored as CSR, so both the file and the
+# multiply skip the zeros; the rest stay dense. SparseCNN has the predict()/input_shape that
+# inference.predict_window uses, so load_inference_model() serves a .npz export in place of a Keras model.
+
+MIN_SPARSITY = 0.5  # below this, CSR indices cost more than the zeros they skip
+NORM_EPSILON = 1e-7  # keras.backend.epsilon(), the floor Normalization puts under the standard deviation
+
+def _kernel_arrays(prefix, matrix, min_sparsity):
+    # (in, out) kernel matrix -> stored arrays; CSR holds the transpose so the product is sparse @ dense
+    if np.mean(matrix == 0) >= min_sparsity:
+        csr = sparse.csr_matrix(matrix.T)
+        return True, {f'{prefix}_data': csr.data, f'{prefix}_indices': csr.indices, f'{prefix}_indptr': csr.indptr,
+                      f'{prefix}_shape': np.array(csr.shape)}
+    return False, {f'{prefix}_kernel': matrix}
+
+def export_sparse(model, path, min_sparsity=MIN_SPARSITY):
+    layers, arrays = [], {}
+    for i, layer in enumerate(model.layers):
+        kind = type(layer).__name__
+        spec = {'kind': kind}
+        if kind == 'Normalization':
+            arrays[f'{i}_mean'] = np.asarray(layer.mean, dtype=np.float32).reshape(-1)
+            arrays[f'{i}_std'] = np.maximum(np.sqrt(np.asarray(layer.variance, dtype=np.float32)), NORM_EPSILON).reshape(-1)
+        elif kind in ('Conv1D', 'Dense'):
+            config = layer.get_config()
+            kernel, bias = layer.get_weights()
+            if kind == 'Conv1D':
+                if config['padding'] != 'valid' or tuple(config['strides']) != (1,) or tuple(config['dilation_rate']) != (1,):
+                    raise ValueError(f'{layer.name}: only stride-1 valid convolutions can be exported')
+                spec['kernel_size'] = int(kernel.shape[0])
+            spec['activation'] = config['activation']
+            spec['sparse'], kernel_arrays = _kernel_arrays(str(i), kernel.reshape(-1, kernel.shape[-1]), min_sparsity)
+            arrays.update(kernel_arrays)
+            arrays[f'{i}_bias'] = bias
+        elif kind == 'BatchNormalization':
+            # Inference-mode batch norm as one scale and shift per channel
+            scale = 1 / np.sqrt(np.asarray(layer.moving_variance) + layer.epsilon)
+            if layer.gamma is not None:
+                scale = scale * np.asarray(layer.gamma)
+            shift = -np.asarray(layer.moving_mean) * scale
+            if layer.beta is not None:
+                shift = shift + np.asarray(layer.beta)
+            arrays[f'{i}_scale'], arrays[f'{i}_shift'] = scale.astype(np.float32), shift.astype(np.float32)
+        elif kind == 'MaxPooling1D':
+            config = layer.get_config()
+            if config['padding'] != 'valid':
+                raise ValueError(f'{layer.name}: only valid pooling can be exported')
+            spec['pool_size'], spec['strides'] = int(config['pool_size'][0]), int(config['strides'][0])
+        elif kind not in ('Flatten', 'Dropout', 'InputLayer'):
+            raise ValueError(f"Layer {layer.name} ({kind}) is not supported by the sparse export")
+        layers.append(spec)
+    meta = {'layers': layers, 'input_shape': list(model.input_shape[1:])}
+    np.savez(path, meta=np.array(json.dumps(meta)), **arrays)
+    return path
+
+def _activate(x, activation):
+    if activation == 'relu':
+        return np.maximum(x, 0)
+    if activation == 'softmax':
+        e = np.exp(x - x.max(axis=-1, keepdims=True))
+        return e / e.sum(axis=-1, keepdims=True)
+    if activation == 'linear':
+        return x
+    raise ValueError(f"Activation '{activation}' is not supported by the sparse export")
+
+class SparseCNN:
+    def __init__(self, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            arrays = {k: data[k] for k in data.files if k != 'meta'}
+        self.input_shape = (None, *meta['input_shape'])
+        self.layers = []
+        for i, spec in enumerate(meta['layers']):
+            spec = dict(spec)
+            if spec.get('sparse'):
+                spec['kernel'] = sparse.csr_matrix(
+                    (arrays[f'{i}_data'], arrays[f'{i}_indices'], arrays[f'{i}_indptr']), shape=tuple(arrays[f'{i}_shape']))
+            spec.update({k.split('_', 1)[1]: v for k, v in arrays.items() if k.split('_', 1)[0] == str(i)
+                         and k.split('_', 1)[1] in ('kernel', 'bias', 'mean', 'std', 'scale', 'shift')})
+            self.layers.append(spec)
+
+    @staticmethod
+    def _matmul(x, spec):
+        # x: (rows, in) -> (rows, out)
+        if spec.get('sparse'):
+            return np.asarray(spec['kernel'] @ x.T).T + spec['bias']
+        return x @ spec['kernel'] + spec['bias']
+
+    def __call__(self, x, training=False):
+        # training is accepted (and ignored) so callers can treat this like a Keras model
+        x = np.asarray(x, dtype=np.float32)
+        for spec in self.layers:
+            kind = spec['kind']
+            if kind == 'Normalization':
+                x = (x - spec['mean']) / spec['std']
+            elif kind == 'Conv1D':
+                # im2col: every kernel_size-long patch as one row, laid out (tap, channel) like the Keras kernel
+                k = spec['kernel_size']
+                patches = sliding_window_view(x, k, axis=1).transpose(0, 1, 3, 2)
+                n, length = patches.shape[:2]
+                x = self._matmul(patches.reshape(n * length, -1), spec).reshape(n, length, -1)
+                x = _activate(x, spec['activation'])
+            elif kind == 'BatchNormalization':
+                x = x * spec['scale'] + spec['shift']
+            elif kind == 'MaxPooling1D':
+                size, stride = spec['pool_size'], spec['strides']
+                length = (x.shape[1] - size) // stride + 1
+                x = sliding_window_view(x, size, axis=1)[:, :length * stride:stride].max(axis=-1)
+            elif kind == 'Flatten':
+                x = x.reshape(len(x), -1)
+            elif kind == 'Dense':
+                x = _activate(self._matmul(x, spec), spec['activation'])
+        return x.astype(np.float32)
+
+    def predict(self, x, batch_size=256, verbose=0):
+        x = np.asarray(x, dtype=np.float32)
+        if not len(x):
+            return np.zeros((0, self.layers[-1]['bias'].shape[0]), dtype=np.float32)
+        return np.concatenate([self(x[i:i + batch_size]) for i in range(0, len(x), batch_size)])
+
+    def count_params(self):
+        # Stored (non-pruned) weights and biases
+        return int(sum(v.nnz if sparse.issparse(v) else v.size for spec in self.layers for k, v in spec.items()
+                       if k in ('kernel', 'bias')))
+
+    def nbytes(self):
+        # Parameter memory, counting CSR index arrays
+        total = 0
+        for spec in self.layers:
+            for k, v in spec.items():
+                if sparse.issparse(v):
+                    total += v.data.nbytes + v.indices.nbytes + v.indptr.nbytes
+                elif isinstance(v, np.ndarray):
+                    total += v.nbytes
+        return total
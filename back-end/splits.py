@@ -0,0 +1,220 @@
+import os
+import sys
+import json
+import argparse
+import numpy as np
+
+from window_store import load_store, store_path
+
+# Usage: python splits.py create <name> [--strategy random|grouped] [--no-stratify] [--test-ratio 0.25] [--k 5] [--seed 42]
+#        python splits.py list | show <name>
+# Example: python splits.py create by_recording --strategy grouped --k 5
+#
+# A split is a small seeded index manifest over a window store (data/window_store/splits/<name>.npz):
+# per fold, the indices of its train and test windows. No window data is copied, so creating a new
+# split takes milliseconds and no extra disk.
+#   random   windows are assigned individually (neighboring overlapped windows can land on both sides)
+#   grouped  whole recordings are assigned, so no recording contributes to both train and test
+# Stratified splits keep each class at the same train/test ratio.
+
+SPLIT_ROOT = 'data/window_store/splits'
+SOURCE_STORE = store_path('all_data_overlap')
+DEFAULT_SPLIT = 'default'
+SEED = 42
+TEST_RATIO = 0.25
+
+def split_path(name):
+    return os.path.join(SPLIT_ROOT, f'{name}.npz')
+
+def split_exists(name=DEFAULT_SPLIT):
+    return os.path.exists(split_path(name))
+
+def _take_groups(groups, sizes, target):
+    # Adds groups in the given order while that brings the total closer to target
+    chosen, total = [], 0
+    for g in groups:
+        if total >= target or abs(total + sizes[g] - target) > abs(total - target) and chosen:
+            continue
+        chosen.append(g)
+        total += sizes[g]
+    return chosen
+
+def random_split(labels, test_ratio=TEST_RATIO, seed=SEED, stratify=True):
+    rng = np.random.default_rng(seed)
+    labels = np.asarray(labels)
+    strata = np.unique(labels) if stratify else [None]
+    test = []
+    for cls in strata:
+        idx = np.arange(len(labels)) if cls is None else np.flatnonzero(labels == cls)
+        idx = rng.permutation(idx)
+        test.append(idx[len(idx) - int(round(len(idx) * test_ratio)):])
+    test = np.sort(np.concatenate(test)) if test else np.zeros(0, dtype=np.int64)
+    train = np.setdiff1d(np.arange(len(labels)), test)
+    return {'train': train, 'test': test}
+
+def grouped_split(groups, labels, test_ratio=TEST_RATIO, seed=SEED, stratify=True):
+    rng = np.random.default_rng(seed)
+    groups, labels = np.asarray(groups), np.asarray(labels)
+    strata = np.unique(labels) if stratify else [None]
+    test_groups = []
+    for cls in strata:
+        mask = np.ones(len(labels), dtype=bool) if cls is None else labels == cls
+        ids, sizes = np.unique(groups[mask], return_counts=True)
+        order = rng.permutation(len(ids))
+        chosen = _take_groups(list(order), dict(enumerate(sizes)), mask.sum() * test_ratio)
+        # Keep at least one recording on the training side
+        if len(chosen) == len(ids) and len(ids) > 1:
+            chosen = chosen[:-1]
+        test_groups.extend(ids[chosen].tolist())
+    is_test = np.isin(groups, test_groups)
+    return {'train': np.flatnonzero(~is_test), 'test': np.flatnonzero(is_test)}
+
+def kfold(labels, k=5, seed=SEED, groups=None, stratify=True):
+    # Returns k splits; with groups, every recording lands in exactly one test fold
+    rng = np.random.default_rng(seed)
+    labels = np.asarray(labels)
+    n = len(labels)
+    fold_of = np.empty(n, dtype=np.int64)
+    strata = np.unique(labels) if stratify else [None]
+    for cls in strata:
+        idx = np.arange(n) if cls is None else np.flatnonzero(labels == cls)
+        if groups is None:
+            for f, part in enumerate(np.array_split(rng.permutation(idx), k)):
+                fold_of[part] = f
+            continue
+        ids, sizes = np.unique(np.asarray(groups)[idx], return_counts=True)
+        # Largest recordings first (ties in random order), each to the currently lightest fold
+        order = sorted(rng.permutation(len(ids)), key=lambda i: -sizes[i])
+        load = np.zeros(k)
+        for i in order:
+            f = int(np.argmin(load))
+            load[f] += sizes[i]
+            fold_of[idx[np.asarray(groups)[idx] == ids[i]]] = f
+    all_idx = np.arange(n)
+    return [{'train': all_idx[fold_of != f], 'test': all_idx[fold_of == f]} for f in range(k)]
+
+def store_fingerprint(store):
+    # Enough to notice that a split no longer matches the store it indexes
+    fingerprint = {'count': len(store), 'recordings': len(store.recordings), 'classes': store.classes}
+    if 'build' in store.meta:
+        fingerprint['build'] = store.meta['build']
+    return fingerprint
+
+def split_matches(store, fingerprint):
+    # Also true once new recordings were appended to the store (window_store.append_store): the build is the
+    # same and the split's indices still point at the same windows; the appended ones are in neither side
+    current = store_fingerprint(store)
+    if current == fingerprint:
+        return True
+    return (fingerprint.get('build') is not None and current.get('build') == fingerprint['build']
+            and current['classes'] == fingerprint['classes'] and current['count'] >= fingerprint['count']
+            and current['recordings'] >= fingerprint['recordings'])
+
+def save_split(name, folds, meta):
+    os.makedirs(SPLIT_ROOT, exist_ok=True)
+    arrays = {}
+    for f, fold in enumerate(folds):
+        for part, idx in fold.items():
+            arrays[f'{f}_{part}'] = np.asarray(idx, dtype=np.int64)
+    meta = dict(meta, folds=len(folds))
+    tmp_path = split_path(name) + '.tmp.npz'
+    np.savez(tmp_path, meta=np.array(json.dumps(meta)), **arrays)
+    os.replace(tmp_path, split_path(name))
+    return split_path(name)
+
+def load_folds(name=DEFAULT_SPLIT):
+    with np.load(split_path(name)) as data:
+        meta = json.loads(str(data['meta']))
+        folds = [{} for _ in range(meta['folds'])]
+        for key in data.files:
+            if key != 'meta':
+                fold, part = key.split('_', 1)
+                folds[int(fold)][part] = data[key]
+    return folds, meta
+
+def load_split(name=DEFAULT_SPLIT, fold=0):
+    folds, meta = load_folds(name)
+    return folds[fold], meta
+
+def split_meta(name=DEFAULT_SPLIT):
+    return load_split(name)[1]
+
+def create_split(name, strategy='random', test_ratio=TEST_RATIO, seed=SEED, stratify=True, k=None, source=SOURCE_STORE):
+    store = load_store(source)
+    labels, groups = np.asarray(store.labels), np.asarray(store.recording_ids)
+    if k:
+        folds = kfold(labels, k, seed, groups if strategy == 'grouped' else None, stratify)
+    elif strategy == 'grouped':
+        folds = [grouped_split(groups, labels, test_ratio, seed, stratify)]
+    else:
+        folds = [random_split(labels, test_ratio, seed, stratify)]
+    meta = {'strategy': strategy, 'stratify': stratify, 'seed': seed, 'test_ratio': None if k else test_ratio,
+            'k': k, 'source': source, 'store': store_fingerprint(store)}
+    save_split(name, folds, meta)
+    return folds, meta
+
+def split_indices(part, name=DEFAULT_SPLIT, fold=0):
+    # (mmapped store, sorted store indices) for one side of a split, checked against the store it was made for
+    parts, meta = load_split(name, fold)
+    store = load_store(meta['source'])
+    if not split_matches(store, meta['store']):
+        raise ValueError(f"Split '{name}' was made for a different version of {meta['source']}; recreate it")
+    return store, np.sort(parts[part])
+
+def grouped_holdout(part, name=DEFAULT_SPLIT, fold=0, ratio=TEST_RATIO, seed=SEED):
+    # Recording-grouped (fit, validation) positions into one side of a split, e.g. for early stopping
+    # without validating on windows that overlap the training windows
+    store, idx = split_indices(part, name, fold)
+    parts = grouped_split(store.recording_ids[idx], store.labels[idx], ratio, seed)
+    return parts['train'], parts['test']
+
+def load_split_windows(part, name=DEFAULT_SPLIT, fold=0, indices=None):
+    # (windows, labels, classes) for one side of a split, read through the mmapped store.
+    # indices overrides the split's own index list (e.g. after load-time sampling).
+    store, idx = split_indices(part, name, fold)
+    if indices is not None:
+        idx = np.sort(indices)
+    return np.asarray(store.windows[idx]), np.asarray(store.labels[idx]), store.classes
+
+def describe(name):
+    folds, meta = load_folds(name)
+    store = load_store(meta['source'])
+    print(f"{name}: {meta['strategy']}{' stratified' if meta['stratify'] else ''}, seed {meta['seed']}, "
+          f"{meta['folds']} fold(s) over {meta['source']}")
+    if len(store) > meta['store']['count'] and split_matches(store, meta['store']):
+        print(f"  {len(store) - meta['store']['count']} windows appended to the store since; recreate the split "
+              f"to use them")
+    for f, fold in enumerate(folds):
+        per_class = np.bincount(store.labels[fold['test']], minlength=len(store.classes))
+        counts = ', '.join(f'{c} {n}' for c, n in zip(store.classes, per_class))
+        print(f"  fold {f}: {len(fold['train'])} train / {len(fold['test'])} test windows (test: {counts})")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Create and inspect index-based splits of the window store.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    create = sub.add_parser('create')
+    create.add_argument('name')
+    create.add_argument('--strategy', choices=['random', 'grouped'], default='random')
+    create.add_argument('--no-stratify', dest='stratify', action='store_false')
+    create.add_argument('--test-ratio', type=float, default=TEST_RATIO)
+    create.add_argument('--k', type=int, help='Create k folds instead of a single train/test split')
+    create.add_argument('--seed', type=int, default=SEED)
+    create.add_argument('--source', default=SOURCE_STORE)
+    sub.add_parser('list')
+    show = sub.add_parser('show')
+    show.add_argument('name')
+    args = parser.parse_args(argv)
+
+    if args.command == 'create':
+        create_split(args.name, args.strategy, args.test_ratio, args.seed, args.stratify, args.k, args.source)
+        describe(args.name)
+    elif args.command == 'list':
+        for fname in sorted(os.listdir(SPLIT_ROOT)) if os.path.isdir(SPLIT_ROOT) else []:
+            if fname.endswith('.npz'):
+                describe(fname[:-4])
+    else:
+        describe(args.name)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,229 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+from manifest import Manifest, config_digest
+
+# Usage: python tensor_cache.py list | clear | evict [--max-mb 2048]
+#
+# Content-addressed cache of preprocessed arrays (gravity-filtered windows and their labels), so repeated
+# train_model.py / test_model.py runs skip parsing and preprocessing. An entry's key is the hash of
+#   - the source data: content hashes of the input files (via the manifest, so unchanged files are not
+#     re-read just to be hashed), and
+#   - the preprocessing config: gravity alpha, sample rate, window size/hop, split part, ...
+# so a changed recording, store or setting simply maps to a different entry. Entries are plain .npy files
+# loaded with mmap; the least recently used entries are evicted once the cache grows past MAX_BYTES.
+
+CACHE_ROOT = 'data/window_store/tensor_cache'
+MAX_BYTES = 2 << 30
+
+def cache_key(source_digests, config):
+    return config_digest({'source': source_digests, 'config': config})[:24]
+
+def entry_path(key):
+    return os.path.join(CACHE_ROOT, key)
+
+def _entry_bytes(path):
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+def list_entries():
+    # [(key, bytes, last used)] most recently used first; the meta.json mtime is the LRU clock
+    entries = []
+    if os.path.isdir(CACHE_ROOT):
+        for key in os.listdir(CACHE_ROOT):
+            meta = os.path.join(entry_path(key), 'meta.json')
+            if os.path.exists(meta):
+                entries.append((key, _entry_bytes(entry_path(key)), os.path.getmtime(meta)))
+    return sorted(entries, key=lambda e: e[2], reverse=True)
+
+def evict(max_bytes=MAX_BYTES, keep=()):
+    # Drops least recently used entries until the cache fits; returns the evicted keys
+    total, evicted = 0, []
+    for key, size, _ in list_entries():
+        if total + size > max_bytes and key not in keep:
+            shutil.rmtree(entry_path(key), ignore_errors=True)
+            evicted.append(key)
+        else:
+            total += size
+    return evicted
+
+def load_entry(key):
+    # {name: mmapped array}, or None on a miss
+    path = entry_path(key)
+    meta = os.path.join(path, 'meta.json')
+    if not os.path.exists(meta):
+        return None
+    os.utime(meta)
+    with open(meta, 'r') as f:
+        names = json.load(f)['arrays']
+    return {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in names}
+
+def _write_entry(key, config, write, max_bytes):
+    # write(directory) -> array names; written into a sibling directory and swapped in, so readers never see a
+    # half-written entry
+    path = entry_path(key)
+    tmp_path = f'{path}.tmp{os.getpid()}'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    names = write(tmp_path)
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump({'arrays': names, 'config': config, 'created': time.time()}, f, indent=2)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    evict(max_bytes, keep={key})
+    return load_entry(key)
+
+def save_entry(key, arrays, config, max_bytes=MAX_BYTES):
+    def write(directory):
+        for name, arr in arrays.items():
+            np.save(os.path.join(directory, f'{name}.npy'), np.ascontiguousarray(arr))
+        return list(arrays)
+    return _write_entry(key, config, write, max_bytes)
+
+def cached(source_digests, config, build, max_bytes=MAX_BYTES):
+    # Arrays for (source, config) from the cache, or build() -> {name: array} once and cache them
+    key = cache_key(source_digests, config)
+    arrays = load_entry(key)
+    if arrays is not None:
+        print(f'Preprocessed arrays from cache entry {key}')
+        return arrays
+    start = time.perf_counter()
+    arrays = build()
+    print(f'Preprocessed in {time.perf_counter() - start:.1f}s, cached as {key}')
+    return save_entry(key, arrays, config, max_bytes)
+
+def cached_streamed(source_digests, config, specs, fill, max_bytes=MAX_BYTES):
+    # Like cached(), for arrays too large to build in memory: specs is {name: (shape, dtype)} and fill(arrays)
+    # writes into the new entry's memory-mapped .npy files part by part
+    key = cache_key(source_digests, config)
+    arrays = load_entry(key)
+    if arrays is not None:
+        print(f'Preprocessed arrays from cache entry {key}')
+        return arrays
+    start = time.perf_counter()
+
+    def write(directory):
+        out = {name: np.lib.format.open_memmap(os.path.join(directory, f'{name}.npy'), mode='w+', dtype=dtype,
+                                               shape=shape) for name, (shape, dtype) in specs.items()}
+        fill(out)
+        for arr in out.values():
+            arr.flush()
+        return list(specs)
+    arrays = _write_entry(key, config, write, max_bytes)
+    print(f'Preprocessed in {time.perf_counter() - start:.1f}s, cached as {key}')
+    return arrays
+
+def file_digests(named_paths):
+    # Content hashes of {name: path}, through the manifest
+    manifest = Manifest()
+    digests = manifest.digests(named_paths)
+    manifest.save()
+    return digests
+
+def split_arrays(part, split, fold=0):
+    # Gravity-filtered windows and labels of one side of a split (see splits.py): (X, y, classes)
+    from downsample import gravity_alpha, store_rate
+    from preprocessing import remove_gravity_batch
+    from splits import split_indices, split_meta, split_path
+    store, idx = split_indices(part, split, fold)
+    source = split_meta(split)['source']
+    rate = store_rate(store)
+    alpha = gravity_alpha(rate)
+    digests = file_digests({'windows': os.path.join(source, 'windows.npy'),
+                            'labels': os.path.join(source, 'labels.npy'), 'split': split_path(split)})
+    config = {'kind': 'split', 'part': part, 'split': split, 'fold': fold, 'gravity': 'window', 'alpha': alpha,
+              'sample_rate': rate, 'window_size': int(store.windows.shape[1]),
+              'step_size': (store.meta.get('config') or {}).get('step_size')}
+    arrays = cached(digests, config, lambda: {'X': remove_gravity_batch(store.windows[idx], alpha),
+                                              'y': np.asarray(store.labels[idx], dtype=np.int64)})
+    return arrays['X'], arrays['y'], store.classes
+
+def split_stream_windows(part, split, fold=0, preprocessing=None):
+    # The windows of one side of a split, cut from their source recordings gravity-filtered as whole streams
+    # (as a /stream session filters them) for a model trained with --gravity recording; preprocessing is that
+    # model's preprocessing.json. Same order as split_indices(): (X, y, classes)
+    from downsample import gravity_alpha, resample, store_rate
+    from preprocessing import load_config, remove_gravity_recording
+    from splits import split_indices, split_meta, split_path
+    from windowing import RAW_ROOT, ingest_recordings, sliding_windows
+    preprocessing = preprocessing or load_config()
+    store, idx = split_indices(part, split, fold)
+    source = split_meta(split)['source']
+    root = (store.meta.get('config') or {}).get('root', RAW_ROOT)
+    rate = store_rate(store)
+    # The model's filter constant at the store's rate
+    alpha = gravity_alpha(rate, preprocessing['alpha'], source_rate=preprocessing['sample_rate'])
+    recordings, inputs = ingest_recordings(root)
+    rec_ids = store.recording_ids[idx]
+    names = [store.recordings[r] for r in np.unique(rec_ids)]
+    missing = [n for n in names if n not in recordings]
+    if missing:
+        raise ValueError(f"{', '.join(missing)} of {source} no longer in {root}; rebuild the store and the split")
+    window_size = int(store.windows.shape[1])
+    digests = file_digests({'split': split_path(split)})
+    digests.update({name: inputs[name] for name in names})
+    config = {'kind': 'split-stream', 'part': part, 'split': split, 'fold': fold, 'gravity': 'recording',
+              'alpha': alpha, 'sample_rate': rate, 'window_size': window_size}
+
+    def build():
+        X = np.empty((len(idx), window_size, store.windows.shape[2]), dtype=np.float32)
+        for r in np.unique(rec_ids):
+            samples = remove_gravity_recording(resample(recordings[store.recordings[r]], rate), alpha)
+            mask = rec_ids == r
+            X[mask] = sliding_windows(samples, window_size, 1)[store.offsets[idx[mask]]]
+        return {'X': X, 'y': np.asarray(store.labels[idx], dtype=np.int64)}
+
+    arrays = cached(digests, config, build)
+    return arrays['X'], arrays['y'], store.classes
+
+def csv_window_arrays(root, classes, window_size=100, alpha=0.8):
+    # Gravity-filtered windows from a folder of per-window CSVs (root/<class>/*.csv): (X, y); raw with alpha None
+    from ingest import READER_VERSION, N_CHANNELS, format_bad_rows, parse_recording
+    from preprocessing import remove_gravity_batch
+    files = {f'{c}/{f}': os.path.join(root, c, f) for c in classes
+             for f in sorted(os.listdir(os.path.join(root, c))) if f.endswith('.csv')}
+    config = {'kind': 'csv-windows', 'root': root, 'classes': list(classes), 'window_size': window_size,
+              'gravity': 'window' if alpha is not None else None, 'alpha': alpha, 'reader': READER_VERSION}
+
+    def build():
+        X, y = [], []
+        for name, path in files.items():
+            samples, bad_rows, _ = parse_recording(path)
+            if bad_rows:
+                print(f'Warning: {format_bad_rows(path, bad_rows)}')
+            # Only use windows of the correct shape
+            if samples.shape == (window_size, N_CHANNELS):
+                X.append(samples)
+                y.append(list(classes).index(name.split('/', 1)[0]))
+        X = np.array(X, dtype=np.float32).reshape(-1, window_size, N_CHANNELS)
+        return {'X': remove_gravity_batch(X, alpha) if alpha is not None else X, 'y': np.array(y, dtype=np.int64)}
+
+    arrays = cached(file_digests(files), config, build)
+    return arrays['X'], arrays['y']
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Inspect or trim the preprocessed-array cache.')
+    parser.add_argument('command', choices=['list', 'clear', 'evict'])
+    parser.add_argument('--max-mb', type=float, default=MAX_BYTES / 2**20, help='Size bound for evict')
+    args = parser.parse_args(argv)
+    if args.command == 'list':
+        entries = list_entries()
+        for key, size, used in entries:
+            with open(os.path.join(entry_path(key), 'meta.json'), 'r') as f:
+                config = json.load(f)['config']
+            print(f"{key}  {size / 2**20:8.1f} MB  last used {time.strftime('%Y-%m-%d %H:%M', time.localtime(used))}  "
+                  f"{json.dumps(config, sort_keys=True)}")
+        print(f'{len(entries)} entries, {sum(e[1] for e in entries) / 2**20:.1f} MB in {CACHE_ROOT}')
+    elif args.command == 'clear':
+        shutil.rmtree(CACHE_ROOT, ignore_errors=True)
+        print(f'Removed {CACHE_ROOT}')
+    else:
+        evicted = evict(int(args.max_mb * 2**20))
+        print(f'Evicted {len(evicted)} entries')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
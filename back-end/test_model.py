@@ -1,12 +1,22 @@
+from thread_config import apply_thread_config
+
+# Size the CPU thread pools for this host before numpy/TensorFlow start them (see tune_threads.py)
+apply_thread_config()
+
 import os
 import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
 from tensorflow.keras.models import load_model
 from sklearn.metrics import confusion_matrix, ConfusionMatrixDisplay
 import json
+from inference import load_preprocessing, model_inputs
+from splits import DEFAULT_SPLIT, load_split_windows, split_exists
+from tensor_cache import csv_window_arrays, split_stream_windows
 
 DATA_DIR = 'data/test'
+# Test side of the split index over the window store (see splits.py); the per-window CSV folder
+# is only used when no split exists
+SPLIT = DEFAULT_SPLIT
 WINDOW_SIZE = 100
 N_CHANNELS = 6
 MODEL_PATH = 'cnn_motion_model.keras'
@@ -15,46 +25,43 @@ MODEL_PATH = 'cnn_motion_model.keras'
 with open('class_labels.json', 'r') as f:
     CLASSES = json.load(f)
 
-# Load the trained model
+# Load the trained model, and how its training windows were preprocessed (written by train_model.py)
 model = load_model(MODEL_PATH)
+PREPROCESSING = load_preprocessing()
+STREAM_FILTERED = PREPROCESSING['gravity'] == 'recording'
 
 results = {cls: {'correct': 0, 'total': 0} for cls in CLASSES}
 
-# Gravity removal: high-pass filter (exponential moving average)
-def remove_gravity(df, alpha=0.8):
-    gravity = np.zeros((df.shape[0], 3))
-    filtered = np.zeros((df.shape[0], 3))
-    for i in range(df.shape[0]):
-        if i == 0:
-            gravity[i] = df.iloc[i, 0:3]
-        else:
-            gravity[i] = alpha * gravity[i-1] + (1 - alpha) * df.iloc[i, 0:3]
-        filtered[i] = df.iloc[i, 0:3] - gravity[i]
-    # Replace AccX, AccY, AccZ with gravity-free values
-    df_filtered = df.copy()
-    df_filtered.iloc[:, 0:3] = filtered
-    return df_filtered
+all_true = []
+all_pred = []
+USE_STORE = split_exists(SPLIT)
 
-for class_idx, class_name in enumerate(CLASSES):
-    class_dir = os.path.join(DATA_DIR, class_name)
-    for fname in os.listdir(class_dir):
-        fpath = os.path.join(class_dir, fname)
-        if fname.endswith('.csv') and os.path.isfile(fpath):
-            df = pd.read_csv(fpath, header=None)
-            # Always use columns 0-5 for AccX,AccY,AccZ,GyroX,GyroY,GyroZ
-            if df.shape[1] >= 6:
-                df = df.iloc[:, [0,1,2,3,4,5]]
-            # Convert all values to float, coerce errors to NaN, drop NaN rows
-            df = df.apply(pd.to_numeric, errors='coerce').dropna()
-            # Remove gravity from AccX, AccY, AccZ
-            df = remove_gravity(df)
-            if df.shape == (WINDOW_SIZE, N_CHANNELS):
-                x = df.values.astype(np.float32).reshape(1, WINDOW_SIZE, N_CHANNELS)
-                pred = model.predict(x)
-                pred_class = np.argmax(pred)
-                results[class_name]['total'] += 1
-                if pred_class == class_idx:
-                    results[class_name]['correct'] += 1
+filtered = None
+if USE_STORE:
+    # Raw test side of the split; a --gravity recording model gets the same windows cut from whole filtered
+    # recordings, as /stream serves it (kept in the preprocessed-array cache for repeat runs)
+    X, labels, store_classes = load_split_windows('test', SPLIT)
+    if STREAM_FILTERED:
+        filtered, _, _ = split_stream_windows('test', SPLIT, preprocessing=PREPROCESSING)
+elif STREAM_FILTERED:
+    raise SystemExit(f'{MODEL_PATH} was trained with --gravity recording, which needs the recordings behind the '
+                     f'test windows; {DATA_DIR} only has cut windows. Create a split (see splits.py)')
+else:
+    # Raw per-window CSVs, parsed once (see tensor_cache.py)
+    X, labels = csv_window_arrays(DATA_DIR, CLASSES, WINDOW_SIZE, alpha=None)
+    store_classes = CLASSES
+# Gravity-filtered and resampled to the model's rate exactly as the server prepares a window
+X = model_inputs(model, X, PREPROCESSING['alpha'], filtered)
+# One batched predict call instead of one per window
+preds = np.argmax(model.predict(X, batch_size=256), axis=1) if len(X) else []
+for label, pred_class in zip(labels, preds):
+    class_name = store_classes[label]
+    class_idx = CLASSES.index(class_name)
+    results[class_name]['total'] += 1
+    if pred_class == class_idx:
+        results[class_name]['correct'] += 1
+    all_true.append(class_idx)
+    all_pred.append(int(pred_class))
 
 # Calculate accuracy for each class
 accuracies = []
@@ -77,25 +84,6 @@ print('Saved accuracy graph as test_accuracy_per_activity.png')
 
 # Additional graphs
 # 1. Confusion Matrix
-all_true = []
-all_pred = []
-for class_idx, class_name in enumerate(CLASSES):
-    class_dir = os.path.join(DATA_DIR, class_name)
-    for fname in os.listdir(class_dir):
-        fpath = os.path.join(class_dir, fname)
-        if fname.endswith('.csv') and os.path.isfile(fpath):
-            df = pd.read_csv(fpath, header=None)
-            if df.shape[1] >= 6:
-                df = df.iloc[:, [0,1,2,3,4,5]]
-            df = df.apply(pd.to_numeric, errors='coerce').dropna()
-            # Remove gravity from AccX, AccY, AccZ (was missing in confusion matrix section)
-            df = remove_gravity(df)
-            if df.shape == (WINDOW_SIZE, N_CHANNELS):
-                x = df.values.astype(np.float32).reshape(1, WINDOW_SIZE, N_CHANNELS)
-                pred = model.predict(x)
-                pred_class = np.argmax(pred)
-                all_true.append(class_idx)
-                all_pred.append(pred_class)
 cm = confusion_matrix(all_true, all_pred)
 disp = ConfusionMatrixDisplay(confusion_matrix=cm, display_labels=CLASSES)
 plt.figure(figsize=(8, 6))
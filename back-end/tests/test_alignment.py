@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from alignment import StreamAligner, align_streams
+
+def streams(duration=3.0, acc_rate=97.0, gyro_rate=103.0, gap=None):
+    # Two smooth signals sampled at different, unsynchronized rates as [[t, x, y, z], ...];
+    # gap=(start, end) removes both streams' samples in that interval
+    rng = np.random.default_rng(0)
+    out = []
+    for rate, offset in ((acc_rate, 0.003), (gyro_rate, 0.007)):
+        t = offset + np.arange(int(duration * rate)) / rate + rng.uniform(0, 2e-3, int(duration * rate))
+        if gap is not None:
+            t = t[(t < gap[0]) | (t > gap[1])]
+        values = np.stack([np.sin(t * (c + 1)) for c in range(3)], axis=1)
+        out.append(np.column_stack([t, values]).tolist())
+    return out
+
+def push_in_chunks(aligner, acc, gyro, chunk):
+    pushed = []
+    for start in range(0, max(len(acc), len(gyro)), chunk):
+        pushed.append(aligner.push(acc[start:start + chunk], gyro[start:start + chunk]))
+    return np.concatenate(pushed)
+
+@pytest.mark.parametrize('chunk', [1, 7, 50, 1000])
+def test_chunked_push_matches_whole_recording(chunk):
+    acc, gyro = streams()
+    _, expected = align_streams(acc, gyro)
+    samples = push_in_chunks(StreamAligner(), acc, gyro, chunk)
+    assert samples.shape == expected.shape
+    np.testing.assert_allclose(samples, expected, atol=1e-5)
+
+def test_chunked_windows_match_whole_recording():
+    acc, gyro = streams()
+    _, expected = align_streams(acc, gyro)
+    aligner = StreamAligner()
+    windows = []
+    for start in range(0, len(acc), 20):
+        aligner.push(acc[start:start + 20], gyro[start:start + 20])
+        windows += [w for w, _ in aligner.pop_windows(100, 50)]
+    assert len(windows) == (len(expected) - 100) // 50 + 1
+    for i, window in enumerate(windows):
+        np.testing.assert_allclose(window, expected[i * 50:i * 50 + 100], atol=1e-5)
+
+def test_gap_resets_pending_samples():
+    acc, gyro = streams(gap=(1.0, 1.5))
+    aligner = StreamAligner()
+    push_in_chunks(aligner, acc, gyro, 10)
+    # Only the samples after the gap are left to cut windows from: none straddles it
+    grid, expected = align_streams(acc, gyro)
+    after = expected[grid > 1.5]
+    assert 0 < len(after) < len(expected)
+    assert len(aligner.pending) == len(after)
+    np.testing.assert_allclose(aligner.pending, after, atol=1e-5)
+
+def test_gap_resets_gravity_filter():
+    acc, gyro = streams(gap=(1.0, 1.5))
+    aligner = StreamAligner(gravity_alpha=0.9)
+    push_in_chunks(aligner, acc, gyro, 10)
+    # The filter restarts after the gap, as if the session had started there
+    restarted = StreamAligner(gravity_alpha=0.9).gravity(aligner.pending)
+    np.testing.assert_allclose(aligner.pending_filtered, restarted, atol=1e-5)
@@ -0,0 +1,72 @@
+import os
+import shutil
+import numpy as np
+import keras
+from tensorflow.keras.callbacks import Callback, EarlyStopping
+from checkpoint import TrainingCheckpoint, read_checkpoint
+from train_model import ArrayWindows, WindowBatches
+
+EPOCHS = 3
+
+class KeepFirst(Callback):
+    # Copies the checkpoint written after the first epoch, as if the run had been killed there
+    def __init__(self, path, copy_path):
+        super().__init__()
+        self.path, self.copy_path = path, copy_path
+
+    def on_epoch_end(self, epoch, logs=None):
+        if epoch == 0:
+            shutil.copy(self.path, self.copy_path)
+
+def batches():
+    rng = np.random.default_rng(0)
+    windows = ArrayWindows(rng.standard_normal((64, 20, 6)).astype(np.float32), rng.integers(0, 3, 64))
+    return WindowBatches(windows, np.arange(64), 3, batch_size=16, seed=42)
+
+def build(seed):
+    # Dropout draws its masks from a Keras seed generator, which is not part of get_weights()
+    keras.utils.set_random_seed(seed)
+    model = keras.Sequential([keras.Input((20, 6)), keras.layers.Flatten(), keras.layers.Dense(32, activation='relu'),
+                              keras.layers.Dropout(0.5), keras.layers.Dense(3, activation='softmax')])
+    model.compile(optimizer='adam', loss='categorical_crossentropy')
+    return model
+
+def test_resume_matches_uninterrupted_run(tmp_path):
+    path, saved = str(tmp_path / 'ckpt.npz'), str(tmp_path / 'epoch1.npz')
+    model = build(0)
+    es = EarlyStopping(monitor='loss', patience=10)
+    ckpt = TrainingCheckpoint(path, early_stopping=es)
+    ckpt.track('train_batches', batches())
+    model.fit(ckpt.pipeline['train_batches'], epochs=EPOCHS, callbacks=[es, ckpt, KeepFirst(path, saved)], verbose=0)
+    # A run that finishes removes its checkpoint
+    assert not os.path.exists(path)
+    assert read_checkpoint(saved)[0]['epoch'] == 1
+
+    # Different initial weights and RNG state: everything the second and third epochs depend on comes from the checkpoint
+    resumed = build(1)
+    es2 = EarlyStopping(monitor='loss', patience=10)
+    ckpt = TrainingCheckpoint(saved, resume=True, early_stopping=es2)
+    train_batches = ckpt.track('train_batches', batches())
+    initial_epoch = ckpt.restore(resumed)
+    assert initial_epoch == 1
+    resumed.fit(train_batches, epochs=EPOCHS, initial_epoch=initial_epoch, callbacks=[es2, ckpt], verbose=0)
+
+    for a, b in zip(model.get_weights(), resumed.get_weights()):
+        np.testing.assert_array_equal(a, b)
+    for a, b in zip(model.optimizer.variables, resumed.optimizer.variables):
+        np.testing.assert_array_equal(np.asarray(a), np.asarray(b))
+    assert es2.best == es.best
+
+def test_resume_rejects_other_training_mode(tmp_path):
+    path = str(tmp_path / 'ckpt.npz')
+    model = build(0)
+    ckpt = TrainingCheckpoint(path, every=1)
+    ckpt.set_model(model)
+    ckpt.save(1)
+    resumed = TrainingCheckpoint(path, resume=True)
+    try:
+        resumed.track('train_batches', batches())
+    except ValueError as e:
+        assert 'train_batches' in str(e)
+    else:
+        raise AssertionError('expected a ValueError for state the checkpoint does not have')
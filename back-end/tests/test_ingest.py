@@ -0,0 +1,47 @@
+import numpy as np
+from ingest import COLUMNS, detect_header, parse_recording
+
+ROWS = [[0.1, 0.2, 9.8, 0.01, 0.02, 0.03], [0.2, 0.1, 9.7, 0.02, 0.01, 0.0], [0.3, 0.0, 9.9, 0.0, 0.0, 0.01]]
+
+def write_csv(path, lines):
+    path.write_text('\n'.join(lines) + '\n')
+    return str(path)
+
+def rows(values):
+    return [','.join(str(v) for v in row) for row in values]
+
+def test_header_row_is_skipped(tmp_path):
+    path = write_csv(tmp_path / 'rec.csv', [','.join(COLUMNS)] + rows(ROWS))
+    samples, bad_rows, _ = parse_recording(path)
+    assert detect_header(path)
+    assert bad_rows == []
+    assert samples.dtype == np.float32
+    np.testing.assert_allclose(samples, np.array(ROWS, dtype=np.float32))
+
+def test_headerless_file_keeps_first_row(tmp_path):
+    path = write_csv(tmp_path / 'rec.csv', rows(ROWS))
+    samples, bad_rows, _ = parse_recording(path)
+    assert not detect_header(path)
+    assert bad_rows == []
+    assert len(samples) == len(ROWS)
+
+def test_extra_columns_are_ignored(tmp_path):
+    path = write_csv(tmp_path / 'rec.csv', rows([row + [123] for row in ROWS]))
+    samples, bad_rows, _ = parse_recording(path)
+    assert bad_rows == []
+    assert samples.shape == (len(ROWS), len(COLUMNS))
+
+def test_bad_rows_are_reported_with_line_numbers(tmp_path):
+    lines = [','.join(COLUMNS)] + rows(ROWS[:1]) + ['1,2,3'] + rows(ROWS[1:2]) + ['1,2,x,4,5,6'] + rows(ROWS[2:])
+    path = write_csv(tmp_path / 'rec.csv', lines)
+    samples, bad_rows, engine = parse_recording(path)
+    # Lines count from 1 and include the header
+    assert bad_rows == [(3, '3 columns'), (5, 'non-numeric value')]
+    assert engine == 'tolerant'
+    np.testing.assert_allclose(samples, np.array(ROWS, dtype=np.float32))
+
+def test_non_finite_rows_are_dropped(tmp_path):
+    lines = rows(ROWS[:1]) + ['nan,0,0,0,0,0'] + rows(ROWS[1:]) + ['0,inf,0,0,0,0']
+    samples, bad_rows, _ = parse_recording(write_csv(tmp_path / 'rec.csv', lines))
+    assert bad_rows == [(2, 'non-finite value'), (5, 'non-finite value')]
+    np.testing.assert_allclose(samples, np.array(ROWS, dtype=np.float32))
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from sparse_model import SparseCNN, export_sparse
+from train_model import build_cnn_model
+
+@pytest.fixture(scope='module')
+def model():
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((64, 100, 6)).astype(np.float32)
+    y = np.eye(3, dtype=np.float32)[rng.integers(0, 3, len(X))]
+    model = build_cnn_model((100, 6), 3, X)
+    # One epoch so the BatchNormalization statistics are not the identity
+    model.fit(X, y, epochs=1, batch_size=16, verbose=0)
+    return model
+
+def windows(n=20):
+    return np.random.default_rng(1).standard_normal((n, 100, 6)).astype(np.float32)
+
+def test_dense_export_matches_keras(model, tmp_path):
+    path = export_sparse(model, str(tmp_path / 'model.npz'), min_sparsity=1.1)
+    sparse_model = SparseCNN(path)
+    X = windows()
+    assert sparse_model.input_shape[1:] == model.input_shape[1:]
+    np.testing.assert_allclose(sparse_model.predict(X), model.predict(X, verbose=0), atol=1e-5)
+
+def test_pruned_export_matches_keras(model, tmp_path):
+    # Zero 90% of every kernel, as prune.py does, so they are stored and multiplied as CSR
+    weights = model.get_weights()
+    try:
+        for layer in model.layers:
+            if type(layer).__name__ in ('Conv1D', 'Dense'):
+                kernel, bias = layer.get_weights()
+                kernel[np.abs(kernel) < np.quantile(np.abs(kernel), 0.9)] = 0
+                layer.set_weights([kernel, bias])
+        sparse_model = SparseCNN(export_sparse(model, str(tmp_path / 'pruned.npz')))
+        assert all(spec['sparse'] for spec in sparse_model.layers if spec['kind'] in ('Conv1D', 'Dense'))
+        X = windows()
+        np.testing.assert_allclose(sparse_model.predict(X, batch_size=7), model.predict(X, verbose=0), atol=1e-5)
+    finally:
+        model.set_weights(weights)
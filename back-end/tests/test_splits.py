@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+import splits
+from splits import create_split, grouped_holdout, grouped_split, kfold, random_split, split_indices
+from window_store import write_store
+
+def recordings(n_recordings=12, n_classes=3, seed=0):
+    # (recording id, label) per window: recordings of different lengths, each of one class
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(5, 40, n_recordings)
+    groups = np.repeat(np.arange(n_recordings), sizes)
+    labels = np.repeat(np.arange(n_recordings) % n_classes, sizes)
+    return groups, labels
+
+def assert_disjoint(groups, parts):
+    train, test = parts['train'], parts['test']
+    assert len(np.intersect1d(train, test)) == 0
+    assert len(train) + len(test) == len(groups)
+    assert not set(groups[train]) & set(groups[test])
+
+@pytest.mark.parametrize('stratify', [True, False])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_grouped_split_keeps_recordings_on_one_side(stratify, seed):
+    groups, labels = recordings(seed=seed)
+    parts = grouped_split(groups, labels, seed=seed, stratify=stratify)
+    assert_disjoint(groups, parts)
+    # Every class keeps a recording on the training side
+    assert set(labels[parts['train']]) == set(labels)
+
+@pytest.mark.parametrize('stratify', [True, False])
+def test_grouped_kfold_keeps_recordings_on_one_side(stratify):
+    groups, labels = recordings()
+    folds = kfold(labels, k=4, groups=groups, stratify=stratify)
+    for parts in folds:
+        assert_disjoint(groups, parts)
+    # Every window is tested exactly once
+    np.testing.assert_array_equal(np.sort(np.concatenate([f['test'] for f in folds])), np.arange(len(groups)))
+
+def test_random_split_partitions_windows():
+    groups, labels = recordings()
+    parts = random_split(labels, test_ratio=0.25)
+    assert len(np.intersect1d(parts['train'], parts['test'])) == 0
+    assert len(parts['train']) + len(parts['test']) == len(labels)
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(splits, 'SPLIT_ROOT', str(tmp_path / 'splits'))
+    groups, labels = recordings()
+    path = str(tmp_path / 'store')
+    write_store(path, np.zeros((len(groups), 10, 6), dtype=np.float32), labels, groups,
+                np.zeros(len(groups), dtype=np.int32), ['a', 'b', 'c'], [f'r{i}.csv' for i in range(groups.max() + 1)])
+    return path
+
+def test_saved_grouped_split_keeps_recordings_on_one_side(store):
+    create_split('grouped', strategy='grouped', source=store)
+    train_store, train = split_indices('train', 'grouped')
+    _, test = split_indices('test', 'grouped')
+    rec = np.asarray(train_store.recording_ids)
+    assert_disjoint(rec, {'train': train, 'test': test})
+    # The validation holdout inside the training side is grouped as well
+    fit, val = grouped_holdout('train', 'grouped', ratio=0.2)
+    assert not set(rec[train[fit]]) & set(rec[train[val]])
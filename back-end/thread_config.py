@@ -0,0 +1,51 @@
+import os
+import json
+import platform
+
+# Per-host CPU threading configuration written by tune_threads.py.
+# Kept free of numpy/TensorFlow imports so it can run before either starts its thread pools.
+THREAD_CONFIG_PATH = os.getenv('THREAD_CONFIG_PATH', 'thread_config.json')
+BLAS_ENV_VARS = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS']
+
+def host_key():
+    # Instance types differ in core count and CPU model, so both go into the key
+    cpu = platform.processor() or platform.machine()
+    return f"{platform.node()}|{cpu}|{os.cpu_count()}"
+
+def load_configs(path=THREAD_CONFIG_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def save_config(config, path=THREAD_CONFIG_PATH, key=None):
+    configs = load_configs(path)
+    configs[key or host_key()] = config
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(configs, f, indent=2)
+    os.replace(tmp_path, path)
+
+def get_config(path=THREAD_CONFIG_PATH, key=None):
+    return load_configs(path).get(key or host_key())
+
+def set_blas_threads(n_threads):
+    # Only effective before numpy / TensorFlow load their BLAS and OpenMP runtimes
+    for var in BLAS_ENV_VARS:
+        os.environ[var] = str(n_threads)
+
+def set_tf_threads(intra_op, inter_op):
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+
+def apply_thread_config(path=THREAD_CONFIG_PATH):
+    config = get_config(path)
+    if not config:
+        print(f"No tuned thread configuration for this host in {path}, using defaults")
+        return None
+    set_blas_threads(config['blas_threads'])
+    set_tf_threads(config['intra_op'], config['inter_op'])
+    print(f"Applied thread configuration: intra_op={config['intra_op']}, "
+          f"inter_op={config['inter_op']}, blas={config['blas_threads']}")
+    return config
@@ -1,113 +1,486 @@
 import os
+import math
+import argparse
 import numpy as np
-import pandas as pd
 from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler
 import tensorflow
 from tensorflow.keras.models import Sequential
 from tensorflow.keras.layers import Conv1D, MaxPooling1D, Flatten, Dense, Dropout, BatchNormalization
-from tensorflow.keras.utils import to_categorical
+from tensorflow.keras.utils import to_categorical, Sequence
 from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint
 from tensorflow.keras.optimizers import Adam
 import json
+from preprocessing import GRAVITY_MODES, remove_gravity_batch, remove_gravity_recording, save_config
+from sampling import STRATEGIES, ClassSampler
+from augment import Augmenter
+from downsample import SOURCE_RATE, gravity_alpha, scale_length, store_rate
+from splits import DEFAULT_SPLIT, grouped_holdout, load_split_windows, split_exists, split_indices, split_meta
+from tensor_cache import csv_window_arrays, file_digests, split_arrays
+from window_store import load_store
+from manifest import Manifest
+from checkpoint import CHECKPOINT_PATH, EVERY_EPOCHS, TrainingCheckpoint, saved_config
+from windowing import RecordingWindows, RAW_ROOT, STEP_SIZE
 
 # Settings
 DATA_DIR = 'data/train'
-# Always sort class folders for consistent mapping
-CLASSES = sorted([d for d in os.listdir(DATA_DIR) if os.path.isdir(os.path.join(DATA_DIR, d))])
+# Train side of the split index over the window store (see splits.py); the per-window CSV folder
+# is only used when no split exists
+SPLIT = DEFAULT_SPLIT
+# Always sort class folders for consistent mapping (stores keep their classes sorted)
+if split_exists(SPLIT):
+    CLASSES = load_store(split_meta(SPLIT)['source']).classes
+else:
+    CLASSES = sorted([d for d in os.listdir(DATA_DIR) if os.path.isdir(os.path.join(DATA_DIR, d))])
 WINDOW_SIZE = 100
 N_CHANNELS = 6
 BATCH_SIZE = 64
 EPOCHS = 75
 LEARNING_RATE = 0.0001
+# Model architecture (see build_cnn_model); hparam_search.py explores alternatives
+FILTERS = (32, 64)
+KERNEL_SIZE = 3
+DENSE_UNITS = 128
+DROPOUT = 0.5
+# Class balancing applied to the training windows at load time (see sampling.py)
+BALANCE = 'undersample'
+# Share of the training recordings held out for validation when training straight from recordings
+VAL_RATIO = 0.2
+# Windows used to adapt the Normalization layer when training straight from recordings
+NORM_SAMPLE_SIZE = 4096
+# Gravity filtering of the training windows (see preprocessing.py); 'recording' needs --source raw
+GRAVITY = 'window'
+# Batches prepared ahead of training by background threads (Keras PyDataset workers)
+PREFETCH_WORKERS = 4
+PREFETCH_QUEUE = 16
 
-# Gravity removal: high-pass filter (exponential moving average)
-def remove_gravity(df, alpha=0.8):
-    gravity = np.zeros((df.shape[0], 3))
-    filtered = np.zeros((df.shape[0], 3))
-    for i in range(df.shape[0]):
-        if i == 0:
-            gravity[i] = df.iloc[i, 0:3]
-        else:
-            gravity[i] = alpha * gravity[i-1] + (1 - alpha) * df.iloc[i, 0:3]
-        filtered[i] = df.iloc[i, 0:3] - gravity[i]
-    # Replace AccX, AccY, AccZ with gravity-free values
-    df_filtered = df.copy()
-    df_filtered.iloc[:, 0:3] = filtered
-    return df_filtered
-
-def load_dataset():
-    X, y = [], []
-    for class_idx, class_name in enumerate(CLASSES):
-        class_dir = os.path.join(DATA_DIR, class_name)
-        for fname in os.listdir(class_dir):
-            fpath = os.path.join(class_dir, fname)
-            if fname.endswith('.csv'):
-                df = pd.read_csv(fpath, header=None)  # No header, just data
-                # Skip files with insufficient columns
-                if df.shape[1] < 6:
-                    print(f"Warning: {fpath} has only {df.shape[1]} columns, skipping.")
-                    continue
-                # Use columns 0-5: AccX, AccY, AccZ, GyroX, GyroY, GyroZ
-                df_sensor = df.iloc[:, [0, 1, 2, 3, 4, 5]]
-                # Convert all values to float, coerce errors to NaN
-                df_sensor = df_sensor.apply(pd.to_numeric, errors='coerce')
-                # Drop rows with any NaN values
-                df_sensor = df_sensor.dropna()
-                # Remove gravity from AccX, AccY, AccZ
-                df_sensor = remove_gravity(df_sensor)
-                # Only use windows of the correct shape
-                if df_sensor.shape == (WINDOW_SIZE, N_CHANNELS):
-                    X.append(df_sensor.values)
-                    y.append(class_idx)
-    X, y = np.array(X), np.array(y)
+def load_store_dataset(split=SPLIT, fold=0, gravity=True):
+    # Only the split's windows are read from the mmapped store; gravity removal runs over the whole batch at once
+    if not gravity:
+        windows, labels, _ = load_split_windows('train', split, fold)
+        return windows, np.asarray(labels, dtype=np.int64)
+    # Filtered with the alpha for the store's rate, and kept in the preprocessed-array cache for later runs
+    X, y, _ = split_arrays('train', split, fold)
+    return X, y
 
+def load_dataset(split=SPLIT, fold=0):
+    if split_exists(split):
+        X, y = load_store_dataset(split, fold)
+        with open('class_labels.json', 'w') as f:
+            json.dump(CLASSES, f)
+        rate = store_rate(load_store(split_meta(split)['source']))
+        save_config('window', gravity_alpha(rate), rate)
+        return X, y
+    # Parsed and gravity-filtered once, then served from the preprocessed-array cache (see tensor_cache.py)
+    X, y = csv_window_arrays(DATA_DIR, CLASSES, WINDOW_SIZE)
 
     # Save the class labels in sorted order
     with open('class_labels.json', 'w') as f:
         json.dump(CLASSES, f)
+    save_config('window', 0.8, SOURCE_RATE)
 
     return X, y
 
-def build_cnn_model(input_shape, n_classes, X_train):
+def build_cnn_model(input_shape, n_classes, X_train, learning_rate=LEARNING_RATE, filters=FILTERS,
+                    kernel_size=KERNEL_SIZE, dense=DENSE_UNITS, dropout=DROPOUT):
     from tensorflow.keras.layers import Normalization
     norm_layer = Normalization()
     norm_layer.adapt(X_train)
-    model = Sequential([
-        norm_layer,
-        Conv1D(32, kernel_size=3, activation='relu', input_shape=input_shape),
-        BatchNormalization(),
-        MaxPooling1D(pool_size=2),
-
-        Conv1D(64, kernel_size=3, activation='relu'),
-        BatchNormalization(),
-        MaxPooling1D(pool_size=2),
-
-        # Removed extra Conv1D layers to match the described architecture (2 Conv1D layers)
+    layers = [norm_layer]
+    # One Conv1D block per entry of filters (2 Conv1D layers by default, as described)
+    for i, n_filters in enumerate(filters):
+        shape = {'input_shape': input_shape} if i == 0 else {}
+        layers += [
+            Conv1D(n_filters, kernel_size=kernel_size, activation='relu', **shape),
+            BatchNormalization(),
+            MaxPooling1D(pool_size=2),
+        ]
+    model = Sequential(layers + [
         Flatten(),
-        Dense(128, activation='relu'),
+        Dense(dense, activation='relu'),
         BatchNormalization(),
-        Dropout(0.5),
+        Dropout(dropout),
         Dense(n_classes, activation='softmax')
     ])
-    model.compile(optimizer=Adam(learning_rate=LEARNING_RATE),
+    model.compile(optimizer=Adam(learning_rate=learning_rate),
                   loss='categorical_crossentropy',
                   metrics=['accuracy'])
     return model
 
-def main():
+def training_callbacks(model, ckpt):
+    # EarlyStopping, the best-model file and the full-state checkpoint (restored into model on --resume).
+    # Returns (callbacks, initial_epoch) for model.fit
+    es = EarlyStopping(monitor='val_loss', patience=8, restore_best_weights=True)
+    checkpoint = ModelCheckpoint('best_model.h5', monitor='val_accuracy', save_best_only=True)
+    ckpt.early_stopping, ckpt.best_checkpoint = es, checkpoint
+    return [es, checkpoint, ckpt], ckpt.restore(model)
+
+def architecture(args):
+    # build_cnn_model keyword arguments from the command line
+    return {'filters': tuple(args.filters), 'kernel_size': args.kernel_size, 'dense': args.dense,
+            'dropout': args.dropout}
+
+class WindowBatches(Sequence):
+    # Feeds model.fit from lazy recording windows; only the current batch is ever copied
+    def __init__(self, windows, indices, n_classes, batch_size=BATCH_SIZE, shuffle=True, seed=42, sampler=None,
+                 alpha=0.8, augmenter=None, **kwargs):
+        super().__init__(**kwargs)
+        self.alpha = alpha
+        self.augmenter = augmenter
+        self.epoch = 0
+        self.windows = windows
+        self.indices = np.asarray(indices)
+        self.n_classes = n_classes
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.sampler = sampler
+        self.rng = np.random.default_rng(seed)
+        self.order = self._epoch_order()
+
+    def _epoch_order(self):
+        # A balancing sampler draws a fresh selection every epoch, so over several epochs all windows are used
+        if self.sampler is not None:
+            return self.sampler.sample(self.indices)
+        return self.rng.permutation(self.indices) if self.shuffle else self.indices
+
+    def __len__(self):
+        return math.ceil(len(self.order) / self.batch_size)
+
+    def __getitem__(self, i):
+        idx = self.order[i * self.batch_size:(i + 1) * self.batch_size]
+        if self.augmenter is not None:
+            # Augmented on raw windows (gravity included, so rotations move it too), before gravity removal
+            rng = self.augmenter.rng(self.epoch, i)
+            X = self.augmenter(self.augmenter.load(self.windows, idx, rng), rng)
+        else:
+            X = self.windows.batch(idx)
+        if self.alpha is not None:
+            X = remove_gravity_batch(X, self.alpha)
+        y = to_categorical(self.windows.labels[idx], num_classes=self.n_classes)
+        return X, y
+
+    def on_epoch_begin(self):
+        # Each epoch's order is drawn as it starts: fit() also calls on_epoch_end once while setting up, before the
+        # first epoch, which would put a resumed run (see checkpoint.py) one draw ahead of the interrupted one
+        self.epoch += 1
+        if self.shuffle or self.sampler is not None:
+            self.order = self._epoch_order()
+
+    def get_state(self):
+        # Position in training (see checkpoint.py): the RNG the next epoch's order comes from and the augmentation epoch
+        return {'epoch': self.epoch, 'rng': self.rng.bit_generator.state, 'order': np.asarray(self.order)}
+
+    def set_state(self, state):
+        self.epoch = state['epoch']
+        self.rng.bit_generator.state = state['rng']
+        self.order = state['order']
+
+class ArrayWindows:
+    # In-memory raw windows with the batch()/labels interface of RecordingWindows
+    def __init__(self, windows, labels):
+        self.windows = windows
+        self.labels = np.asarray(labels)
+
+    def batch(self, indices):
+        return np.asarray(self.windows[indices], dtype=np.float32)
+
+class SampledArrays(Sequence):
+    # In-memory windows, redrawn through a balancing sampler every epoch
+    def __init__(self, X, y, sampler, batch_size=BATCH_SIZE, **kwargs):
+        super().__init__(**kwargs)
+        self.X = X
+        self.y = y
+        self.sampler = sampler
+        self.batch_size = batch_size
+        self.order = sampler.sample(np.arange(len(X)))
+
+    def __len__(self):
+        return math.ceil(len(self.order) / self.batch_size)
+
+    def __getitem__(self, i):
+        idx = self.order[i * self.batch_size:(i + 1) * self.batch_size]
+        return self.X[idx], self.y[idx]
+
+    def on_epoch_begin(self):
+        # Drawn as each epoch starts, like WindowBatches
+        self.order = self.sampler.sample(np.arange(len(self.X)))
+
+    def get_state(self):
+        return {'order': np.asarray(self.order)}
+
+    def set_state(self, state):
+        self.order = state['order']
+
+def index_recordings(window_size, step, rate=SOURCE_RATE):
+    # Recordings come from the parsed-recording cache (windowing.ingest_recordings); only new or changed
+    # CSVs are parsed again
+    manifest = Manifest()
+    windows = RecordingWindows.from_directory(RAW_ROOT, window_size=window_size, step=step, manifest=manifest,
+                                              rate=None if rate == SOURCE_RATE else rate)
+    manifest.save()
+    return windows
+
+def split_recording_windows(windows, rate=SOURCE_RATE, split=SPLIT, fold=0, seed=42):
+    # (fit, validation) indices into windows cut from the raw recordings, kept apart from the split that
+    # test_model.py and the other benchmarks score on: a window sharing any sample with a test-side window of
+    # the split is left out (with a grouped split, whole test recordings), and validation takes the recordings
+    # splits.grouped_holdout holds out of the train side, as prune.py and distill.py do, so no validation window
+    # overlaps a training window. Recordings the split's store does not have are left out too.
+    if not split_exists(split):
+        raise SystemExit(f'--source raw needs a split to keep its test recordings out (see splits.py); '
+                         f'none named {split}')
+    store, train_idx = split_indices('train', split, fold)
+    _, test_idx = split_indices('test', split, fold)
+    _, val_pos = grouped_holdout('train', split, fold, VAL_RATIO, seed)
+    names = np.array(store.recordings, dtype=object)
+    val_names = np.unique(names[store.recording_ids[train_idx[val_pos]]])
+    # Window spans in units of 1 / (raw rate x store rate) seconds, so windows at either rate compare exactly
+    source_rate = store_rate(store)
+    test_names = names[store.recording_ids[test_idx]]
+    test_starts = np.asarray(store.offsets[test_idx], dtype=np.int64) * rate
+    test_length = store.windows.shape[1] * rate
+    starts = np.asarray(windows.offsets, dtype=np.int64) * source_rate
+    ends = starts + windows.window_size * source_rate
+    recording_names = windows.recording_names()
+    overlaps = np.zeros(len(windows), dtype=bool)
+    for name in np.unique(test_names):
+        t = np.sort(test_starts[test_names == name])
+        mine = np.flatnonzero(recording_names == name)
+        # Any test window starting in (start - test_length, end) shares samples with the window
+        overlaps[mine] = (np.searchsorted(t, ends[mine], 'left') >
+                          np.searchsorted(t, starts[mine] - test_length, 'right'))
+    usable = np.isin(recording_names, names) & ~overlaps
+    is_val = np.isin(recording_names, val_names)
+    fit_idx, val_idx = np.flatnonzero(usable & ~is_val), np.flatnonzero(usable & is_val)
+    print(f"Split '{split}': {len(fit_idx)} training / {len(val_idx)} validation windows from "
+          f"{len(np.unique(recording_names[usable]))} recordings; {int(overlaps.sum())} windows overlapping its "
+          f"test side left out")
+    return fit_idx, val_idx
+
+def train_from_recordings(step=STEP_SIZE, epochs=EPOCHS, batch_size=BATCH_SIZE, learning_rate=LEARNING_RATE,
+                          balance=BALANCE, rate=SOURCE_RATE, augmenter=None, workers=PREFETCH_WORKERS,
+                          gravity=GRAVITY, arch=None, ckpt=None, split=SPLIT, fold=0):
+    # Every valid overlapped window of the raw recordings outside the split's test side, without writing
+    # window files
+    print('Indexing raw recordings...')
+    window_size, step = scale_length(WINDOW_SIZE, rate), scale_length(step, rate)
+    windows = index_recordings(window_size, step, rate)
+    classes = windows.classes
+    alpha = gravity_alpha(rate)
+    with open('class_labels.json', 'w') as f:
+        json.dump(classes, f)
+    save_config(gravity, alpha, rate)
+    if gravity == 'recording':
+        # Filtered once per recording, as the server's per-session GravityFilter does; batches are then
+        # cut from the filtered signal (a rotation commutes with the filter, so augmenting afterwards is fine)
+        windows = windows.map_recordings(lambda r: remove_gravity_recording(r, alpha))
+        alpha = None
+    print(f'{len(windows)} windows of {window_size} samples with a {step}-sample hop at {rate} Hz, '
+          f'gravity filtered per {gravity}')
+    train_idx, val_idx = split_recording_windows(windows, rate, split, fold)
+    # Validation windows stay unsampled; only the training side is balanced
+    sampler = ClassSampler(windows.labels, balance, n_classes=len(classes))
+    prefetch = {'workers': workers, 'max_queue_size': PREFETCH_QUEUE}
+    train_batches = WindowBatches(windows, train_idx, len(classes), batch_size, sampler=sampler, alpha=alpha,
+                                  augmenter=augmenter, **prefetch)
+    val_batches = WindowBatches(windows, val_idx, len(classes), batch_size, shuffle=False, alpha=alpha, **prefetch)
+
+    # Tracked after the batches draw their first epoch, so a resume restores the sampler past that draw
+    ckpt = ckpt or TrainingCheckpoint()
+    ckpt.track('sampler', sampler)
+    ckpt.track('train_batches', train_batches)
+
+    print('Building model...')
+    norm_sample = windows.batch(np.sort(train_idx[:NORM_SAMPLE_SIZE]))
+    if alpha is not None:
+        norm_sample = remove_gravity_batch(norm_sample, alpha)
+    model = build_cnn_model((window_size, N_CHANNELS), len(classes), norm_sample, learning_rate, **(arch or {}))
+    callbacks, initial_epoch = training_callbacks(model, ckpt)
+
+    print('Training...')
+    model.fit(train_batches, epochs=epochs, initial_epoch=initial_epoch, validation_data=val_batches,
+              callbacks=callbacks, class_weight=sampler.class_weight(train_idx))
+    model.save('cnn_motion_model.keras')
+    print('Model saved as cnn_motion_model.keras')
+
+def train_augmented_store(args, augmenter, ckpt):
+    # Raw split windows stay in memory; each training batch is augmented, then gravity-filtered, on the fly
+    if not split_exists(args.split):
+        raise SystemExit(f'--augment with --source store needs a split (see splits.py); none named {args.split}')
+    print('Loading data...')
+    X_raw, y = load_store_dataset(args.split, args.fold, gravity=False)
+    rate = store_rate(load_store(split_meta(args.split)['source']))
+    alpha = gravity_alpha(rate)
+    with open('class_labels.json', 'w') as f:
+        json.dump(CLASSES, f)
+    save_config('window', alpha, rate)
+    # Same partition as train_test_split(X, y_cat, ...) in main()
+    train_idx, val_idx = train_test_split(np.arange(len(y)), test_size=0.2, random_state=42)
+    windows = ArrayWindows(X_raw, y)
+    sampler = ClassSampler(y, args.balance, n_classes=len(CLASSES))
+    prefetch = {'workers': args.prefetch_workers, 'max_queue_size': PREFETCH_QUEUE}
+    train_batches = WindowBatches(windows, train_idx, len(CLASSES), args.batch_size, sampler=sampler, alpha=alpha,
+                                  augmenter=augmenter, **prefetch)
+    val_batches = WindowBatches(windows, val_idx, len(CLASSES), args.batch_size, shuffle=False, alpha=alpha, **prefetch)
+    ckpt.track('sampler', sampler)
+    ckpt.track('train_batches', train_batches)
+
+    print('Building model...')
+    norm_sample = remove_gravity_batch(windows.batch(np.sort(train_idx[:NORM_SAMPLE_SIZE])), alpha)
+    model = build_cnn_model(norm_sample.shape[1:], len(CLASSES), norm_sample, args.learning_rate, **architecture(args))
+    callbacks, initial_epoch = training_callbacks(model, ckpt)
+
+    print(f'Training with augmentation {augmenter.config()}...')
+    model.fit(train_batches, epochs=args.epochs, initial_epoch=initial_epoch, validation_data=val_batches,
+              callbacks=callbacks, class_weight=sampler.class_weight(train_idx))
+    model.save('cnn_motion_model.keras')
+    print('Model saved as cnn_motion_model.keras')
+
+def train_tf_data(args, augmenter, ckpt):
+    # Streaming tf.data pipeline (see input_pipeline.py): windows are read from the mmapped store or the raw
+    # recordings batch by batch, so only index arrays are held in memory
+    from input_pipeline import PipelinePosition, input_bound_report, window_dataset
+    if args.source == 'raw':
+        window_size, step = scale_length(WINDOW_SIZE, args.rate), scale_length(args.step, args.rate)
+        windows = index_recordings(window_size, step, args.rate)
+        classes, rate = windows.classes, args.rate
+        train_idx, val_idx = split_recording_windows(windows, rate, args.split, args.fold)
+        cache_key = None  # windows are cut from the cached recordings on the fly; only store windows are cached
+    else:
+        if not split_exists(args.split):
+            raise SystemExit(f'--tf-data with --source store needs a split (see splits.py); none named {args.split}')
+        store, indices = split_indices('train', args.split, args.fold)
+        # Same partition as the other store training paths
+        train_pos, val_pos = train_test_split(np.arange(len(indices)), test_size=0.2, random_state=42)
+        train_idx, val_idx = indices[train_pos], indices[val_pos]
+        windows = ArrayWindows(store.windows, store.labels)
+        classes, rate, window_size = store.classes, store_rate(store), store.windows.shape[1]
+        source = split_meta(args.split)['source']
+        cache_key = file_digests({'windows': os.path.join(source, 'windows.npy'),
+                                  'labels': os.path.join(source, 'labels.npy')})
+    alpha = gravity_alpha(rate)
+    with open('class_labels.json', 'w') as f:
+        json.dump(classes, f)
+    save_config(args.gravity, alpha, rate)
+    if args.gravity == 'recording':
+        windows, alpha = windows.map_recordings(lambda r: remove_gravity_recording(r, alpha)), None
+    sampler = ckpt.track('sampler', ClassSampler(windows.labels, args.balance, n_classes=len(classes)))
+    position = ckpt.track('position', PipelinePosition(epoch=ckpt.initial_epoch))
+
+    def cache(part, idx):
+        # Preprocessed windows as a tensor_cache.py entry, keyed on the store's content and these settings
+        config = {'part': part, 'gravity': args.gravity, 'alpha': alpha, 'sample_rate': rate}
+        return {'source': cache_key, 'config': config} if cache_key and not args.no_cache else None
+    shape = (window_size, N_CHANNELS)
+    train_ds = window_dataset(windows, train_idx, len(classes), args.batch_size, shape, alpha, sampler=sampler,
+                              augmenter=augmenter, cache=cache('train', train_idx), position=position)
+    val_ds = window_dataset(windows, val_idx, len(classes), args.batch_size, shape, alpha, shuffle=False,
+                            cache=cache('val', val_idx))
+
+    print(f'Building model... ({len(train_idx)} training / {len(val_idx)} validation windows, '
+          f'balance {args.balance}{", augmented" if augmenter else ""})')
+    norm_sample = windows.batch(np.sort(train_idx[:NORM_SAMPLE_SIZE]))
+    if alpha is not None:
+        norm_sample = remove_gravity_batch(norm_sample, alpha)
+    model = build_cnn_model(shape, len(classes), norm_sample, args.learning_rate, **architecture(args))
+    callbacks, initial_epoch = training_callbacks(model, ckpt)
+
+    print('Training...')
+    model.fit(train_ds, epochs=args.epochs, initial_epoch=initial_epoch, validation_data=val_ds, callbacks=callbacks,
+              class_weight=sampler.class_weight(train_idx))
+    model.save('cnn_motion_model.keras')
+    print('Model saved as cnn_motion_model.keras')
+    input_bound_report(train_ds, model)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Train the motion CNN.')
+    parser.add_argument('--source', choices=['store', 'raw'], default='store',
+                        help='store: train side of a split of the window store (or data/train CSVs); '
+                             'raw: every overlapped window of data/all_data outside the split\'s test side')
+    parser.add_argument('--split', default=SPLIT,
+                        help='Split name (see splits.py): trained on with --source store, its test side left out '
+                             'with --source raw')
+    parser.add_argument('--fold', type=int, default=0, help='Fold of a k-fold split')
+    parser.add_argument('--step', type=int, default=STEP_SIZE, help='Hop between windows with --source raw')
+    parser.add_argument('--rate', type=int, default=SOURCE_RATE,
+                        help='Resample to this rate in Hz with --source raw (see downsample.py)')
+    parser.add_argument('--epochs', type=int, default=EPOCHS)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--learning-rate', type=float, default=LEARNING_RATE)
+    parser.add_argument('--filters', type=int, nargs='+', default=list(FILTERS), help='Filters per Conv1D block')
+    parser.add_argument('--kernel-size', type=int, default=KERNEL_SIZE)
+    parser.add_argument('--dense', type=int, default=DENSE_UNITS, help='Units of the hidden Dense layer')
+    parser.add_argument('--dropout', type=float, default=DROPOUT)
+    parser.add_argument('--balance', choices=STRATEGIES, default=BALANCE,
+                        help='Class balancing of the training windows, redrawn every epoch (see sampling.py)')
+    parser.add_argument('--augment', action='store_true',
+                        help='Rotate, scale, jitter, time-warp and shift training windows on the fly (see augment.py)')
+    parser.add_argument('--seed', type=int, default=42, help='Augmentation seed')
+    parser.add_argument('--prefetch-workers', type=int, default=PREFETCH_WORKERS,
+                        help='Threads preparing batches ahead of training')
+    parser.add_argument('--gravity', choices=GRAVITY_MODES, default=GRAVITY,
+                        help='window: restart the gravity filter at every window; recording: filter whole '
+                             'recordings before windowing, as live streams are (--source raw only)')
+    parser.add_argument('--tf-data', action='store_true',
+                        help='Stream batches through a prefetching tf.data pipeline (see input_pipeline.py)')
+    parser.add_argument('--no-cache', action='store_true', help='With --tf-data, do not cache preprocessed windows')
+    parser.add_argument('--checkpoint', default=CHECKPOINT_PATH, help='Full-state checkpoint file (see checkpoint.py)')
+    parser.add_argument('--checkpoint-every', type=int, default=EVERY_EPOCHS,
+                        help='Epochs between checkpoints (0: no checkpoints)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue the run saved in --checkpoint with its original settings')
+    args = parser.parse_args(argv)
+    run_settings = ('checkpoint', 'checkpoint_every', 'resume')
+    if args.resume:
+        config = saved_config(args.checkpoint)
+        if config is None:
+            print(f'No checkpoint at {args.checkpoint}; starting from scratch')
+        else:
+            vars(args).update({k: v for k, v in config.items() if k not in run_settings})
+    ckpt = TrainingCheckpoint(args.checkpoint, args.checkpoint_every, resume=args.resume,
+                              config={k: v for k, v in vars(args).items() if k not in run_settings})
+    if args.gravity == 'recording' and args.source != 'raw':
+        parser.error('--gravity recording needs --source raw (the window store only has cut windows)')
+    augmenter = Augmenter(args.seed) if args.augment else None
+    if args.tf_data:
+        train_tf_data(args, augmenter, ckpt)
+        return
+    if args.source == 'raw':
+        train_from_recordings(args.step, args.epochs, args.batch_size, args.learning_rate, args.balance,
+                              args.rate, augmenter, args.prefetch_workers, args.gravity, architecture(args), ckpt,
+                              args.split, args.fold)
+        return
+    if augmenter is not None:
+        train_augmented_store(args, augmenter, ckpt)
+        return
+
     print('Loading and processing data...')
-    X, y = load_dataset()
+    X, y = load_dataset(args.split, args.fold)
     y_cat = to_categorical(y, num_classes=len(CLASSES))
     X_train, X_val, y_train, y_val = train_test_split(X, y_cat, test_size=0.2, random_state=42)
+    # Validation windows stay unsampled; only the training side is balanced
+    train_labels = np.argmax(y_train, axis=1)
+    sampler = ClassSampler(train_labels, args.balance, n_classes=len(CLASSES))
+    print(f'Balancing: {args.balance}, {sampler.sample_size(np.arange(len(X_train)))} of {len(X_train)} '
+          f'training windows per epoch')
+
+    sampled = None
+    if args.balance in ('undersample', 'oversample'):
+        sampled = ckpt.track('train_batches', SampledArrays(X_train, y_train, sampler, args.batch_size))
+    ckpt.track('sampler', sampler)
 
     print('Building model...')
-    model = build_cnn_model((WINDOW_SIZE, N_CHANNELS), len(CLASSES), X_train)
-    es = EarlyStopping(monitor='val_loss', patience=8, restore_best_weights=True)
-    checkpoint = ModelCheckpoint('best_model.h5', monitor='val_accuracy', save_best_only=True)
+    model = build_cnn_model(X_train.shape[1:], len(CLASSES), X_train, args.learning_rate, **architecture(args))
+    callbacks, initial_epoch = training_callbacks(model, ckpt)
 
     print('Training...')
-    model.fit(X_train, y_train, epochs=EPOCHS, batch_size=BATCH_SIZE, validation_data=(X_val, y_val), callbacks=[es, checkpoint])
+    if sampled is not None:
+        model.fit(sampled, epochs=args.epochs, initial_epoch=initial_epoch, validation_data=(X_val, y_val),
+                  callbacks=callbacks)
+    else:
+        model.fit(X_train, y_train, epochs=args.epochs, initial_epoch=initial_epoch, batch_size=args.batch_size,
+                  validation_data=(X_val, y_val), callbacks=callbacks,
+                  class_weight=sampler.class_weight(np.arange(len(X_train))))
     model.save('cnn_motion_model.keras')
     print('Model saved as cnn_motion_model.keras')
 
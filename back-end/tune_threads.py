@@ -0,0 +1,137 @@
+import os
+import sys
+import json
+import math
+import argparse
+import subprocess
+
+from thread_config import THREAD_CONFIG_PATH, host_key, save_config, set_blas_threads, set_tf_threads
+
+# Usage: python tune_threads.py [--model cnn_motion_model.keras] [--batch-sizes 1,8,32,64]
+# Benchmarks the model across TensorFlow intra/inter-op and BLAS thread counts on this host
+# and stores the fastest configuration in thread_config.json, which app.py applies at startup.
+
+MODEL_PATH = 'cnn_motion_model.keras'
+BATCH_SIZES = [1, 8, 32, 64]
+WINDOW_SIZE = 100
+N_CHANNELS = 6
+RESULT_MARKER = 'TUNE_RESULT '
+
+def candidate_thread_counts(n_cpus):
+    counts, n = [], 1
+    while n < n_cpus:
+        counts.append(n)
+        n *= 2
+    counts.append(n_cpus)
+    return counts
+
+def candidate_configs(n_cpus):
+    configs = []
+    for intra in candidate_thread_counts(n_cpus):
+        for inter in sorted({1, 2} & set(range(1, n_cpus + 1))) or [1]:
+            configs.append({'intra_op': intra, 'inter_op': inter, 'blas_threads': intra})
+    return configs
+
+def run_worker(args):
+    # Runs in a fresh process: thread pools can only be sized before the runtimes start
+    set_blas_threads(args.blas)
+    import time
+    import numpy as np
+    set_tf_threads(args.intra, args.inter)
+    from tensorflow.keras.models import load_model
+
+    model = load_model(args.model)
+    # The model's own window shape: models trained at a lower --rate take fewer samples than WINDOW_SIZE
+    window_size, n_channels = model.input_shape[1] or WINDOW_SIZE, model.input_shape[2] or N_CHANNELS
+    rng = np.random.default_rng(0)
+    results = {}
+    for batch_size in args.batch_sizes:
+        x = rng.standard_normal((batch_size, window_size, n_channels)).astype(np.float32)
+        for _ in range(args.warmup):
+            model.predict(x, verbose=0)
+        timings = []
+        for _ in range(args.iterations):
+            t0 = time.perf_counter()
+            model.predict(x, verbose=0)
+            timings.append(time.perf_counter() - t0)
+        median = float(np.median(timings))
+        results[str(batch_size)] = {
+            'latency_ms': median * 1000,
+            'p95_ms': float(np.percentile(timings, 95)) * 1000,
+            'us_per_window': median * 1e6 / batch_size,
+        }
+    print(RESULT_MARKER + json.dumps(results), flush=True)
+
+def benchmark_config(config, args):
+    cmd = [sys.executable, os.path.abspath(__file__), '--worker',
+           '--intra', str(config['intra_op']), '--inter', str(config['inter_op']),
+           '--blas', str(config['blas_threads']), '--model', args.model,
+           '--batch-sizes', ','.join(str(b) for b in args.batch_sizes),
+           '--iterations', str(args.iterations), '--warmup', str(args.warmup)]
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    for line in proc.stdout.splitlines():
+        if line.startswith(RESULT_MARKER):
+            return json.loads(line[len(RESULT_MARKER):])
+    print(proc.stderr[-2000:])
+    raise RuntimeError(f"Benchmark worker failed for {config}")
+
+def score(results):
+    # Geometric mean of per-window time across batch sizes, so no single batch size dominates
+    values = [r['us_per_window'] for r in results.values()]
+    return math.exp(sum(math.log(v) for v in values) / len(values))
+
+def parse_batch_sizes(value):
+    return [int(b) for b in value.split(',') if b]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Tune CPU threading for model inference on this host.')
+    parser.add_argument('--model', default=MODEL_PATH)
+    parser.add_argument('--batch-sizes', type=parse_batch_sizes, default=BATCH_SIZES)
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--max-threads', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--config-path', default=THREAD_CONFIG_PATH)
+    parser.add_argument('--dry-run', action='store_true', help='Benchmark only, do not persist the result')
+    # Internal: a single benchmark run in a child process
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--intra', type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument('--inter', type=int, default=1, help=argparse.SUPPRESS)
+    parser.add_argument('--blas', type=int, default=1, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        run_worker(args)
+        return 0
+
+    configs = candidate_configs(args.max_threads)
+    print(f"Tuning {len(configs)} thread configurations on {host_key()} "
+          f"for batch sizes {args.batch_sizes}")
+    best, best_score, trials = None, None, []
+    for config in configs:
+        results = benchmark_config(config, args)
+        trial_score = score(results)
+        trials.append({**config, 'score_us_per_window': trial_score, 'results': results})
+        summary = ', '.join(f"b{b}={r['latency_ms']:.2f}ms" for b, r in results.items())
+        print(f"intra={config['intra_op']} inter={config['inter_op']} blas={config['blas_threads']}: "
+              f"{trial_score:.1f} us/window ({summary})")
+        if best_score is None or trial_score < best_score:
+            best, best_score = config, trial_score
+
+    # Also record the fastest configuration for each batch size on its own
+    per_batch = {}
+    for b in (str(b) for b in args.batch_sizes):
+        fastest = min(trials, key=lambda t: t['results'][b]['latency_ms'])
+        per_batch[b] = {k: fastest[k] for k in ('intra_op', 'inter_op', 'blas_threads')}
+        per_batch[b]['latency_ms'] = fastest['results'][b]['latency_ms']
+
+    config = {**best, 'score_us_per_window': best_score, 'model': args.model,
+              'batch_sizes': args.batch_sizes, 'best_per_batch_size': per_batch, 'trials': trials}
+    print(f"Best: intra={best['intra_op']} inter={best['inter_op']} blas={best['blas_threads']} "
+          f"({best_score:.1f} us/window)")
+    if not args.dry_run:
+        save_config(config, args.config_path)
+        print(f"Saved thread configuration to {args.config_path}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
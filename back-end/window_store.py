@@ -0,0 +1,288 @@
+import io
+import os
+import re
+import sys
+import json
+import uuid
+import shutil
+import numpy as np
+import pandas as pd
+from ingest import parse_recording
+
+# Usage: python window_store.py build <csv_window_dir> <store_dir>
+#        python window_store.py info <store_dir>
+# Example: python window_store.py build data/test data/window_store/test
+#
+# A window store is a directory holding one dataset as contiguous arrays:
+#   windows.npy     float32 (N, WINDOW_SIZE, N_CHANNELS), loaded with mmap
+#   labels.npy      int32 (N,) index into meta['classes']
+#   recordings.npy  int32 (N,) index into meta['recordings'] (source recording, e.g. 'Run/Run_1.csv')
+#   offsets.npy     int32 (N,) row offset of the window's first sample in the source recording
+#   meta.json       classes, recordings, window size, a build id and any stage config
+# It replaces the folders of one-CSV-per-window files written by the break_* scripts.
+# append_store() adds the windows of new recordings at the end in place; existing windows keep their index,
+# recording id and offset (and the store its build id), so splits made before the append stay valid.
+
+STORE_ROOT = 'data/window_store'
+WINDOW_SIZE = 100
+N_CHANNELS = 6
+ARRAYS = ['windows', 'labels', 'recordings', 'offsets']
+
+class WindowStore:
+    def __init__(self, windows, labels, recording_ids, offsets, meta):
+        self.windows = windows
+        self.labels = labels
+        self.recording_ids = recording_ids
+        self.offsets = offsets
+        self.meta = meta
+        self.classes = meta['classes']
+        self.recordings = meta['recordings']
+
+    def __len__(self):
+        return len(self.labels)
+
+    def recording_names(self):
+        # Provenance per window as strings, e.g. 'Run/Run_1.csv'
+        return np.array(self.recordings, dtype=object)[self.recording_ids] if len(self) else np.array([], dtype=object)
+
+    def subset(self, indices):
+        # Materializes the selected rows; used to write derived stores
+        indices = np.asarray(indices, dtype=np.int64)
+        return WindowStore(np.asarray(self.windows[indices]), self.labels[indices],
+                           self.recording_ids[indices], self.offsets[indices], dict(self.meta))
+
+def store_exists(path):
+    return os.path.exists(os.path.join(path, 'meta.json'))
+
+def store_path(name):
+    return os.path.join(STORE_ROOT, name)
+
+def write_store(path, windows, labels, recording_ids, offsets, classes, recordings, config=None):
+    windows = np.asarray(windows, dtype=np.float32)
+    if windows.ndim != 3:
+        windows = windows.reshape(-1, WINDOW_SIZE, N_CHANNELS)
+    meta = {
+        'classes': list(classes),
+        'recordings': list(recordings),
+        'count': int(len(windows)),
+        'window_size': int(windows.shape[1]),
+        'n_channels': N_CHANNELS,
+        'config': config or {},
+        'build': uuid.uuid4().hex[:12],
+    }
+    # Write into a sibling directory and swap it in, so readers never see a half-written store
+    tmp_path = path.rstrip('/') + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, 'windows.npy'), windows)
+    np.save(os.path.join(tmp_path, 'labels.npy'), np.asarray(labels, dtype=np.int32))
+    np.save(os.path.join(tmp_path, 'recordings.npy'), np.asarray(recording_ids, dtype=np.int32))
+    np.save(os.path.join(tmp_path, 'offsets.npy'), np.asarray(offsets, dtype=np.int32))
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    # The old store is renamed aside rather than deleted first, so the swap is two renames and the slow rmtree
+    # happens after the new store is in place (open mmaps of the old files stay valid until closed)
+    old_path = path.rstrip('/') + '.old'
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return path
+
+def _npy_header(path):
+    # (version, shape, dtype, data offset) of an .npy file
+    fmt = np.lib.format
+    with open(path, 'rb') as f:
+        version = fmt.read_magic(f)
+        read = fmt.read_array_header_1_0 if version == (1, 0) else fmt.read_array_header_2_0
+        shape, fortran_order, dtype = read(f)
+        if fortran_order:
+            raise ValueError(f'{path} is not C-ordered')
+        return version, shape, dtype, f.tell()
+
+def append_store(path, windows, labels, recording_ids, offsets, recordings):
+    # Appends the windows of new recordings (recording_ids index into `recordings`, the new names) in place.
+    # Rows go after the ones each header declares (cutting off any left by an interrupted append), then the
+    # headers get the new row count; numpy pads .npy headers so the row count can grow without moving the data.
+    # meta.json is replaced last and load_store() only reads meta['count'] rows, so readers always see either
+    # the old or the new store.
+    with open(os.path.join(path, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    arrays = {
+        'windows': np.ascontiguousarray(windows, dtype=np.float32),
+        'labels': np.asarray(labels, dtype=np.int32),
+        'recordings': np.asarray(recording_ids, dtype=np.int32) + len(meta['recordings']),
+        'offsets': np.asarray(offsets, dtype=np.int32),
+    }
+    plans = {}
+    for name, arr in arrays.items():
+        file_path = os.path.join(path, f'{name}.npy')
+        version, shape, dtype, data_start = _npy_header(file_path)
+        if dtype != arr.dtype or tuple(shape[1:]) != arr.shape[1:] or shape[0] < meta['count']:
+            raise ValueError(f'Cannot append {arr.shape[1:]} {arr.dtype} rows to {file_path} ({shape} {dtype})')
+        header = io.BytesIO()
+        write = np.lib.format.write_array_header_1_0 if version == (1, 0) else np.lib.format.write_array_header_2_0
+        write(header, {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False,
+                       'shape': (meta['count'] + len(arr),) + tuple(shape[1:])})
+        if header.tell() != data_start:
+            raise ValueError(f'The header of {file_path} has no room for {meta["count"] + len(arr)} rows')
+        row_bytes = int(np.prod(shape[1:], dtype=np.int64)) * dtype.itemsize
+        plans[file_path] = (data_start + meta['count'] * row_bytes, arr, header.getvalue())
+    for file_path, (end, arr, _) in plans.items():
+        with open(file_path, 'r+b') as f:
+            f.truncate(end)
+            f.seek(end)
+            f.write(arr.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+    for file_path, (_, _, header) in plans.items():
+        with open(file_path, 'r+b') as f:
+            f.write(header)
+    meta['count'] += len(arrays['labels'])
+    meta['recordings'] = list(meta['recordings']) + list(recordings)
+    tmp_meta = os.path.join(path, 'meta.json.tmp')
+    with open(tmp_meta, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_meta, os.path.join(path, 'meta.json'))
+    return path
+
+def save_store(path, store, config=None):
+    return write_store(path, store.windows, store.labels, store.recording_ids, store.offsets,
+                       store.classes, store.recordings, config if config is not None else store.meta.get('config'))
+
+def load_store(path, mmap=True):
+    mode = 'r' if mmap else None
+    with open(os.path.join(path, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    # meta['count'] rows: an append in progress may already have grown the arrays (see append_store)
+    arrays = [np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mode)[:meta['count']] for name in ARRAYS]
+    return WindowStore(*arrays, meta)
+
+class StoreBuilder:
+    # Collects windows per recording and assigns class / recording ids in a stable order
+    def __init__(self, classes):
+        self.classes = list(classes)
+        self.recordings = []
+        self.recording_index = {}
+        self.chunks, self.labels, self.recording_ids, self.offsets = [], [], [], []
+
+    def add(self, class_name, recording, windows, offsets):
+        if len(windows) == 0:
+            return
+        if recording not in self.recording_index:
+            self.recording_index[recording] = len(self.recordings)
+            self.recordings.append(recording)
+        rec_id = self.recording_index[recording]
+        self.chunks.append(np.asarray(windows, dtype=np.float32).reshape(len(windows), -1, N_CHANNELS))
+        self.labels.append(np.full(len(windows), self.classes.index(class_name), dtype=np.int32))
+        self.recording_ids.append(np.full(len(windows), rec_id, dtype=np.int32))
+        self.offsets.append(np.asarray(offsets, dtype=np.int32))
+
+    def write(self, path, config=None):
+        if self.chunks:
+            windows = np.concatenate(self.chunks)
+            arrays = [np.concatenate(a) for a in (self.labels, self.recording_ids, self.offsets)]
+        else:
+            windows = np.zeros((0, WINDOW_SIZE, N_CHANNELS), dtype=np.float32)
+            arrays = [np.zeros(0, dtype=np.int32)] * 3
+        return write_store(path, windows, *arrays, self.classes, self.recordings, config)
+
+# Window CSV names look like Run_1_sec9_ovl1.csv: recording Run_1, 9th second, 1st overlap window
+WINDOW_NAME_RE = re.compile(r'^(?P<rec>.+?)_sec(?P<sec>\d+)(?:_ovl(?P<ovl>\d+))?\.csv$')
+
+def parse_window_name(fname, samples_per_second=WINDOW_SIZE, step=50):
+    m = WINDOW_NAME_RE.match(fname)
+    if not m:
+        return os.path.splitext(fname)[0] + '.csv', 0
+    offset = (int(m.group('sec')) - 1) * samples_per_second
+    if m.group('ovl'):
+        offset += (int(m.group('ovl')) - 1) * step
+    return m.group('rec') + '.csv', offset
+
+def build_from_csv_dir(csv_root, path):
+    # Migrates an existing folder of per-window CSV files (data/train, data/test, ...) into a store
+    classes = sorted(d for d in os.listdir(csv_root) if os.path.isdir(os.path.join(csv_root, d)))
+    builder = StoreBuilder(classes)
+    skipped = 0
+    for class_name in classes:
+        class_dir = os.path.join(csv_root, class_name)
+        for fname in sorted(os.listdir(class_dir)):
+            if not fname.endswith('.csv'):
+                continue
+            samples, _, _ = parse_recording(os.path.join(class_dir, fname))
+            if samples.shape != (WINDOW_SIZE, N_CHANNELS):
+                skipped += 1
+                continue
+            rec, offset = parse_window_name(fname)
+            builder.add(class_name, f'{class_name}/{rec}', samples[None], [offset])
+    builder.write(path, {'source': csv_root})
+    print(f"Stored {sum(len(c) for c in builder.chunks)} windows from {csv_root} in {path} "
+          f"({skipped} malformed windows skipped)")
+    return path
+
+def _write_window_csvs(job):
+    path, targets = job
+    store = load_store(path)
+    for i, out_path in targets:
+        pd.DataFrame(store.windows[i]).to_csv(out_path, index=False, header=False)
+    return len(targets)
+
+def export_csv(path, out_root, name_for, workers=None, recordings=None):
+    # Writes one CSV per window for tools that still expect the old folder layout.
+    # name_for(recording_stem, offset) returns the file name inside the class folder.
+    # Only windows of the given recordings are written when recordings is set.
+    # Returns {recording name: [written paths]}.
+    from parallel import parallel_map
+    store = load_store(path)
+    wanted = None if recordings is None else set(recordings)
+    jobs = {}
+    for i in range(len(store)):
+        class_name = store.classes[store.labels[i]]
+        rec_id = int(store.recording_ids[i])
+        if wanted is not None and store.recordings[rec_id] not in wanted:
+            continue
+        stem = os.path.splitext(os.path.basename(store.recordings[rec_id]))[0]
+        class_dir = os.path.join(out_root, class_name)
+        os.makedirs(class_dir, exist_ok=True)
+        jobs.setdefault(rec_id, []).append((i, os.path.join(class_dir, name_for(stem, int(store.offsets[i])))))
+    # One job per source recording, written in parallel
+    parallel_map(_write_window_csvs, [(path, targets) for _, targets in sorted(jobs.items())],
+                 workers, desc='window CSV files by recording')
+    return {store.recordings[rec_id]: [p for _, p in targets] for rec_id, targets in jobs.items()}
+
+def update_csv_export(manifest, stage, config, inputs, path, out_root, name_for, workers=None, force=False):
+    # Rewrites CSV files only for new or changed recordings and deletes those of removed recordings
+    from manifest import remove_outputs
+    changed, removed = manifest.plan(stage, config, inputs)
+    if force:
+        changed = sorted(inputs)
+    n_removed = remove_outputs(manifest.outputs(stage, changed + removed))
+    written = export_csv(path, out_root, name_for, workers, recordings=changed) if changed else {}
+    outputs = dict((manifest.stage(stage) or {}).get('outputs', {}))
+    for name in changed:
+        outputs[name] = written.get(name, [])
+    manifest.record(stage, config, inputs, outputs)
+    manifest.save()
+    print(f"CSV export: {len(changed)} recordings written, {n_removed} stale files removed")
+
+def print_info(path):
+    store = load_store(path)
+    counts = np.bincount(store.labels, minlength=len(store.classes)) if len(store) else [0] * len(store.classes)
+    print(f"{path}: {len(store)} windows of {store.windows.shape[1:]} from {len(store.recordings)} recordings")
+    for cls, n in zip(store.classes, counts):
+        print(f"  {cls}: {n}")
+    if store.meta.get('config'):
+        print(f"  config: {store.meta['config']}")
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] not in ('build', 'info'):
+        print('Usage: python window_store.py build <csv_window_dir> <store_dir> | info <store_dir>')
+        sys.exit(1)
+    if sys.argv[1] == 'build':
+        if len(sys.argv) < 4:
+            print('Usage: python window_store.py build <csv_window_dir> <store_dir>')
+            sys.exit(1)
+        build_from_csv_dir(sys.argv[2], sys.argv[3])
+    else:
+        print_info(sys.argv[2])
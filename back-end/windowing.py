@@ -0,0 +1,254 @@
+import os
+import json
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from ingest import READER_VERSION, format_bad_rows, parse_recording
+from manifest import Manifest, remove_outputs
+from window_store import append_store, load_store, store_exists, write_store
+
+# Sliding windows over continuous recordings as strided, zero-copy views.
+# Rows are only copied when a batch is requested, so every overlapped window of
+# data/all_data can be used for training without writing per-window files.
+
+RAW_ROOT = 'data/all_data'
+# Parsed recordings, one float32 .npy per source CSV, kept in sync with RAW_ROOT by the manifest
+RECORDING_CACHE = 'data/window_store/recordings'
+WINDOW_SIZE = 100
+STEP_SIZE = 50
+N_CHANNELS = 6
+SAMPLE_RATE = 100  # Hz, as recorded by the app
+# Recordings excluded from every stage, e.g. {"recordings": {"Run/Run_3.csv": "truncated"}} (see quality.py)
+QUARANTINE_PATH = 'data/quarantine.json'
+# Part of the ingest stage config: change it whenever read_recording() changes so the cache is rebuilt
+INGEST_CONFIG = {'reader': READER_VERSION, 'columns': N_CHANNELS, 'dtype': 'float32'}
+
+def read_recording(path):
+    # Header row detected and skipped; unusable rows are dropped but reported (see ingest.py)
+    samples, bad_rows, _ = parse_recording(path)
+    if bad_rows:
+        print(format_bad_rows(path, bad_rows), flush=True)
+    return samples
+
+def load_quarantine(path=QUARANTINE_PATH, with_reasons=False):
+    # {'Class/file.csv': reason}, or just the set of names
+    if not os.path.exists(path):
+        return {} if with_reasons else set()
+    with open(path, 'r') as f:
+        recordings = json.load(f).get('recordings', {})
+    if isinstance(recordings, list):
+        recordings = {name: '' for name in recordings}
+    return recordings if with_reasons else set(recordings)
+
+def list_recordings(root=RAW_ROOT, classes=None, skip_quarantined=True):
+    # (path, class_name) pairs in a stable order; classes default to the sorted class folders
+    if classes is None:
+        classes = sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
+    quarantined = load_quarantine() if skip_quarantined else set()
+    recordings = []
+    for class_name in classes:
+        class_dir = os.path.join(root, class_name)
+        for fname in sorted(os.listdir(class_dir)):
+            if fname.endswith('.csv') and f'{class_name}/{fname}' not in quarantined:
+                recordings.append((os.path.join(class_dir, fname), class_name))
+    return recordings
+
+def recording_inputs(root=RAW_ROOT, classes=None):
+    # {'Run/Run_1.csv': 'data/all_data/Run/Run_1.csv', ...} in list_recordings() order
+    return {f'{class_name}/{os.path.basename(path)}': path for path, class_name in list_recordings(root, classes)}
+
+def cache_path(name):
+    return os.path.join(RECORDING_CACHE, os.path.splitext(name)[0] + '.npy')
+
+def _parse_to_cache(job):
+    path, out_path = job
+    samples = read_recording(path)
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    np.save(out_path, samples)
+    return len(samples)
+
+def ingest_recordings(root=RAW_ROOT, classes=None, workers=None, manifest=None):
+    # Parses only new or changed recordings into RECORDING_CACHE and drops cache files of removed ones.
+    # Returns ({name: mmapped samples}, {name: content hash}).
+    owns_manifest = manifest is None
+    manifest = manifest or Manifest()
+    named = recording_inputs(root, classes)
+    inputs = manifest.digests(named)
+    changed, removed = manifest.plan('ingest', INGEST_CONFIG, inputs)
+    changed = sorted(set(changed) | {n for n in inputs if not os.path.exists(cache_path(n))})
+    jobs = [(named[n], cache_path(n)) for n in changed]
+    if jobs and workers:
+        from parallel import parallel_map
+        parallel_map(_parse_to_cache, jobs, workers, desc='recordings parsed')
+    else:
+        for job in jobs:
+            _parse_to_cache(job)
+    remove_outputs(cache_path(n) for n in removed)
+    manifest.record('ingest', INGEST_CONFIG, inputs)
+    if owns_manifest:
+        manifest.save()
+    quarantined = len(load_quarantine())
+    print(f"Ingest: {len(changed)} new or changed, {len(removed)} removed, "
+          f"{len(inputs) - len(changed)} unchanged recordings"
+          f"{f', {quarantined} quarantined' if quarantined else ''}")
+    return {n: np.load(cache_path(n), mmap_mode='r') for n in named}, inputs
+
+def sliding_windows(samples, window_size=WINDOW_SIZE, step=STEP_SIZE):
+    # (n_windows, window_size, channels) view into samples; no data is copied
+    samples = np.asarray(samples)
+    if len(samples) < window_size:
+        return np.empty((0, window_size, samples.shape[1]), dtype=samples.dtype)
+    view = sliding_window_view(samples, window_size, axis=0)[::step]
+    return view.transpose(0, 2, 1)
+
+def window_offsets(n_samples, window_size=WINDOW_SIZE, step=STEP_SIZE):
+    if n_samples < window_size:
+        return np.zeros(0, dtype=np.int32)
+    return np.arange(0, n_samples - window_size + 1, step, dtype=np.int32)
+
+def _resampled(recordings, rate):
+    if rate is None:
+        return recordings
+    from downsample import resample
+    return [resample(r, rate) for r in recordings]
+
+class RecordingWindows:
+    # Indexable, batchable sequence of every valid window across a set of recordings
+    def __init__(self, recordings, labels, names=None, classes=None, window_size=WINDOW_SIZE, step=STEP_SIZE):
+        self.window_size = window_size
+        self.step = step
+        self.classes = list(classes) if classes is not None else None
+        self.names = list(names) if names is not None else [str(i) for i in range(len(recordings))]
+        self.recordings = [np.ascontiguousarray(r, dtype=np.float32) for r in recordings]
+        self.recording_labels = np.asarray(labels, dtype=np.int32)
+        self.views = [sliding_windows(r, window_size, step) for r in self.recordings]
+        counts = np.array([len(v) for v in self.views], dtype=np.int64)
+        self.starts = np.concatenate([[0], np.cumsum(counts)])
+        self.labels = np.repeat(np.asarray(labels, dtype=np.int32), counts)
+        self.recording_ids = np.repeat(np.arange(len(self.recordings), dtype=np.int32), counts)
+        self.offsets = np.concatenate([window_offsets(len(r), window_size, step) for r in self.recordings]
+                                      or [np.zeros(0, dtype=np.int32)])
+
+    @classmethod
+    def from_directory(cls, root=RAW_ROOT, window_size=WINDOW_SIZE, step=STEP_SIZE, classes=None, workers=None,
+                       manifest=None, rate=None):
+        # rate: resample the 100 Hz recordings first (see downsample.py); window_size and step are
+        # then counted in samples at that rate
+        if classes is None:
+            classes = sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
+        if manifest is not None:
+            # Incremental: unchanged recordings come straight from the parsed cache
+            cached, _ = ingest_recordings(root, classes, workers, manifest)
+            names = list(cached)
+            labels = [classes.index(name.split('/', 1)[0]) for name in names]
+            return cls(_resampled([cached[n] for n in names], rate), labels, names, classes, window_size, step)
+        listing = list_recordings(root, classes)
+        paths = [path for path, _ in listing]
+        if workers:
+            # Parsing dominates preparation time, so recordings are read across a process pool
+            from parallel import parallel_map
+            recordings = parallel_map(read_recording, paths, workers, desc='recordings read')
+        else:
+            recordings = [read_recording(path) for path in paths]
+        labels = [classes.index(class_name) for _, class_name in listing]
+        names = [f'{class_name}/{os.path.basename(path)}' for path, class_name in listing]
+        return cls(_resampled(recordings, rate), labels, names, classes, window_size, step)
+
+    def map_recordings(self, fn):
+        # Same windows over transformed recordings, e.g. preprocessing.remove_gravity_recording
+        return type(self)([fn(r) for r in self.recordings], self.recording_labels, self.names, self.classes,
+                          self.window_size, self.step)
+
+    def __len__(self):
+        return int(self.starts[-1])
+
+    def locate(self, indices):
+        # Global window index -> (recording id, window number within that recording)
+        indices = np.asarray(indices, dtype=np.int64)
+        rec = np.searchsorted(self.starts, indices, side='right') - 1
+        return rec, indices - self.starts[rec]
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            if index < 0:
+                index += len(self)
+            if not 0 <= index < len(self):
+                raise IndexError(f'window index {index} out of range for {len(self)} windows')
+            rec, local = self.locate(index)
+            return self.views[int(rec)][int(local)]
+        return self.batch(np.arange(len(self))[index])
+
+    def batch(self, indices):
+        # Copies only the requested windows into one contiguous float32 array
+        indices = np.asarray(indices, dtype=np.int64)
+        rec, local = self.locate(indices)
+        out = np.empty((len(indices), self.window_size, N_CHANNELS), dtype=np.float32)
+        for r in np.unique(rec):
+            mask = rec == r
+            out[mask] = self.views[r][local[mask]]
+        return out
+
+    def batch_at(self, indices, shifts):
+        # Like batch(), but each window starts `shifts` samples later (or earlier), kept inside its recording
+        indices = np.asarray(indices, dtype=np.int64)
+        rec = self.recording_ids[indices]
+        out = np.empty((len(indices), self.window_size, N_CHANNELS), dtype=np.float32)
+        for r in np.unique(rec):
+            mask = rec == r
+            samples = self.recordings[r]
+            starts = np.clip(self.offsets[indices[mask]] + shifts[mask], 0, len(samples) - self.window_size)
+            out[mask] = sliding_windows(samples, self.window_size, 1)[starts]
+        return out
+
+    def iter_batches(self, batch_size, indices=None, shuffle=False, seed=None):
+        indices = np.arange(len(self)) if indices is None else np.asarray(indices)
+        if shuffle:
+            indices = np.random.default_rng(seed).permutation(indices)
+        for start in range(0, len(indices), batch_size):
+            batch_idx = indices[start:start + batch_size]
+            yield self.batch(batch_idx), self.labels[batch_idx]
+
+    def recording_names(self):
+        return np.array(self.names, dtype=object)[self.recording_ids]
+
+    def to_store(self, path, config=None):
+        # Materializes every window once, into a single contiguous window store
+        return write_store(path, self.batch(np.arange(len(self))), self.labels, self.recording_ids,
+                           self.offsets, self.classes, self.names, config)
+
+def update_window_store(stage, out_path, window_size, step, root=RAW_ROOT, workers=None, force=False, manifest=None,
+                        rate=SAMPLE_RATE):
+    # Brings a window store up to date with its input recordings, at a cost proportional to what changed:
+    # only new or changed recordings are parsed (see ingest_recordings), and the windows of new recordings are
+    # appended to the store in place (window_store.append_store), so existing windows keep their indices and
+    # splits of the store stay valid. A changed config or class list, a changed or removed recording, or
+    # force rebuilds the whole store (and the splits made over it have to be recreated).
+    # Returns (store, config, inputs)
+    manifest = manifest or Manifest()
+    config = {'root': root, 'window_size': window_size, 'step_size': step, 'sample_rate': rate}
+    classes = sorted(d for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
+    recordings, inputs = ingest_recordings(root, classes, workers, manifest)
+    changed, removed = manifest.plan(stage, config, inputs)
+    store = load_store(out_path) if store_exists(out_path) else None
+
+    def windows_of(names):
+        labels = [classes.index(name.split('/', 1)[0]) for name in names]
+        return RecordingWindows(_resampled([recordings[n] for n in names], None if rate == SAMPLE_RATE else rate),
+                                labels, names, classes, window_size, step)
+    if not force and store is not None and not changed and not removed:
+        print(f"{out_path} is up to date ({len(store)} windows)")
+    elif (not force and store is not None and not removed and store.classes == classes
+          and store.meta.get('config') == {'stage': stage, **config}
+          and not set(changed) & set(store.recordings) and set(store.recordings) | set(changed) == set(inputs)):
+        new = [name for name in inputs if name in set(changed)]
+        windows = windows_of(new)
+        append_store(out_path, windows.batch(np.arange(len(windows))), windows.labels, windows.recording_ids,
+                     windows.offsets, windows.names)
+        print(f"{out_path}: appended {len(windows)} windows of {len(new)} new recordings to {len(store)}")
+    else:
+        windows = windows_of(list(inputs))
+        windows.to_store(out_path, {'stage': stage, **config})
+        print(f"{out_path} rebuilt ({len(windows)} windows: {len(changed)} new or changed, {len(removed)} removed "
+              f"recordings)")
+    manifest.record(stage, config, inputs)
+    manifest.save()
+    return load_store(out_path), config, inputs